@@ -0,0 +1,93 @@
+import time
+
+import numpy as np
+
+from dataset import *
+from main import *
+from model import RuleBasedTripletGenerator
+from utils.text_utils import tokenize
+from utils.utils import ExperimentLogger
+
+"""
+Benchmarks the rule based OpenIE triplet generator ("openie") on the corpus passages that have LLM triplets in
+data/{path.data.corpus_triplet}_{dataset}: throughput, and agreement with the LLM triplets.
+
+A rule based triplet and an LLM triplet of the same passage agree if the Jaccard similarity of their tokens is at least
+MATCH_THRESHOLD. Precision is the share of rule based triplets agreeing with an LLM triplet, recall the share of LLM
+triplets agreeing with a rule based triplet.
+
+    python benchmark_openie.py -e openie_benchmark
+"""
+
+MATCH_THRESHOLD = 0.5
+NUM_THROUGHPUT_ROUNDS = 5
+
+
+def triplet_tokens(triplet: list) -> set:
+    return set(tokenize(" ".join(str(element) for element in triplet)))
+
+
+def jaccard(tokens_a: set, tokens_b: set) -> float:
+    if not tokens_a or not tokens_b:
+        return 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+def agreement(predicted: list, reference: list) -> tuple:
+    """
+    Returns the number of predicted triplets matching a reference triplet, and of reference triplets matching a predicted one.
+    """
+    predicted_tokens = [triplet_tokens(triplet) for triplet in predicted]
+    reference_tokens = [triplet_tokens(triplet) for triplet in reference]
+    if not predicted_tokens or not reference_tokens:
+        return 0, 0
+    similarities = np.array(
+        [[jaccard(p, r) for r in reference_tokens] for p in predicted_tokens]
+    )
+    matched = similarities >= MATCH_THRESHOLD
+    return int(matched.any(axis=1).sum()), int(matched.any(axis=0).sum())
+
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    dataset = BioASQDataset(config, logger)
+    passages = {
+        passage_id: dataset.corpus_dataset[passage_id]
+        for passage_id in dataset.corpus_triplets
+        if passage_id in dataset.corpus_dataset
+    }
+    generator = RuleBasedTripletGenerator(config, logger)
+
+    start = time.perf_counter()
+    for _ in range(NUM_THROUGHPUT_ROUNDS):
+        predictions = {
+            passage_id: generator.forward(passage)
+            for passage_id, passage in passages.items()
+        }
+    elapsed = (time.perf_counter() - start) / NUM_THROUGHPUT_ROUNDS
+    num_predicted = sum(len(triplets) for triplets in predictions.values())
+    logger.info(
+        f"==> Throughput: {len(passages) / elapsed:.0f} passages/sec, "
+        f"{num_predicted / elapsed:.0f} triplets/sec ({len(passages)} passages)"
+    )
+
+    num_reference = sum(len(dataset.corpus_triplets[pid]) for pid in passages)
+    predicted_matches, reference_matches = 0, 0
+    for passage_id, predicted in predictions.items():
+        p_matches, r_matches = agreement(predicted, dataset.corpus_triplets[passage_id])
+        predicted_matches += p_matches
+        reference_matches += r_matches
+
+    precision = predicted_matches / max(num_predicted, 1)
+    recall = reference_matches / max(num_reference, 1)
+    f1 = 2 * precision * recall / max(precision + recall, 1e-9)
+    logger.info(
+        f"==> Agreement with the LLM triplets (token jaccard >= {MATCH_THRESHOLD}): "
+        f"precision {precision:.3f}, recall {recall:.3f}, f1 {f1:.3f} "
+        f"({num_predicted / max(len(passages), 1):.1f} vs "
+        f"{num_reference / max(len(passages), 1):.1f} triplets per passage)"
+    )
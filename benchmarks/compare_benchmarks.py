@@ -0,0 +1,78 @@
+import argparse
+import json
+
+"""
+Compares two benchmark reports of benchmarks/run_benchmarks.py (e.g. of two commits): for every scenario of both, the
+relative change of the throughput, startup time, peak RSS and of the p50/p95 latency of every timing label, as a
+markdown table. Changes above --threshold (10% by default) are flagged.
+
+    python -m benchmarks.compare_benchmarks results/benchmark_before/benchmark.json results/benchmark_after/benchmark.json
+"""
+
+SCENARIO_METRICS = (
+    "samples_per_second",
+    "startup_seconds",
+    "peak_rss_mb",
+    "precision",
+)
+TIMING_METRICS = ("p50_seconds", "p95_seconds")
+
+
+def relative_change(before, after):
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before
+
+
+def comparison_rows(before: dict, after: dict) -> list:
+    rows = []
+    for scenario in sorted(set(before["scenarios"]) & set(after["scenarios"])):
+        old, new = before["scenarios"][scenario], after["scenarios"][scenario]
+        for metric in SCENARIO_METRICS:
+            rows.append((scenario, metric, old.get(metric), new.get(metric)))
+        for label in sorted(set(old["timings"]) & set(new["timings"])):
+            for metric in TIMING_METRICS:
+                rows.append(
+                    (
+                        scenario,
+                        f"{label}.{metric}",
+                        old["timings"][label][metric],
+                        new["timings"][label][metric],
+                    )
+                )
+    return rows
+
+
+def comparison_table(rows: list, threshold: float) -> str:
+    lines = [
+        "| scenario | metric | before | after | change |",
+        "|---|---|---|---|---|",
+    ]
+    for scenario, metric, old, new in rows:
+        change = relative_change(old, new)
+        change_text = "" if change is None else f"{change:+.1%}"
+        if change is not None and abs(change) > threshold:
+            change_text += " !"
+        lines.append(
+            f"| {scenario} | {metric} | {old:.4g} | {new:.4g} | {change_text} |"
+            if old is not None and new is not None
+            else f"| {scenario} | {metric} | {old} | {new} | |"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compare benchmark reports")
+    parser.add_argument("before", type=str)
+    parser.add_argument("after", type=str)
+    parser.add_argument("--threshold", default=0.1, type=float)
+    args = parser.parse_args()
+    with open(args.before, "r") as f:
+        before = json.load(f)
+    with open(args.after, "r") as f:
+        after = json.load(f)
+    print(f"Before: {before['commit']}, after: {after['commit']}")
+    only = set(before["scenarios"]) ^ set(after["scenarios"])
+    if only:
+        print(f"Scenarios in only one of the reports: {sorted(only)}")
+    print(comparison_table(comparison_rows(before, after), args.threshold))
@@ -0,0 +1,118 @@
+import re
+import threading
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+PROMPT_BUILD_PATTERN = re.compile(r"^get_\w*prompt$")
+PARSE_PATTERN = re.compile(r"^parse_\w+$")
+PERCENTILES = (50, 90, 95, 99)
+COMPONENTS = (
+    "answer_generator",
+    "triplet_generator",
+    "fact_checker",
+    "reprompter",
+    "hallucination_data_generator",
+)
+
+
+class StageTimings:
+    """
+    Thread safe collection of the durations of the timed calls, by label.
+
+    Nested calls with the same label (e.g. a parse method calling another parse method) are only timed once, by the
+    outermost call, so that the totals are not counted twice.
+
+    Methods:
+        timed(labels: List[str], fn: Callable) -> Callable:
+            Wraps fn to record its duration under each of the labels.
+        summary() -> Dict[str, dict]:
+            The count, total, mean, max and percentiles (in seconds) of the durations of each label.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def record(self, labels: List[str], seconds: float) -> None:
+        with self._lock:
+            for label in labels:
+                self.durations.setdefault(label, []).append(seconds)
+
+    def timed(self, labels: List[str], fn: Callable) -> Callable:
+        key = labels[0]
+
+        def wrapper(*args, **kwargs):
+            active = getattr(self._local, "active", None)
+            if active is None:
+                active = self._local.active = set()
+            if key in active:
+                return fn(*args, **kwargs)
+            active.add(key)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(labels, time.perf_counter() - start)
+                active.discard(key)
+
+        return wrapper
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            durations = {
+                label: list(values) for label, values in self.durations.items()
+            }
+        summary = {}
+        for label, values in sorted(durations.items()):
+            values = np.array(values)
+            summary[label] = {
+                "count": int(len(values)),
+                "total_seconds": float(values.sum()),
+                "mean_seconds": float(values.mean()),
+                "max_seconds": float(values.max()),
+                **{
+                    f"p{percentile}_seconds": float(np.percentile(values, percentile))
+                    for percentile in PERCENTILES
+                },
+            }
+        return summary
+
+
+def instrument_system(system, timings: StageTimings) -> None:
+    """
+    Time the calls of an LLMFactCheckingSystem by wrapping (on the instances only) its methods:
+        - sample: the forward pass of a sample.
+        - stage.{node}: the nodes of the forward dataflow (answer generation, triplet generation, reference selection
+          and fact checking).
+        - prompt_build, prompt_build.{component}: the get_*prompt methods of the components.
+        - parse, parse.{component}: the parse_* methods of the components.
+        - llm_call, llm_call.{component}: the LLM calls of the components (replayed ones included).
+
+    Args:
+        system (LLMFactCheckingSystem): The system, after build_dataflows.
+        timings (StageTimings): Where the durations are recorded.
+    """
+    system.forward = timings.timed(["sample"], system.forward)
+    for node in system.dataflow.nodes.values():
+        node.fn = timings.timed([f"stage.{node.name}"], node.fn)
+    for role in COMPONENTS:
+        component = getattr(system, role)
+        for name in dir(type(component)):
+            if PROMPT_BUILD_PATTERN.match(name):
+                category = "prompt_build"
+            elif PARSE_PATTERN.match(name):
+                category = "parse"
+            elif name == "invoke_model_response":
+                category = "llm_call"
+            else:
+                continue
+            method = getattr(component, name)
+            if callable(method):
+                setattr(
+                    component,
+                    name,
+                    timings.timed([category, f"{category}.{role}"], method),
+                )
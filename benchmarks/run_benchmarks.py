@@ -0,0 +1,156 @@
+import time
+
+STARTED = time.perf_counter()
+
+import json
+import os
+import resource
+import subprocess
+import sys
+
+from easydict import EasyDict as edict
+
+from benchmarks.instrumentation import StageTimings, instrument_system
+from benchmarks.scenarios import apply_scenario, benchmark_scenarios, scenario_by_name
+from experiment_manager import ExperimentManager
+from llm_simulator import LLMSimulator
+from main import *
+from utils.utils import ExperimentLogger, get_current_commit_hash_and_message
+
+"""
+End-to-end benchmark of LLMFactCheckingSystem on the first experiment_setup.benchmark.num_samples questions of the
+dataset (--num_test_samples overrides it), for every scenario of benchmarks/scenarios.py (each fact checker, with and
+without split_reference_triplets).
+
+The LLM responses are simulated by an in-process LLM simulator (config.model.llm.simulator, with the fixed latency of
+experiment_setup.benchmark.simulator_latency so that runs are comparable), or come from --llm_base_url, or are replayed
+from cassettes (--cassette_mode replay, one cassette per scenario: {cassette path}_{scenario}.jsonl, recorded with
+--cassette_mode record).
+
+Every scenario runs in its own process, so that its startup time and peak RSS are its own. The report has, per
+scenario: the startup time (imports, dataset loading and system construction), the samples/sec, the peak RSS, the
+precision and LLM tokens (to catch behaviour changes), and the latency percentiles of the samples, of the dataflow
+stages, of the LLM calls and of the prompt building and output parsing of the components (see
+benchmarks/instrumentation.py). It is saved as JSON with sorted keys in results/{experiment_name}/benchmark.json, to be
+compared between commits with benchmarks/compare_benchmarks.py.
+
+    python -m benchmarks.run_benchmarks -e benchmark
+    python -m benchmarks.run_benchmarks -e benchmark --cassette_mode replay --cassette_path cassettes/benchmark.jsonl
+"""
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def scenario_cassette_path(path: str, scenario_name: str) -> str:
+    return f"{os.path.splitext(path)[0]}_{scenario_name}.jsonl"
+
+
+def run_scenario(config: edict, logger) -> dict:
+    """
+    Runs the benchmark scenario config.benchmark_scenario in this process.
+    """
+    imported = time.perf_counter()
+    manager = ExperimentManager(config, logger)
+    timings = StageTimings()
+    instrument_system(manager.model, timings)
+    ready = time.perf_counter()
+
+    num_samples = len(manager.sample_indices(config.num_test_samples))
+    metrics, _ = manager.run_experiment(save_result=False, evalute_hlcntn=False)
+    wall_time = time.perf_counter() - ready
+    return {
+        "num_samples": num_samples,
+        "import_seconds": imported - STARTED,
+        "setup_seconds": ready - imported,
+        "startup_seconds": ready - STARTED,
+        "wall_seconds": wall_time,
+        "samples_per_second": num_samples / wall_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "precision": metrics.get("precision"),
+        "token_usage": manager.model.token_usage(),
+        "timings": timings.summary(),
+    }
+
+
+def run_scenario_process(scenario_name: str, base_url: str, result_path: str) -> dict:
+    command = [
+        sys.executable,
+        "-m",
+        "benchmarks.run_benchmarks",
+        *sys.argv[1:],
+        "--benchmark_scenario",
+        scenario_name,
+    ]
+    if base_url is not None:
+        command += ["--llm_base_url", base_url]
+    subprocess.run(command, check=True)
+    with open(f"{result_path}{scenario_name}/benchmark.json", "r") as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    benchmark_config = config.experiment_setup.benchmark
+    if not hasattr(config, "num_test_samples"):
+        config.num_test_samples = benchmark_config.num_samples
+    config.experiment_setup.artifact_store.enabled = False
+    experiment_result_path = (
+        f"{config.path.experiment_result.base}{config.experiment_name}/"
+    )
+
+    if hasattr(config, "benchmark_scenario"):
+        scenario = scenario_by_name(config, config.benchmark_scenario)
+        apply_scenario(config, scenario)
+        if config.model.llm.cassette.mode:
+            config.model.llm.cassette.path = scenario_cassette_path(
+                config.model.llm.cassette.path, scenario.name
+            )
+        config.experiment_name = f"{config.experiment_name}/{scenario.name}"
+        scenario_result_path = f"{experiment_result_path}{scenario.name}/"
+        logger = ExperimentLogger(
+            "", log_path=scenario_result_path, logger_level=config.logger_level
+        )
+        result = run_scenario(config, logger)
+        with open(f"{scenario_result_path}benchmark.json", "w") as f:
+            json.dump(result, f, indent=4, sort_keys=True)
+        sys.exit(0)
+
+    logger = ExperimentLogger(
+        "", log_path=experiment_result_path, logger_level=config.logger_level
+    )
+    simulator, base_url = None, None
+    if config.model.llm.cassette.mode:
+        llm = f"cassette {config.model.llm.cassette.mode}"
+    elif config.model.llm.base_url:
+        llm = config.model.llm.base_url
+    else:
+        simulator_settings = edict(config.model.llm.simulator)
+        simulator_settings.port = 0
+        simulator_settings.latency = edict(benchmark_config.simulator_latency)
+        simulator = LLMSimulator(simulator_settings)
+        base_url = simulator.start()
+        llm = f"simulator ({dict(simulator_settings.latency)})"
+
+    report = {
+        "commit": get_current_commit_hash_and_message()["hash"],
+        "num_test_samples": config.num_test_samples,
+        "llm": llm,
+        "scenarios": {},
+    }
+    for scenario in benchmark_scenarios(config):
+        logger.info(f"==> Benchmark scenario {scenario.name}")
+        result = run_scenario_process(scenario.name, base_url, experiment_result_path)
+        report["scenarios"][scenario.name] = result
+        logger.info(
+            f"==> {scenario.name}: {result['samples_per_second']:.2f} samples/sec, "
+            f"startup {result['startup_seconds']:.2f}s, peak RSS {result['peak_rss_mb']:.0f}MB, "
+            f"sample p50 {result['timings'].get('sample', {}).get('p50_seconds', 0):.3f}s"
+        )
+    if simulator is not None:
+        simulator.stop()
+    with open(f"{experiment_result_path}benchmark.json", "w") as f:
+        json.dump(report, f, indent=4, sort_keys=True)
+    logger.info(f"==> Benchmark report saved to {experiment_result_path}benchmark.json")
@@ -0,0 +1,51 @@
+from typing import List
+
+from easydict import EasyDict as edict
+
+from model import model_name_class_mapping
+
+"""
+The benchmark scenarios: one per fact checker of model_name_class_mapping["fact_checker"] (or of
+config.experiment_setup.benchmark.fact_checkers if it is set) and per split_reference_triplets setting.
+"""
+
+SPLIT_REFERENCE_TRIPLETS = (True, False)
+
+
+def scenario_name(fact_checker: str, split_reference_triplets: bool) -> str:
+    return f"fact_checker={fact_checker}__split_reference_triplets={split_reference_triplets}"
+
+
+def benchmark_scenarios(config: edict) -> List[edict]:
+    """
+    The scenarios of the benchmark, as edicts with the name of the scenario and the fact checker settings it sets.
+    """
+    fact_checkers = config.experiment_setup.benchmark.fact_checkers or list(
+        model_name_class_mapping["fact_checker"]
+    )
+    unknown = set(fact_checkers) - set(model_name_class_mapping["fact_checker"])
+    if unknown:
+        raise ValueError(f"Unknown fact checkers in the benchmark: {sorted(unknown)}")
+    return [
+        edict(
+            name=scenario_name(fact_checker, split_reference_triplets),
+            fact_checker=fact_checker,
+            split_reference_triplets=split_reference_triplets,
+        )
+        for fact_checker in fact_checkers
+        for split_reference_triplets in SPLIT_REFERENCE_TRIPLETS
+    ]
+
+
+def scenario_by_name(config: edict, name: str) -> edict:
+    for scenario in benchmark_scenarios(config):
+        if scenario.name == name:
+            return scenario
+    raise ValueError(f"Unknown benchmark scenario {name!r}")
+
+
+def apply_scenario(config: edict, scenario: edict) -> None:
+    config.model.fact_checker.model_name = scenario.fact_checker
+    config.model.fact_checker.split_reference_triplets = (
+        scenario.split_reference_triplets
+    )
@@ -0,0 +1,153 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+"""
+Startup benchmark: the import time of the entry points, each in a fresh interpreter, and the heavy libraries their
+import loads. Guards the lazy imports against regressions: it fails (exit code 1) if an entry point imports one of
+DEFERRED_MODULES, if `import main` parses the command line, if the median import time of an entry point is above
+--max_seconds, or, with --baseline, if it is more than --threshold slower than in the baseline report.
+
+    python -m benchmarks.startup --save results/startup.json
+    python -m benchmarks.startup --baseline results/startup.json
+"""
+
+# entry point -> (import statement, command line)
+STARTUP_ENTRIES = {
+    "main": ("import main", ["main.py"]),
+    "model": ("import model", ["main.py"]),
+    "experiment_manager": ("import experiment_manager", ["main.py"]),
+    "compare_text_pair": (
+        "import compare_text_pair",
+        ["compare_text_pair.py", "-e", "startup_benchmark"],
+    ),
+}
+
+# imported on first use only, never by importing an entry point
+DEFERRED_MODULES = (
+    "sklearn",
+    "git",
+    "datasets",
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "openai",
+)
+
+CHILD_CODE = """
+import json, sys, time
+sys.argv = {argv!r}
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+import main
+print(json.dumps({{
+    "seconds": seconds,
+    "deferred_modules": sorted(name for name in {deferred!r} if name in sys.modules),
+    "config_parsed": "config" in vars(main),
+}}))
+"""
+
+
+def measure_entry(statement: str, argv: list) -> dict:
+    """
+    Import an entry point in a fresh interpreter (from the repository root).
+
+    Returns:
+        dict: seconds (of the import), deferred_modules (imported) and config_parsed (whether main parsed the
+              command line), or error if the import failed.
+    """
+    completed = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CHILD_CODE.format(
+                argv=argv, statement=statement, deferred=DEFERRED_MODULES
+            ),
+        ],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1:]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def startup_report(repeats: int) -> dict:
+    report = {}
+    for name, (statement, argv) in STARTUP_ENTRIES.items():
+        runs = [measure_entry(statement, argv) for _ in range(repeats)]
+        errors = [run["error"] for run in runs if "error" in run]
+        if errors:
+            report[name] = {"error": errors[0]}
+            continue
+        seconds = [run["seconds"] for run in runs]
+        report[name] = {
+            "median_seconds": statistics.median(seconds),
+            "min_seconds": min(seconds),
+            "max_seconds": max(seconds),
+            "deferred_modules": runs[-1]["deferred_modules"],
+            "config_parsed": runs[-1]["config_parsed"],
+        }
+    return report
+
+
+def regressions(
+    report: dict, max_seconds: float, baseline: dict = None, threshold: float = 0.5
+) -> list:
+    failures = []
+    for name, entry in report.items():
+        if "error" in entry:
+            failures.append(f"{name}: import failed: {entry['error']}")
+            continue
+        if entry["deferred_modules"]:
+            failures.append(f"{name}: imports {', '.join(entry['deferred_modules'])}")
+        if name == "main" and entry["config_parsed"]:
+            failures.append("main: parses the command line on import")
+        if entry["median_seconds"] > max_seconds:
+            failures.append(
+                f"{name}: {entry['median_seconds']:.3f}s, above {max_seconds:.3f}s"
+            )
+        before = (baseline or {}).get(name, {}).get("median_seconds")
+        if before and entry["median_seconds"] > before * (1 + threshold):
+            failures.append(
+                f"{name}: {entry['median_seconds']:.3f}s, {entry['median_seconds'] / before - 1:+.0%} "
+                f"slower than the baseline ({before:.3f}s)"
+            )
+    return failures
+
+
+if __name__ == "__main__":
+    args = argparse.ArgumentParser(description="startup benchmark")
+    args.add_argument("--repeats", default=5, type=int)
+    args.add_argument("--max_seconds", default=1.0, type=float)
+    args.add_argument("--baseline", default=None, type=str)
+    args.add_argument("--threshold", default=0.5, type=float)
+    args.add_argument("--save", default=None, type=str)
+    args = args.parse_args()
+
+    report = startup_report(args.repeats)
+    for name, entry in report.items():
+        if "error" in entry:
+            print(f"{name}: error {entry['error']}")
+        else:
+            print(
+                f"{name}: {entry['median_seconds']:.3f}s median "
+                f"({entry['min_seconds']:.3f}s-{entry['max_seconds']:.3f}s)"
+            )
+    if args.save is not None:
+        os.makedirs(os.path.dirname(args.save) or ".", exist_ok=True)
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = regressions(report, args.max_seconds, baseline, args.threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,75 @@
+import json
+import time
+
+from dataset import *
+from main import *
+from utils.entity_normalizer import (
+    EntityCanonicaliser,
+    get_alias_table_path,
+    mine_alias_table,
+)
+from utils.utils import ExperimentLogger
+
+"""
+Mines the entity alias table from the corpus passages and the corpus triplets, and saves it to
+data/{path.data.alias_table}_{dataset}.json. Set experiment_setup.entity_normalisation to true to use it.
+
+    python build_alias_table.py -e build_alias_table
+"""
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    dataset = BioASQDataset(config, logger)
+
+    start = time.perf_counter()
+    alias_table = mine_alias_table(dataset.corpus_dataset, dataset.corpus_triplets)
+    mining_time = time.perf_counter() - start
+
+    alias_table_path = get_alias_table_path(config)
+    with open(alias_table_path, "w") as f:
+        json.dump(alias_table, f, indent=4)
+    logger.info(
+        f"==> Alias table saved to {alias_table_path}: {len(alias_table['aliases'])} aliases "
+        f"in {len(alias_table['groups'])} groups, mined in {mining_time:.2f}s"
+    )
+
+    canonicaliser = EntityCanonicaliser(alias_table["aliases"])
+    triplets = [
+        triplet
+        for passage_triplets in dataset.corpus_triplets.values()
+        for triplet in passage_triplets
+        if len(triplet) == 3
+    ]
+    start = time.perf_counter()
+    canonical_triplets = canonicaliser.canonicalise_triplets(triplets)
+    canonicalise_time = time.perf_counter() - start
+
+    raw_triplets = [
+        [" ".join(str(element).lower().split()) for element in triplet]
+        for triplet in triplets
+    ]
+    raw_entities = {
+        element for triplet in raw_triplets for element in (triplet[0], triplet[2])
+    }
+    canonical_entities = {
+        element
+        for triplet in canonical_triplets
+        for element in (triplet[0], triplet[2])
+    }
+    rewritten = sum(
+        raw[0] != canonical[0] or raw[2] != canonical[2]
+        for raw, canonical in zip(raw_triplets, canonical_triplets)
+    )
+    merge_rate = 1 - len(canonical_entities) / max(len(raw_entities), 1)
+    logger.info(
+        f"==> Alias merge rate: {merge_rate:.2%} "
+        f"({len(raw_entities)} -> {len(canonical_entities)} distinct entities), "
+        f"{rewritten}/{len(triplets)} triplets rewritten"
+    )
+    logger.info(
+        f"==> Canonicaliser throughput: {len(triplets) / max(canonicalise_time, 1e-9):.0f} triplets/sec"
+    )
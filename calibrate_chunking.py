@@ -0,0 +1,102 @@
+import json
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from dataset import *
+from main import *
+from model import LLMMultiShotTripletGenerator
+from model.triplet_generator.llm_multishot_triplet_generator import (
+    get_chunking_curve_path,
+)
+from utils.utils import ExperimentLogger
+
+load_dotenv()
+
+"""
+Measures the latency/tokens curve used by the chunked triplet generation (model.triplet_generator.chunking) to pick
+the window size of a long passage, and saves it to data/{path.data.chunking_curve}_{generator_model}.json.
+
+For every window size in CHUNK_TOKENS, windows are cut from the longest corpus passages and a wave of
+`chunking.max_concurrency` windows is extracted concurrently, NUM_ROUNDS times. The median wall time of a wave is its
+latency; the input / output tokens per window are reported with it.
+
+    python calibrate_chunking.py -e calibrate_chunking --num_test_samples 20
+"""
+
+CHUNK_TOKENS = [128, 256, 384, 512, 768, 1024]
+NUM_ROUNDS = 3
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    dataset = BioASQDataset(config, logger)
+    num_passages = config.num_test_samples if "num_test_samples" in config else 20
+    passages = sorted(dataset.corpus_dataset.values(), key=len, reverse=True)[
+        :num_passages
+    ]
+
+    generator = LLMMultiShotTripletGenerator(config, logger)
+    max_concurrency = config.model.triplet_generator.chunking.max_concurrency
+    points = []
+    for chunk_tokens in CHUNK_TOKENS:
+        chunks = [
+            chunk
+            for passage in passages
+            for chunk in generator.chunk_passage(passage, chunk_tokens)
+        ]
+        latencies = []
+        usage_before = dict(generator.token_usage)
+        for round_idx in range(NUM_ROUNDS):
+            wave = chunks[
+                round_idx * max_concurrency : (round_idx + 1) * max_concurrency
+            ]
+            if len(wave) < max_concurrency:
+                break
+            start = time.perf_counter()
+            generator.invoke_model_batch(
+                [generator.get_extraction_prompt(chunk) for chunk in wave],
+                max_concurrency=max_concurrency,
+            )
+            latencies.append(time.perf_counter() - start)
+        if not latencies:
+            logger.warning(
+                f"==> Not enough text for a wave of {max_concurrency} windows of {chunk_tokens} tokens, skipped"
+            )
+            continue
+
+        num_calls = generator.token_usage["calls"] - usage_before["calls"]
+        point = {
+            "chunk_tokens": chunk_tokens,
+            "latency": float(np.median(latencies)),
+            "input_tokens": (
+                generator.token_usage["input_tokens"] - usage_before["input_tokens"]
+            )
+            / num_calls,
+            "output_tokens": (
+                generator.token_usage["output_tokens"] - usage_before["output_tokens"]
+            )
+            / num_calls,
+        }
+        points.append(point)
+        logger.info(
+            f"==> {chunk_tokens:5d} tokens per window: {point['latency']:.2f}s per wave of {max_concurrency}, "
+            f"{point['input_tokens']:.0f} input / {point['output_tokens']:.0f} output tokens per window"
+        )
+
+    curve_path = get_chunking_curve_path(config)
+    with open(curve_path, "w") as f:
+        json.dump(
+            {
+                "generator_model": config.model.llm.generator_model,
+                "max_concurrency": max_concurrency,
+                "points": points,
+            },
+            f,
+            indent=4,
+        )
+    logger.info(f"==> Chunking curve saved to {curve_path}")
@@ -0,0 +1,114 @@
+import logging
+import sys
+import time
+
+from rag.pipeline_executor import Stage, StagedPipelineExecutor, StageError
+
+"""
+Checks the backpressure policies of the staged pipeline executor (rag/pipeline_executor.py) with stages sleeping for a
+fixed time instead of calling the LLM:
+    - source: a producer much faster than a "drop" first stage with a small queue. No item may be dropped, the input
+      iterable waits for the first stage.
+    - handoff: a fast first stage feeding a slow "drop" second stage with a small queue. Items are dropped at the
+      handoff, and only there.
+    - block: the same stages with "block", nothing is dropped.
+
+    python check_pipeline_executor.py
+
+Exits with code 1 if a check fails.
+"""
+
+NUM_ITEMS = 40
+SLOW_SECONDS = 0.02
+
+
+def sleep_stage(seconds: float):
+    def run(value):
+        time.sleep(seconds)
+        return value
+
+    return run
+
+
+def run_case(name: str, stages: list, logger: logging.Logger) -> dict:
+    executor = StagedPipelineExecutor(stages, logger)
+    results = executor.run(iter(range(NUM_ITEMS)))
+    executor.log_metrics()
+    return {
+        "name": name,
+        "results": results,
+        "dropped": {
+            stage_name: metrics["dropped"]
+            for stage_name, metrics in executor.metrics().items()
+        },
+    }
+
+
+def check_source(logger: logging.Logger) -> list:
+    case = run_case(
+        "source",
+        [
+            Stage("slow", sleep_stage(SLOW_SECONDS), queue_size=2, backpressure="drop"),
+            Stage("fast", sleep_stage(0), queue_size=NUM_ITEMS),
+        ],
+        logger,
+    )
+    failures = []
+    if case["results"] != list(range(NUM_ITEMS)):
+        failures.append(f"source: the results are {case['results']}")
+    if case["dropped"]["slow"]:
+        failures.append(
+            f"source: {case['dropped']['slow']} items dropped at the intake of the first stage"
+        )
+    return failures
+
+
+def check_handoff(logger: logging.Logger) -> list:
+    case = run_case(
+        "handoff",
+        [
+            Stage("fast", sleep_stage(0), concurrency=4, queue_size=NUM_ITEMS),
+            Stage("slow", sleep_stage(SLOW_SECONDS), queue_size=1, backpressure="drop"),
+        ],
+        logger,
+    )
+    dropped = [
+        result
+        for result in case["results"]
+        if isinstance(result, StageError) and result.stage == "slow"
+    ]
+    failures = []
+    if not dropped or len(dropped) != case["dropped"]["slow"]:
+        failures.append(
+            f"handoff: {len(dropped)} dropped results, {case['dropped']['slow']} dropped by the second stage"
+        )
+    if case["dropped"]["fast"]:
+        failures.append(
+            f"handoff: {case['dropped']['fast']} items dropped by the first stage"
+        )
+    return failures
+
+
+def check_block(logger: logging.Logger) -> list:
+    case = run_case(
+        "block",
+        [
+            Stage("fast", sleep_stage(0), concurrency=4, queue_size=1),
+            Stage("slow", sleep_stage(SLOW_SECONDS), queue_size=1),
+        ],
+        logger,
+    )
+    if case["results"] != list(range(NUM_ITEMS)) or any(case["dropped"].values()):
+        return [f"block: the results are {case['results']}, dropped {case['dropped']}"]
+    return []
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger = logging.getLogger("check_pipeline_executor")
+    failures = check_source(logger) + check_handoff(logger) + check_block(logger)
+    for failure in failures:
+        logger.error(f"FAILED {failure}")
+    if not failures:
+        logger.info("==> All pipeline executor checks passed")
+    sys.exit(1 if failures else 0)
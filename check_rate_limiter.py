@@ -0,0 +1,85 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from llm_simulator import LLMSimulator
+from main import *
+from pipeline.pipeline_llm import PipelineLLM
+from pipeline.rate_limiter import get_rate_limiter
+from utils.utils import ExperimentLogger
+
+"""
+Checks the client side rate limiter (config.model.llm.rate_limit) against the local LLM simulator configured to
+answer 429 (with a Retry-After) when more than MAX_IN_FLIGHT requests are in flight. The same burst of requests is
+sent without and with the limiter, and the throughput, the number of 429s and of failed requests and the limiter
+metrics are reported.
+
+    python check_rate_limiter.py -e check_rate_limiter
+"""
+
+MAX_IN_FLIGHT = 8
+LATENCY_SECONDS = 0.2
+RETRY_AFTER_SECONDS = 0.5
+NUM_REQUESTS = 200
+CLIENT_THREADS = 64
+
+
+def run_burst(llm: PipelineLLM, simulator: LLMSimulator) -> dict:
+    before = simulator.stats()
+    failed = 0
+
+    def request(i):
+        nonlocal failed
+        try:
+            llm.invoke_model(f"Is triplet {i} supported by the references?")
+        except openai.APIError:
+            failed += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CLIENT_THREADS) as executor:
+        list(executor.map(request, range(NUM_REQUESTS)))
+    wall_time = time.perf_counter() - start
+    after = simulator.stats()
+    return {
+        "requests_per_second": (NUM_REQUESTS - failed) / wall_time,
+        "served": after["served"] - before["served"],
+        "rejected_429": after["rejected_429"] - before["rejected_429"],
+        "failed": failed,
+        "wall_time": wall_time,
+    }
+
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    simulator_settings = edict(config.model.llm.simulator)
+    simulator_settings.update(
+        port=0,
+        max_in_flight=MAX_IN_FLIGHT,
+        retry_after_seconds=RETRY_AFTER_SECONDS,
+        seconds_per_output_token=0.0,
+        error_rates={},
+    )
+    simulator_settings.latency = edict(
+        distribution="fixed", median_seconds=LATENCY_SECONDS
+    )
+    simulator = LLMSimulator(simulator_settings)
+    config.model.llm.base_url = simulator.start()
+    logger.info(
+        f"==> Simulator {config.model.llm.base_url}: {MAX_IN_FLIGHT} requests in flight, "
+        f"{LATENCY_SECONDS}s latency, {NUM_REQUESTS} requests from {CLIENT_THREADS} threads"
+    )
+
+    config.model.llm.rate_limit.enabled = False
+    logger.info(
+        f"==> Without rate limiter: {run_burst(PipelineLLM(config), simulator)}"
+    )
+
+    config.model.llm.rate_limit.enabled = True
+    logger.info(f"==> With rate limiter: {run_burst(PipelineLLM(config), simulator)}")
+    logger.info(f"==> Rate limiter metrics: {get_rate_limiter(config).metrics()}")
+    simulator.stop()
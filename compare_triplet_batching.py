@@ -0,0 +1,57 @@
+import time
+
+from dotenv import load_dotenv
+
+from dataset import *
+from main import *
+from model import LLMMultiShotTripletGenerator
+from utils.utils import ExperimentLogger
+
+load_dotenv()
+
+"""
+Compares the single-passage and the batched triplet extraction of LLMMultiShotTripletGenerator on the first
+`num_test_samples` (default 20) corpus passages: calls, tokens per passage, wall time and the number of triplets.
+
+    python compare_triplet_batching.py -e triplet_batching --num_test_samples 20
+"""
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    dataset = BioASQDataset(config, logger)
+    num_passages = config.num_test_samples if "num_test_samples" in config else 20
+    passages = dict(list(dataset.corpus_dataset.items())[:num_passages])
+
+    single_generator = LLMMultiShotTripletGenerator(config, logger)
+    start = time.perf_counter()
+    single_triplets = {
+        passage_id: single_generator.forward(passage)
+        for passage_id, passage in passages.items()
+    }
+    single_time = time.perf_counter() - start
+
+    batch_generator = LLMMultiShotTripletGenerator(config, logger)
+    start = time.perf_counter()
+    batch_triplets = batch_generator.forward_batch(passages)
+    batch_time = time.perf_counter() - start
+
+    for mode, generator, triplets, elapsed in (
+        ("single", single_generator, single_triplets, single_time),
+        ("batch", batch_generator, batch_triplets, batch_time),
+    ):
+        usage = generator.token_usage
+        logger.info(
+            f"==> {mode:6s}: {usage['calls']} calls, "
+            f"{usage['input_tokens'] / len(passages):.0f} input / "
+            f"{usage['output_tokens'] / len(passages):.0f} output tokens per passage, "
+            f"{sum(len(t) for t in triplets.values()) / len(passages):.1f} triplets per passage, "
+            f"{elapsed:.1f}s"
+        )
+    logger.info(
+        f"==> Input tokens saved by batching: "
+        f"{1 - batch_generator.token_usage['input_tokens'] / max(single_generator.token_usage['input_tokens'], 1):.1%}"
+    )
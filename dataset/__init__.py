@@ -2,10 +2,16 @@ from dataset.bioasq_dataset import *
 from dataset.experiment_dataset import *
 from dataset.hallucination_dataset import *
 from dataset.demonstration_dataset import *
+from dataset.corpus_graph import *
+from dataset.corpus_triplet_index import *
+from dataset.bm25_retriever import *
 
 __all__ = [
     "BioASQDataset",
     "ExperimentDataset",
     "HallucinationDataset",
     "DemonstrationDataset",
+    "CorpusGraph",
+    "CorpusTripletIndex",
+    "BM25Retriever",
 ]
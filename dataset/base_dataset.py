@@ -1,6 +1,8 @@
 from utils.utils import *
 from pipeline import *
 import json
+import os
+import tempfile
 from glob import glob
 
 class BaseDataset(PipelineBase):
@@ -30,7 +32,7 @@ class BaseDataset(PipelineBase):
         """
 
         dataset = {}
-        exisiting_files = [file_path for file_path in glob(f"{path}/*")]
+        exisiting_files = [file_path for file_path in glob(f"{path}/*.json")]
         for file_path in exisiting_files:
             data_key = file_path.split("/")[-1].replace(".json", "")
             dataset[int(data_key)] = json.load(open(file_path, "r"))
@@ -50,8 +52,11 @@ class BaseDataset(PipelineBase):
         Returns:
             None
         """
-        if not os.path.exists(path):
-            os.makedirs(path)
+        os.makedirs(path, exist_ok=True)
 
         for key in dataset:
-            json.dump(dataset[key], open(f"{path}/{key}.json", "w"))
+            # written to a temporary file and renamed, so that a concurrent reader or writer never sees a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=path, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(dataset[key], f)
+            os.replace(tmp_path, f"{path}/{key}.json")
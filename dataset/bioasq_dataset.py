@@ -1,8 +1,11 @@
 import json
 
 from dataset.base_dataset import *
-from datasets import load_dataset
-from model import *
+from dataset.bm25_retriever import BM25Retriever
+from model import model_name_class_mapping
+from typing import Optional
+
+RETRIEVAL_SOURCES = ("gold", "bm25")
 
 
 class BioASQDataset(BaseDataset):
@@ -11,6 +14,8 @@ class BioASQDataset(BaseDataset):
         1) corpus_text_dataset : corpus dataset at text format, used when generating corpus_triplet_dataset and adding context to question
         2) corpus_triplet_dataset : triplets generated from corpus_text_dataset and this is used at the fact checker. to create corpus_triplets, you need a triplet_generator
         3) qa_dataset : the question dataset with relevant passage
+    The relevant passages come from the gold `relevant_passage_ids` of the qa_dataset, or from a BM25 retriever over the
+    corpus passages if `experiment_setup.retrieval.source` is "bm25".
     """
 
     def __init__(self, config: dict, logger):
@@ -19,6 +24,7 @@ class BioASQDataset(BaseDataset):
         self.corpus_dataset = self.get_corpus_dataset()
         self.qa_dataset = self.get_qa_datset()
         self.corpus_triplets = self.get_corpus_triplet_dataset()
+        self.retriever = self.get_retriever()
 
     def get_qa_datset(self) -> list:
         """
@@ -61,6 +67,8 @@ class BioASQDataset(BaseDataset):
         Returns:
             list: A list of dictionaries, each containing 'id', 'question', 'answer', and 'relevant_passage_ids' keys.
         """
+        from datasets import load_dataset
+
         self.logger.info("==> QA dataset does not exist, creating it")
         if self.config.experiment_setup.dataset == "all":
             keyword = ""
@@ -152,6 +160,8 @@ class BioASQDataset(BaseDataset):
         Returns:
             dict: A dictionary where the keys are the IDs of the corpus data and the values are the processed passages.
         """
+        from datasets import load_dataset
+
         corpus_dataset = {
             corpus_data["id"]: corpus_data["passage"].replace("\n", "")
             for corpus_data in load_dataset(
@@ -169,6 +179,26 @@ class BioASQDataset(BaseDataset):
 
         return corpus_dataset
 
+    def get_retriever(self) -> Optional[BM25Retriever]:
+        """
+        Get the passage retriever if the relevant passages are retrieved instead of taken from the gold ids.
+        The retriever index is built (or memory-mapped) at the first query.
+
+        Raises:
+            ValueError: If `experiment_setup.retrieval.source` is not one of RETRIEVAL_SOURCES.
+        """
+        source = self.config.experiment_setup.retrieval.source
+        if source not in RETRIEVAL_SOURCES:
+            raise ValueError(
+                f"Unknown retrieval source {source!r}, expected one of {RETRIEVAL_SOURCES}"
+            )
+        if source == "gold":
+            return None
+        self.logger.info(f"==> Relevant passages are retrieved with {source}")
+        return BM25Retriever(
+            self.config, self.logger, corpus_dataset=self.corpus_dataset
+        )
+
     def data_row_by_id(self, id: int) -> dict:
         """
         Retrieve a data row by its ID, including reference documents and reference triplets.
@@ -183,9 +213,18 @@ class BioASQDataset(BaseDataset):
                   corresponding to the relevant passage IDs.
                 - "reference_triplets": Merged relevant reference triplets for the
                   relevant passage IDs.
+                If the passages are retrieved, "relevant_passage_ids" holds the retrieved IDs and the gold
+                ones are kept in "gold_relevant_passage_ids".
         """
 
         data_row = {**self.qa_dataset[id]}
+        if self.retriever is not None:
+            data_row["gold_relevant_passage_ids"] = data_row.get(
+                "relevant_passage_ids", []
+            )
+            data_row["relevant_passage_ids"] = self.retriever.retrieve_passage_ids(
+                data_row["question"], top_k=self.config.experiment_setup.retrieval.top_k
+            )
         data_row["reference_documents"] = [
             self.corpus_dataset[passage_id]
             for passage_id in data_row["relevant_passage_ids"]
@@ -221,7 +260,9 @@ class BioASQDataset(BaseDataset):
             else:
                 return {}
 
-    def get_corpus_triplet_by_idx(self, passage_id: int, save_data=True) -> list:
+    def get_corpus_triplet_by_idx(
+        self, passage_id: int, save_data=True, triplet_generator=None
+    ) -> list:
         """
         Retrieves a corpus triplet by its passage ID. If the triplet is not already cached, it generates the triplet,
         caches it, and optionally saves it to disk.
@@ -229,6 +270,8 @@ class BioASQDataset(BaseDataset):
         Args:
             passage_id (int or str): The ID of the passage for which to retrieve the triplet.
             save_data (bool, optional): Whether to save the generated triplet to disk. Defaults to True.
+            triplet_generator (TripletGenerator, optional): The triplet generator of a missing passage, a new one of
+                                                            the configured model if not given.
 
         Returns:
             list: The triplet associated with the given passage ID.
@@ -236,11 +279,12 @@ class BioASQDataset(BaseDataset):
         if passage_id in self.corpus_triplets:
             return self.corpus_triplets[passage_id]
         else:
-            triplet_generator = model_name_class_mapping["triplet_generator"][
-                self.config.model.triplet_generator.model_name
-            ](
-                self.config, self.logger
-            )  # instantiate the triplet generator every time seems inefficient
+            if triplet_generator is None:
+                triplet_generator = model_name_class_mapping["triplet_generator"][
+                    self.config.model.triplet_generator.model_name
+                ](
+                    self.config, self.logger
+                )  # instantiate the triplet generator every time seems inefficient
             self.corpus_triplets[passage_id] = triplet_generator.forward(
                 self.corpus_dataset[passage_id]
             )
@@ -268,10 +312,15 @@ class BioASQDataset(BaseDataset):
         triplet_generator = model_name_class_mapping["triplet_generator"][
             self.config.model.triplet_generator.model_name
         ](self.config, self.logger)
-        corpus_triplets = {
-            document_id: triplet_generator.forward(passage)
-            for document_id, passage in self.corpus_dataset.items()
-        }
+        if self.config.model.triplet_generator.batch.enabled and hasattr(
+            triplet_generator, "forward_batch"
+        ):
+            corpus_triplets = triplet_generator.forward_batch(self.corpus_dataset)
+        else:
+            corpus_triplets = {
+                document_id: triplet_generator.forward(passage)
+                for document_id, passage in self.corpus_dataset.items()
+            }
         self.logger.info(
             f"==> Number of Corpus Triplet Dataset: {len(corpus_triplets)}"
         )
@@ -292,30 +341,38 @@ class BioASQDataset(BaseDataset):
             passage_ids (list): A list of passage IDs for which to retrieve and merge triplets.
 
         Returns:
-            list: A list of triplets, where each triplet is represented as a list.
+            list: A list of triplets, where each triplet is represented as a list. Empty if the triplets could not be
+                  retrieved (see `relevant_reference_triplets` to get the error instead).
         """
 
         try:
-            if self.config.model.fact_checker.split_reference_triplets:
-
-                return self.get_segmented_triplets(passage_ids)
-
-            else:
-                return [
-                    [
-                        list(triplet)
-                        for passage_id in passage_ids
-                        for triplet in self.get_corpus_triplet_by_idx(
-                            passage_id=passage_id, save_data=self.config.save_data
-                        )
-                    ]
-                ]
+            return self.relevant_reference_triplets(passage_ids)
         except Exception as e:
             self.logger.warning("==> Error in merging triplets: %s", str(e))
             self.logger.debug("==> Error passage_ids: %s", passage_ids)
 
             return []
 
+    def relevant_reference_triplets(self, passage_ids: list) -> list:
+        """
+        The reference triplets of the given passage IDs, segmented if `fact_checker.split_reference_triplets`,
+        otherwise as a single segment.
+
+        Raises:
+            Exception: Any error retrieving or generating the triplets of a passage.
+        """
+        if self.config.model.fact_checker.split_reference_triplets:
+            return self.get_segmented_triplets(passage_ids)
+        return [
+            [
+                list(triplet)
+                for passage_id in passage_ids
+                for triplet in self.get_corpus_triplet_by_idx(
+                    passage_id=passage_id, save_data=self.config.save_data
+                )
+            ]
+        ]
+
     def get_segmented_triplets(self, passage_ids: list) -> list:
         """
         Get segmented triplets for the given passage IDs.
@@ -0,0 +1,158 @@
+from dataset.base_dataset import *
+from utils.entity_normalizer import get_entity_canonicaliser
+from utils.inverted_index import ShardedInvertedIndex, merge_postings, top_k_scores
+from utils.text_utils import tokenize
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import threading
+
+
+class BM25Retriever(BaseDataset):
+    """
+    BM25Retriever is an in-process BM25 passage retriever over the corpus passages. It is used instead of the gold
+    `relevant_passage_ids` when `experiment_setup.retrieval.source` is "bm25", i.e. when the question comes without them.
+
+    The passages are indexed once into a ShardedInvertedIndex (token -> passage postings with term frequencies), which is
+    memory-mapped at query time, so a query only reads the shards of its own tokens. The index directory also contains
+    passage_ids.npy, mapping the contiguous document ids of the index back to the corpus passage ids.
+
+    Methods:
+        retrieve(query: str, top_k: int) -> List[Tuple[int, float]]:
+            Returns the top_k (passage_id, score) pairs for a query, best first.
+        retrieve_passage_ids(query: str, top_k: int) -> List[int]:
+            Returns the top_k passage ids for a query, best first.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: logging.Logger,
+        corpus_dataset: Optional[Dict[int, str]] = None,
+    ):
+        super().__init__(config)
+        self.logger = logger
+        self.corpus_dataset = corpus_dataset
+        self.k1 = self.config.experiment_setup.retrieval.k1
+        self.b = self.config.experiment_setup.retrieval.b
+        self.canonicaliser = get_entity_canonicaliser(config, logger)
+        canonical_suffix = "_canonical" if self.canonicaliser is not None else ""
+        self.index_path = f"{self.config.path.data.base}{self.config.path.data.passage_index}_{self.config.experiment_setup.dataset}{canonical_suffix}"
+        self.inverted_index = ShardedInvertedIndex(
+            self.index_path,
+            num_shards=self.config.experiment_setup.corpus_index.num_shards,
+            max_cached_shards=self.config.experiment_setup.corpus_index.max_cached_shards,
+        )
+        self._passage_ids = None
+        self._length_norms = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def passage_ids(self) -> np.ndarray:
+        if self._passage_ids is None:
+            self.get_index()
+            self._passage_ids = np.load(
+                f"{self.index_path}/passage_ids.npy", mmap_mode="r"
+            )
+        return self._passage_ids
+
+    @property
+    def length_norms(self) -> np.ndarray:
+        """
+        The k1 * (1 - b + b * dl / avgdl) term of every passage, computed once and kept in memory.
+        """
+        if self._length_norms is None:
+            index = self.get_index()
+            self._length_norms = self.k1 * (
+                1
+                - self.b
+                + self.b
+                * np.asarray(index.doc_lengths, dtype=np.float32)
+                / max(index.avg_doc_length, 1e-9)
+            )
+        return self._length_norms
+
+    def get_index(self) -> ShardedInvertedIndex:
+        """
+        Get the inverted index, building it first if it does not exist on disk.
+        The lock makes concurrent first queries wait for a single build.
+        """
+        with self._index_lock:
+            if not self.inverted_index.exists():
+                self.logger.info("==> Passage index does not exist, building it")
+                self.build_index()
+        return self.inverted_index
+
+    def build_index(self) -> None:
+        """
+        Build the passage index from the corpus passages (the ones given at init time, or the corpus file on disk).
+        passage_ids.npy is saved first: the inverted index marks the whole index as complete when it is built.
+        """
+        corpus_dataset = self.corpus_dataset
+        if corpus_dataset is None:
+            with open(
+                f"{self.config.path.data.base}{self.config.path.data.corpus}", "r"
+            ) as f:
+                corpus_dataset = {
+                    int(key): value for key, value in json.load(f).items()
+                }
+
+        passage_ids = list(corpus_dataset.keys())
+        os.makedirs(self.index_path, exist_ok=True)
+        np.save(
+            f"{self.index_path}/passage_ids.npy", np.array(passage_ids, dtype=np.int64)
+        )
+        self.inverted_index.build(
+            (doc_id, self.tokenize_text(corpus_dataset[passage_id]))
+            for doc_id, passage_id in enumerate(passage_ids)
+        )
+        self.logger.info(f"==> Passage index built with {len(passage_ids)} passages")
+
+    def tokenize_text(self, text: str) -> List[str]:
+        """
+        Tokenize a passage or a query, after rewriting its entity aliases into their canonical forms
+        if entity normalisation is on.
+        """
+        if self.canonicaliser is not None:
+            text = self.canonicaliser.canonicalise(text)
+        return tokenize(text)
+
+    def retrieve(self, query: str, top_k: int = 10) -> List[Tuple[int, float]]:
+        """
+        Score the passages containing at least one query token with BM25:
+            idf(t) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+        with idf(t) = log(1 + (N - df + 0.5) / (df + 0.5)).
+
+        Args:
+            query (str): The question.
+            top_k (int): The number of passages to return. Defaults to 10.
+
+        Returns:
+            List[Tuple[int, float]]: (passage_id, score) pairs, best first.
+        """
+        index = self.get_index()
+        num_passages = index.num_documents
+        length_norms = self.length_norms
+        postings = []
+        for token in set(self.tokenize_text(query)):
+            doc_ids, tfs = index.postings(token)
+            if len(doc_ids) == 0:
+                continue
+            df = len(doc_ids)
+            idf = np.log(1.0 + (num_passages - df + 0.5) / (df + 0.5))
+            postings.append(
+                (
+                    doc_ids,
+                    idf * tfs * (self.k1 + 1) / (tfs + length_norms[doc_ids]),
+                )
+            )
+
+        doc_ids, weights = merge_postings(postings)
+        return [
+            (int(self.passage_ids[doc_id]), score)
+            for doc_id, score in top_k_scores(
+                doc_ids, weights, top_k, num_documents=num_passages
+            )
+        ]
+
+    def retrieve_passage_ids(self, query: str, top_k: int = 10) -> List[int]:
+        return [passage_id for passage_id, _ in self.retrieve(query, top_k=top_k)]
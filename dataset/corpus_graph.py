@@ -0,0 +1,302 @@
+from dataset.base_dataset import *
+from utils.entity_normalizer import get_entity_canonicaliser
+from collections import deque
+from typing import Dict, List, Optional
+
+
+class CorpusGraph(BaseDataset):
+    """
+    CorpusGraph is an adjacency index (knowledge graph) built over the corpus triplets.
+
+    Every corpus triplet [subject, relation, object] found in passage `passage_id` becomes
+        - a forward edge  subject -> (relation, object, passage_id)
+        - a reverse edge  object  -> (relation, subject, passage_id)
+    Entities are keyed by their normalised text, so lookups are plain dictionary accesses. With entity normalisation on,
+    the aliases of an entity ("TTF1", "NKX2-1") share the key of its canonical form, and the graph is saved to a separate file.
+
+    The graph is persisted to disk as a single JSON file and loaded lazily, i.e. nothing is read
+    or built until the first query. If the file does not exist, the graph is built from the corpus
+    triplets (the ones given at init time, or the corpus triplet files on disk) and saved.
+    Delete the graph file to rebuild it after the corpus triplets have changed.
+
+    Methods:
+        neighbours(entity: str, direction: str = "both") -> list:
+            Returns the edges (relation, neighbour, passage_id) of a single entity.
+        neighbourhood_triplets(entities: list, hops: int = 1, passage_ids: list = None) -> list:
+            Returns the triplets within `hops` of the given entities.
+        shortest_path(source: str, target: str, max_hops: int = 3) -> Optional[list]:
+            Returns the triplets on a shortest path between two entities.
+        answer_neighbourhood_segments(answer_triplets: list, hops: int = 1, passage_ids: list = None) -> list:
+            Returns the neighbourhood of the answer triplet entities, segmented for the fact checker.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: logging.Logger,
+        corpus_triplets: Optional[Dict[int, list]] = None,
+    ):
+        super().__init__(config)
+        self.logger = logger
+        self.corpus_triplets = corpus_triplets
+        self.canonicaliser = get_entity_canonicaliser(config, logger)
+        canonical_suffix = "_canonical" if self.canonicaliser is not None else ""
+        self.graph_path = f"{self.config.path.data.base}{self.config.path.data.corpus_graph}_{self.config.experiment_setup.dataset}{canonical_suffix}.json"
+        self._graph = None
+
+    @property
+    def graph(self) -> dict:
+        """
+        The graph dictionary with "labels", "adjacency" and "reverse_adjacency" keys, loaded on first access.
+        """
+        if self._graph is None:
+            self._graph = self.get_graph()
+        return self._graph
+
+    @property
+    def adjacency(self) -> dict:
+        return self.graph["adjacency"]
+
+    @property
+    def reverse_adjacency(self) -> dict:
+        return self.graph["reverse_adjacency"]
+
+    @property
+    def labels(self) -> dict:
+        return self.graph["labels"]
+
+    def get_graph(self) -> dict:
+        """
+        Get the corpus graph.
+        If the graph file exists, load it. Otherwise build the graph from the corpus triplets and save it,
+        so that the next run only pays for the loading.
+
+        Returns:
+            dict: The graph dictionary.
+        """
+        if os.path.exists(self.graph_path):
+            self.logger.info("==> Corpus graph exists locally, loading it")
+            with open(self.graph_path, "r") as f:
+                return json.load(f)
+
+        self.logger.info("==> Corpus graph does not exist, building it")
+        corpus_triplets = self.corpus_triplets
+        if corpus_triplets is None:
+            corpus_triplet_dataset_path = f"{self.config.path.data.base}{self.config.path.data.corpus_triplet}_{self.config.experiment_setup.dataset}"
+            corpus_triplets = self.load_files_as_dataset(corpus_triplet_dataset_path)
+        graph = self.build_graph(corpus_triplets)
+        self.save_graph(graph)
+        return graph
+
+    def build_graph(self, corpus_triplets: Dict[int, list]) -> dict:
+        """
+        Builds the adjacency index over all corpus triplets.
+
+        Args:
+            corpus_triplets (dict): A dictionary where keys are passage IDs and values are lists of triplets.
+
+        Returns:
+            dict: A dictionary containing:
+                - "labels" (dict): normalised entity -> entity text as it first appeared in the corpus.
+                - "adjacency" (dict): normalised subject -> list of [relation, object, passage_id].
+                - "reverse_adjacency" (dict): normalised object -> list of [relation, subject, passage_id].
+        """
+        labels, adjacency, reverse_adjacency = {}, {}, {}
+        num_edges = 0
+        for passage_id, triplets in corpus_triplets.items():
+            for triplet in triplets:
+                if len(triplet) != 3:
+                    continue
+                subject, relation, obj = [str(element) for element in triplet]
+                subject_key = self.normalise_entity(subject)
+                object_key = self.normalise_entity(obj)
+                if subject_key == "" or object_key == "":
+                    continue
+                labels.setdefault(subject_key, subject)
+                labels.setdefault(object_key, obj)
+                adjacency.setdefault(subject_key, []).append(
+                    [relation, obj, int(passage_id)]
+                )
+                reverse_adjacency.setdefault(object_key, []).append(
+                    [relation, subject, int(passage_id)]
+                )
+                num_edges += 1
+
+        self.logger.info(
+            f"==> Corpus graph built with {len(labels)} entities and {num_edges} edges"
+        )
+        return {
+            "labels": labels,
+            "adjacency": adjacency,
+            "reverse_adjacency": reverse_adjacency,
+        }
+
+    def save_graph(self, graph: dict) -> None:
+        """
+        Save the graph dictionary to `self.graph_path`.
+        """
+        self.logger.info("==> Saving corpus graph")
+        with open(self.graph_path, "w") as f:
+            json.dump(graph, f)
+
+    def normalise_entity(self, entity: str) -> str:
+        """
+        Normalise an entity text into the key used in the graph.
+        Lower cases, collapses whitespaces, strips the surrounding punctuations and a leading article,
+        and rewrites the aliases into their canonical forms if entity normalisation is on.
+        """
+        if self.canonicaliser is not None:
+            entity = self.canonicaliser.canonicalise(entity)
+        entity = " ".join(str(entity).lower().split()).strip(" .,;:\"'")
+        for article in ("the ", "a ", "an "):
+            if entity.startswith(article):
+                return entity[len(article) :]
+        return entity
+
+    def neighbours(self, entity: str, direction: str = "both") -> List[list]:
+        """
+        Returns the edges of an entity.
+
+        Args:
+            entity (str): The entity text (it is normalised before the lookup).
+            direction (str): One of "forward", "reverse" or "both". Defaults to "both".
+
+        Returns:
+            list: A list of [relation, neighbour, passage_id] edges.
+        """
+        entity_key = self.normalise_entity(entity)
+        edges = []
+        if direction in ("forward", "both"):
+            edges.extend(self.adjacency.get(entity_key, []))
+        if direction in ("reverse", "both"):
+            edges.extend(self.reverse_adjacency.get(entity_key, []))
+        return edges
+
+    def entity_triplets(self, entity_key: str, passage_ids: Optional[set] = None):
+        """
+        Yields (triplet, neighbour_key) pairs for all the edges of a normalised entity, in [subject, relation, object] order.
+        """
+        label = self.labels.get(entity_key, entity_key)
+        for relation, obj, passage_id in self.adjacency.get(entity_key, []):
+            if passage_ids is None or passage_id in passage_ids:
+                yield [label, relation, obj], self.normalise_entity(obj)
+        for relation, subject, passage_id in self.reverse_adjacency.get(entity_key, []):
+            if passage_ids is None or passage_id in passage_ids:
+                yield [subject, relation, label], self.normalise_entity(subject)
+
+    def neighbourhood_triplets(
+        self,
+        entities: List[str],
+        hops: int = 1,
+        passage_ids: Optional[List[int]] = None,
+        max_triplets: Optional[int] = None,
+    ) -> List[list]:
+        """
+        Collects the triplets within `hops` edges of the given entities with a breadth first search.
+
+        Args:
+            entities (list): The entity texts to start from.
+            hops (int): The number of hops to expand. Defaults to 1.
+            passage_ids (list, optional): If given, only edges coming from these passages are followed.
+            max_triplets (int, optional): Stop once this number of triplets is collected.
+
+        Returns:
+            list: A list of unique [subject, relation, object] triplets.
+        """
+        passage_ids = set(passage_ids) if passage_ids is not None else None
+        frontier = [self.normalise_entity(entity) for entity in entities]
+        visited = set(frontier)
+        seen_triplets = set()
+        triplets = []
+        for _ in range(hops):
+            next_frontier = []
+            for entity_key in frontier:
+                for triplet, neighbour_key in self.entity_triplets(
+                    entity_key, passage_ids
+                ):
+                    if tuple(triplet) not in seen_triplets:
+                        seen_triplets.add(tuple(triplet))
+                        triplets.append(triplet)
+                        if max_triplets is not None and len(triplets) >= max_triplets:
+                            return triplets
+                    if neighbour_key not in visited:
+                        visited.add(neighbour_key)
+                        next_frontier.append(neighbour_key)
+            frontier = next_frontier
+        return triplets
+
+    def shortest_path(
+        self, source: str, target: str, max_hops: int = 3
+    ) -> Optional[List[list]]:
+        """
+        Finds a shortest path between two entities, following edges in both directions.
+
+        Args:
+            source (str): The source entity text.
+            target (str): The target entity text.
+            max_hops (int): The maximum path length. Defaults to 3.
+
+        Returns:
+            Optional[list]: The triplets on the path from source to target, an empty list if both are the
+                            same entity, or None if there is no path within `max_hops`.
+        """
+        source_key = self.normalise_entity(source)
+        target_key = self.normalise_entity(target)
+        if source_key == target_key:
+            return []
+
+        parents = {source_key: None}
+        queue = deque([(source_key, 0)])
+        while queue:
+            entity_key, depth = queue.popleft()
+            if depth >= max_hops:
+                continue
+            for triplet, neighbour_key in self.entity_triplets(entity_key):
+                if neighbour_key in parents:
+                    continue
+                parents[neighbour_key] = (entity_key, triplet)
+                if neighbour_key == target_key:
+                    path = []
+                    while parents[neighbour_key] is not None:
+                        neighbour_key, triplet = parents[neighbour_key]
+                        path.append(triplet)
+                    return path[::-1]
+                queue.append((neighbour_key, depth + 1))
+        return None
+
+    def answer_neighbourhood_segments(
+        self,
+        answer_triplets: List[list],
+        hops: int = 1,
+        passage_ids: Optional[List[int]] = None,
+    ) -> List[list]:
+        """
+        Get the graph neighbourhood of the answer triplet entities, in the same format as the
+        reference triplets of `BioASQDataset.merge_relevant_reference_triplets`.
+
+        Args:
+            answer_triplets (list): The triplets extracted from the generated answer.
+            hops (int): The number of hops to expand. Defaults to 1.
+            passage_ids (list, optional): If given, only edges coming from these passages are used.
+
+        Returns:
+            list: A list of segments (each one a list of triplets) if `split_reference_triplets` is set,
+                  otherwise a single segment with all the neighbourhood triplets.
+        """
+        entities = [
+            element
+            for triplet in answer_triplets
+            if len(triplet) == 3
+            for element in (triplet[0], triplet[2])
+        ]
+        triplets = self.neighbourhood_triplets(
+            entities, hops=hops, passage_ids=passage_ids
+        )
+        if not self.config.model.fact_checker.split_reference_triplets:
+            return [triplets]
+
+        max_length = self.config.model.fact_checker.max_reference_triplet_length
+        return [
+            triplets[idx : idx + max_length]
+            for idx in range(0, len(triplets), max_length)
+        ]
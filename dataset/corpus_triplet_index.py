@@ -0,0 +1,206 @@
+from dataset.base_dataset import *
+from utils.entity_normalizer import get_entity_canonicaliser
+from utils.inverted_index import ShardedInvertedIndex, merge_postings, top_k_scores
+from utils.text_utils import tokenize
+from typing import Dict, List, Optional
+import numpy as np
+import threading
+
+
+class CorpusTripletIndex(BaseDataset):
+    """
+    CorpusTripletIndex is a corpus-wide triplet store with a sharded inverted index (token -> triplet ids) on top of it.
+    It is used by the open-world fact checking mode, where each answer triplet is checked against the most similar
+    triplets of the whole corpus instead of the triplets of the question's relevant passages only.
+
+    The index directory contains:
+        - triplets.jsonl : one [subject, relation, object, passage_id] per line, the line number is the triplet id
+        - offsets.npy    : the byte offset of each line, so a triplet is read with a single positional read
+        - the ShardedInvertedIndex files (token -> triplet ids)
+    Everything is built once from the corpus triplets and then only read lazily, shard by shard.
+
+    Methods:
+        search(triplet: list, top_k: int) -> List[list]:
+            Returns the top_k corpus triplets sharing the most (idf weighted) tokens with the given triplet.
+        candidate_segments(answer_triplets: list, top_k: int) -> list:
+            Returns the candidates of all the answer triplets, segmented for the fact checker.
+    """
+
+    def __init__(
+        self,
+        config: dict,
+        logger: logging.Logger,
+        corpus_triplets: Optional[Dict[int, list]] = None,
+    ):
+        super().__init__(config)
+        self.logger = logger
+        self.corpus_triplets = corpus_triplets
+        self.canonicaliser = get_entity_canonicaliser(config, logger)
+        canonical_suffix = "_canonical" if self.canonicaliser is not None else ""
+        self.index_path = f"{self.config.path.data.base}{self.config.path.data.corpus_triplet_index}_{self.config.experiment_setup.dataset}{canonical_suffix}"
+        self.inverted_index = ShardedInvertedIndex(
+            self.index_path,
+            num_shards=self.config.experiment_setup.corpus_index.num_shards,
+            max_cached_shards=self.config.experiment_setup.corpus_index.max_cached_shards,
+        )
+        self.max_postings_per_token = (
+            self.config.experiment_setup.corpus_index.max_postings_per_token
+        )
+        self._offsets = None
+        self._triplet_file = None
+        self._index_lock = threading.Lock()
+
+    @property
+    def offsets(self) -> np.ndarray:
+        if self._offsets is None:
+            self.get_index()
+            self._offsets = np.load(f"{self.index_path}/offsets.npy", mmap_mode="r")
+        return self._offsets
+
+    @property
+    def triplet_file(self):
+        if self._triplet_file is None:
+            self._triplet_file = open(f"{self.index_path}/triplets.jsonl", "rb")
+        return self._triplet_file
+
+    def get_index(self) -> ShardedInvertedIndex:
+        """
+        Get the inverted index, building it first if it does not exist on disk.
+        The lock makes concurrent first searches wait for a single build.
+        """
+        with self._index_lock:
+            if not self.inverted_index.exists():
+                self.logger.info("==> Corpus triplet index does not exist, building it")
+                self.build_index()
+        return self.inverted_index
+
+    def build_index(self) -> None:
+        """
+        Write the triplet store and build the sharded inverted index from the corpus triplets
+        (the ones given at init time, or the corpus triplet files on disk).
+        The triplet store is written first: the inverted index marks the whole index as complete when it is built.
+        """
+        corpus_triplets = self.corpus_triplets
+        if corpus_triplets is None:
+            corpus_triplet_dataset_path = f"{self.config.path.data.base}{self.config.path.data.corpus_triplet}_{self.config.experiment_setup.dataset}"
+            corpus_triplets = self.load_files_as_dataset(corpus_triplet_dataset_path)
+
+        os.makedirs(self.index_path, exist_ok=True)
+        offsets, offset = [], 0
+        with open(f"{self.index_path}/triplets.jsonl", "wb") as f:
+            for passage_id, triplets in corpus_triplets.items():
+                for triplet in triplets:
+                    if len(triplet) != 3:
+                        continue
+                    line = (
+                        json.dumps([*[str(e) for e in triplet], int(passage_id)]) + "\n"
+                    ).encode("utf-8")
+                    f.write(line)
+                    offsets.append(offset)
+                    offset += len(line)
+        offsets.append(offset)  # end of the last line
+        np.save(f"{self.index_path}/offsets.npy", np.array(offsets, dtype=np.int64))
+
+        def indexed_triplets():
+            with open(f"{self.index_path}/triplets.jsonl", "rb") as f:
+                for triplet_id, line in enumerate(f):
+                    yield triplet_id, self.tokenize_triplet(json.loads(line)[:3])
+
+        self.inverted_index.build(indexed_triplets())
+        self.logger.info(
+            f"==> Corpus triplet index built with {len(offsets) - 1} triplets"
+        )
+
+    def tokenize_triplet(self, triplet: List[str]) -> List[str]:
+        """
+        Tokenize a triplet for the index, after rewriting its entity aliases into their canonical forms
+        if entity normalisation is on, so that a triplet about "TTF1" finds the ones about "thyroid transcription factor 1".
+        """
+        triplet = [str(element) for element in triplet]
+        if self.canonicaliser is not None:
+            triplet = self.canonicaliser.canonicalise_triplet(triplet)
+        return tokenize(" ".join(triplet))
+
+    def get_triplet(self, triplet_id: int) -> list:
+        """
+        Read a triplet from the triplet store.
+
+        Returns:
+            list: [subject, relation, object, passage_id]
+        """
+        start, end = int(self.offsets[triplet_id]), int(self.offsets[triplet_id + 1])
+        return json.loads(os.pread(self.triplet_file.fileno(), end - start, start))
+
+    def search(self, triplet: List[str], top_k: int = 10) -> List[list]:
+        """
+        Find the corpus triplets sharing the most tokens with the given triplet, each shared token weighted by its idf.
+        Very frequent tokens (more than max_postings_per_token triplets) are skipped like stopwords, which keeps the
+        latency bounded on large corpora. Only if nothing else matches, they are used with their first
+        max_postings_per_token postings, i.e. their shortest triplets (see ShardedInvertedIndex).
+
+        Args:
+            triplet (list): The triplet to look up.
+            top_k (int): The number of candidates to return. Defaults to 10.
+
+        Returns:
+            List[list]: The candidates as [subject, relation, object, passage_id], best first.
+        """
+        index = self.get_index()
+        num_triplets = index.num_documents
+        postings = []
+        frequent_postings = []
+        for token in set(self.tokenize_triplet(triplet)):
+            doc_ids, _ = index.postings(token)
+            if len(doc_ids) == 0:
+                continue
+            idf = np.log(1.0 + num_triplets / len(doc_ids))
+            if len(doc_ids) > self.max_postings_per_token:
+                frequent_postings.append(
+                    (
+                        doc_ids[: self.max_postings_per_token],
+                        np.full(self.max_postings_per_token, idf),
+                    )
+                )
+            else:
+                postings.append((doc_ids, np.full(len(doc_ids), idf)))
+
+        if len(postings) == 0:
+            postings = frequent_postings
+        doc_ids, weights = merge_postings(postings)
+        return [
+            self.get_triplet(triplet_id)
+            for triplet_id, _ in top_k_scores(doc_ids, weights, top_k)
+        ]
+
+    def candidate_segments(
+        self, answer_triplets: List[list], top_k: int = 10
+    ) -> List[list]:
+        """
+        Look up every answer triplet in the index and merge the candidates, in the same format as the
+        reference triplets of `BioASQDataset.merge_relevant_reference_triplets`.
+
+        Args:
+            answer_triplets (list): The triplets extracted from the generated answer.
+            top_k (int): The number of candidates per answer triplet. Defaults to 10.
+
+        Returns:
+            list: A list of segments (each one a list of triplets) if `split_reference_triplets` is set,
+                  otherwise a single segment with all the candidates.
+        """
+        seen = set()
+        candidates = []
+        for answer_triplet in answer_triplets:
+            for candidate in self.search(answer_triplet, top_k=top_k):
+                triplet = candidate[:3]
+                if tuple(triplet) not in seen:
+                    seen.add(tuple(triplet))
+                    candidates.append(triplet)
+
+        if not self.config.model.fact_checker.split_reference_triplets:
+            return [candidates]
+
+        max_length = self.config.model.fact_checker.max_reference_triplet_length
+        return [
+            candidates[idx : idx + max_length]
+            for idx in range(0, len(candidates), max_length)
+        ]
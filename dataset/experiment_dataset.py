@@ -1,5 +1,7 @@
 from dataset.hallucination_dataset import *
 from dataset.bioasq_dataset import *
+from dataset.corpus_graph import CorpusGraph
+from dataset.corpus_triplet_index import CorpusTripletIndex
 from  typing import Optional, Dict
 
 class ExperimentDataset(BioASQDataset, HallucinationDataset):
@@ -19,6 +21,9 @@ class ExperimentDataset(BioASQDataset, HallucinationDataset):
         get_corpus_triplets():
             Returns the corpus triplets.
 
+        get_corpus_graph(corpus_triplets):
+            Returns the knowledge graph index over the corpus triplets. The graph is loaded lazily at the first query.
+
         hlcntn_data_row_by_id(id, save_data=True):
             Retrieves a hallucination data row by its ID. If the data does not exist, it generates the data,
             saves it if specified, and then returns it.
@@ -30,7 +35,11 @@ class ExperimentDataset(BioASQDataset, HallucinationDataset):
         HallucinationDataset.__init__(self, config, logger)
         self.hlcntn_dataset = self.get_hlcntn_dataset()
         # Graph can be represented as set of triplets
-        # self.corpus_graph = self.get_corpus_graph(self.corpus_triplets)
+        self.corpus_graph = self.get_corpus_graph(self.corpus_triplets)
+        # Corpus-wide triplet store for the open-world fact checking, also loaded lazily
+        self.corpus_triplet_index = CorpusTripletIndex(
+            config, logger, corpus_triplets=self.corpus_triplets
+        )
 
     def get_dataset(self):
         return self.qa_dataset
@@ -38,6 +47,19 @@ class ExperimentDataset(BioASQDataset, HallucinationDataset):
     def get_corpus_triplets(self):
         return self.corpus_triplets
 
+    def get_corpus_graph(self, corpus_triplets: dict) -> CorpusGraph:
+        """
+        Get the knowledge graph index over the corpus triplets.
+        Nothing is loaded here, the graph is read from disk (or built and saved) at its first query.
+
+        Args:
+            corpus_triplets (dict): A dictionary where keys are passage IDs and values are lists of triplets.
+
+        Returns:
+            CorpusGraph: The lazily loaded corpus graph.
+        """
+        return CorpusGraph(self.config, self.logger, corpus_triplets=corpus_triplets)
+
     def hlcntn_data_row_by_id(self, idx: int, save_data=True) -> Optional[Dict]:
         """
         Retrieve or generate hallucination data for a given ID.
@@ -1,6 +1,6 @@
 from dataset.base_dataset import *
 from utils.utils import *
-from model import *
+from model import model_name_class_mapping
 
 
 class HallucinationDataset(BaseDataset):
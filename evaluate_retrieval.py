@@ -0,0 +1,69 @@
+import json
+import time
+
+import numpy as np
+
+from dataset import *
+from main import *
+from utils.utils import ExperimentLogger
+
+"""
+Measures the BM25 retrieval recall against the gold relevant_passage_ids of the QA dataset, and the retrieval latency.
+
+    python evaluate_retrieval.py -e bm25_retrieval
+
+The metrics are saved to results/{experiment_name}/retrieval_metrics.json.
+"""
+
+RECALL_AT = [1, 5, 10, 20, 50]
+
+if __name__ == "__main__":
+    log_path = f"{config.path.experiment_result.base}{config.experiment_name}/"
+    logger = ExperimentLogger("", log_path=log_path, logger_level=config.logger_level)
+    dataset = BioASQDataset(config, logger)
+    retriever = BM25Retriever(config, logger, corpus_dataset=dataset.corpus_dataset)
+    retriever.get_index()
+    retriever.retrieve("warm up")
+
+    qa_dataset = dataset.qa_dataset
+    if "num_test_samples" in config:
+        qa_dataset = qa_dataset[: config.num_test_samples]
+
+    recalls = {k: [] for k in RECALL_AT}
+    reciprocal_ranks = []
+    latencies = []
+    for data_row in qa_dataset:
+        gold_ids = set(data_row["relevant_passage_ids"])
+        if len(gold_ids) == 0:
+            continue
+        start = time.perf_counter()
+        retrieved_ids = retriever.retrieve_passage_ids(
+            data_row["question"], top_k=max(RECALL_AT)
+        )
+        latencies.append(time.perf_counter() - start)
+
+        for k in RECALL_AT:
+            recalls[k].append(
+                len(gold_ids.intersection(retrieved_ids[:k])) / len(gold_ids)
+            )
+        ranks = [rank for rank, idx in enumerate(retrieved_ids, 1) if idx in gold_ids]
+        reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+
+    latencies_ms = np.array(latencies) * 1000
+    metrics = {
+        "num_questions": len(latencies),
+        **{f"recall@{k}": float(np.mean(values)) for k, values in recalls.items()},
+        f"mrr@{max(RECALL_AT)}": float(np.mean(reciprocal_ranks)),
+        "latency_ms_mean": float(latencies_ms.mean()),
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)),
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)),
+    }
+    for name, value in metrics.items():
+        logger.info(
+            f"==> {name}: {value:.4f}"
+            if isinstance(value, float)
+            else f"==> {name}: {value}"
+        )
+
+    with open(f"{log_path}retrieval_metrics.json", "w") as f:
+        json.dump(metrics, f, indent=4)
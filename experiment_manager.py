@@ -1,8 +1,19 @@
 from dataset import *
 from rag.llm_fact_checking_system import *
+from rag.pipeline_executor import Stage, StagedPipelineExecutor, StageError
+from utils import scoring
+from pipeline.cassette import get_cassette
+from pipeline.rate_limiter import get_rate_limiter
+from pipeline.usage import get_usage_ledger, sample_scope
+from utils import sharding
+from utils.tracing import activate_tracer, current_span, get_tracer, span
+from utils.profiling import get_profiler, profile_sample
+from utils.utils import event_extra
+from utils.metrics_endpoint import live_metrics, start_metrics_endpoint
 from easydict import EasyDict as edict
 import json
 
+
 class ExperimentManager:
     """
     ExperimentManager is a temporal name for this class, will figure out a better name later.
@@ -13,9 +24,16 @@ class ExperimentManager:
 
     def __init__(self, config: dict, logger: logging.Logger):
         self.config = config
-        self.model = LLMFactCheckingSystem(config, logger)
         self.dataset = ExperimentDataset(config, logger)
+        self.model = LLMFactCheckingSystem(
+            config,
+            logger,
+            corpus_graph=self.dataset.corpus_graph,
+            corpus_triplet_index=self.dataset.corpus_triplet_index,
+        )
         self.logger = logger
+        self.usage = get_usage_ledger(config)
+        self.profiler = get_profiler(config)
 
     def run_experiment(self, save_result=True, evalute_hlcntn=True, do_reprompt=False):
         """
@@ -36,8 +54,40 @@ class ExperimentManager:
             - If "do_reprompt" is True and the precision is below a threshold, reprompting is performed.
             - The results and metrics are saved if "save_result" is True.
             - The function prints the start and end of the experiment.
+            - With experiment_setup.tracing.enabled, the spans of the run (samples, dataflow stages, components,
+              fact checking segments and LLM calls) are saved as a trace file in the experiment directory.
+            - With --profile (experiment_setup.profiling.samples), the selected samples are profiled, and the
+              per-sample and aggregated profiles are saved in the experiment directory (see utils.profiling).
         """
+        metrics_url = start_metrics_endpoint(self.config)
+        if metrics_url is not None:
+            live_metrics().add_collector(
+                f"experiment:{self.config.experiment_name}", self.collect_metrics
+            )
+            self.logger.info(
+                "==> Metrics endpoint: %s", metrics_url, extra={"progress": True}
+            )
+        tracer = get_tracer(self.config)
+        with activate_tracer(tracer), span(
+            "run", "run", experiment=self.config.experiment_name
+        ):
+            result = self.evaluate_experiment(save_result, evalute_hlcntn, do_reprompt)
+        if tracer is not None:
+            self.logger.info(
+                "==> Trace saved to %s", tracer.save(), extra={"progress": True}
+            )
+        if self.profiler is not None:
+            self.logger.info(
+                "==> Profiles saved to %s",
+                self.profiler.save(),
+                extra={"progress": True},
+            )
+        return result
 
+    def evaluate_experiment(self, save_result, evalute_hlcntn, do_reprompt):
+        """
+        Iterate over the dataset, make and evaluate the predictions (see `run_experiment`).
+        """
         prediction_result = []
         if "num_test_samples" in self.config:
             num_samples = self.config.num_test_samples
@@ -45,36 +95,59 @@ class ExperimentManager:
             num_samples = len(self.dataset.qa_dataset)
 
         self.logger.info(
-            f"Experiment settings are num_samples: {num_samples}, save: {save_result}, evalute_hlcntn: {evalute_hlcntn}, do_reprompt: {do_reprompt}"
+            "Experiment settings are num_samples: %s, save: %s, evalute_hlcntn: %s, do_reprompt: %s",
+            num_samples,
+            save_result,
+            evalute_hlcntn,
+            do_reprompt,
+            extra=event_extra(
+                "experiment_started",
+                progress=True,
+                experiment=self.config.experiment_name,
+                num_samples=num_samples,
+                save_result=save_result,
+                evalute_hlcntn=evalute_hlcntn,
+                do_reprompt=do_reprompt,
+            ),
         )
-        self.logger.debug(f"All Experiment config: {self.config}")
+        self.logger.debug("All Experiment config: %s", self.config)
         self.logger.info(
             "==================================== Experiment started ======================================="
         )
-        for idx in range(num_samples):
-            if hasattr(self.config, "sample_idx"):
-                if idx != self.config.sample_idx:
-                    continue
-
-            self.logger.info(f"=== Current question index: {idx + 1} ")
-
-            question_data, output = self.evaluate_non_hlcntn_sample(idx)
+        sample_indices = self.sample_indices(num_samples)
+        # the metrics of no sample, e.g. of a shard without any of the evaluated question indices
+        metrics = self.calculate_precision_stats(prediction_result)
+        pipelined_outputs = {}
+        if self.config.experiment_setup.pipeline.enabled:
+            pipelined_outputs = self.pipelined_forward(sample_indices)
+        for position, idx in enumerate(sample_indices):
+            self.logger.info("=== Current question index: %d ", idx + 1)
+
+            with span("sample", "sample", idx=idx), sample_scope(
+                f"sample_{idx}"
+            ), profile_sample(self.profiler, idx, f"sample_{idx}"):
+                question_data, output = self.evaluate_non_hlcntn_sample(
+                    idx, output=pipelined_outputs.get(idx)
+                )
 
             if output is None:
+                live_metrics().inc(
+                    "fact_checking_samples_skipped_total",
+                    experiment=self.config.experiment_name,
+                    kind="original",
+                )
+                self.logger.warning(
+                    "[original %d/%d] question %d skipped",
+                    position + 1,
+                    len(sample_indices),
+                    idx + 1,
+                    extra=event_extra("sample_skipped", kind="original", idx=idx),
+                )
                 continue
             output.update(
                 {
-                    "precision": (
-                        sum(
-                            [
-                                i
-                                for i in list(
-                                    output["fact_check_prediction_binary"].values()
-                                )
-                                if type(i) == bool
-                            ]
-                        )
-                        / len(output["fact_check_prediction_binary"])
+                    "precision": scoring.record_precision(
+                        output["fact_check_prediction_binary"]
                     ),
                     "question": question_data["question"],
                     "idx": idx,
@@ -92,31 +165,38 @@ class ExperimentManager:
                     config=self.config,
                     result_type="original",
                 )
-            tabs = "\t\t\t\t\t\t\t\t\t"
-            answer_triplet_string = "".join(
-                [
-                    f"\n{tabs}   - {idx}: {triplet}"
-                    for idx, triplet in enumerate(output["answer_triplets"])
-                ]
-            )
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.log_sample_details(question_data, output)
+            self.update_sample_metrics("original", metrics)
+            self.logger.info("==> Current precision: %s", metrics["precision"])
             self.logger.info(
-                f"{tabs} Question: {question_data['question']}"
-                f"\n{tabs} Answer: {output['generated_answer']} "
-                f"\n{tabs} Reference documents: {output['reference_documents']} "
-                f"\n{tabs} Number of answer triplets: {len(output['answer_triplets'])} "
-                f"\n{tabs} Answer triplets: {answer_triplet_string} "
-                f"\n{tabs} Fact checking output: {output['fact_check_prediction_binary']}"
-            )
-            self.logger.info(f"==> Current precision: {metrics['precision']}")
-            self.logger.info(
-                f"==> Current non-hallucinated triplets (predicted as true/all): {metrics['num_non_hlcntn_triplets_correctly_predicted']}/{metrics['num_non_hlcntn_triplets']}"
+                "==> Current non-hallucinated triplets (predicted as true/all): %s/%s",
+                metrics["num_non_hlcntn_triplets_correctly_predicted"],
+                metrics["num_non_hlcntn_triplets"],
+            )
+            self.log_usage(f"sample_{idx}")
+            self.log_progress(
+                "original", position, len(sample_indices), idx, output, metrics
             )
             self.logger.info(
                 "================================================================================================"
             )
+        if save_result and not prediction_result:
+            # saved anyway, so that the shard is complete for merge_shards.py
+            self.save_experiment_result(
+                metrics, prediction_result, config=self.config, result_type="original"
+            )
         self.logger.info(
             "==================================== Experiment ended =========================================="
         )
+        self.logger.info(
+            "Experiment ended: precision %s over %d samples",
+            metrics["precision"],
+            len(prediction_result),
+            extra=event_extra(
+                "experiment_ended", progress=True, kind="original", metrics=metrics
+            ),
+        )
 
         if evalute_hlcntn:
             hlcntn_metrics = self.evaluate_hlcntn_dataset(
@@ -126,72 +206,339 @@ class ExperimentManager:
             )
         else:
             hlcntn_metrics = None
+
+        triplet_generator = self.model.triplet_generator
+        if getattr(triplet_generator, "sentence_cache", None) is not None:
+            self.logger.info(
+                f"==> Sentence cache: {triplet_generator.sentence_cache_stats['extracted_sentences']}"
+                f"/{triplet_generator.sentence_cache_stats['sentences']} sentences extracted, "
+                f"{triplet_generator.token_usage['calls']} triplet generation calls"
+            )
+        artifact_store = self.model.artifact_store
+        if artifact_store is not None:
+            self.logger.info(
+                f"==> Artifact store: {artifact_store.reused} stage outputs reused, {artifact_store.computed} computed"
+            )
+        rate_limiter = get_rate_limiter(self.config)
+        if rate_limiter is not None:
+            rate_limiter_metrics = rate_limiter.metrics()
+            self.logger.info(
+                f"==> Rate limiter: {rate_limiter_metrics['requests']} requests, "
+                f"{rate_limiter_metrics['rate_limited']} rate limited (429), "
+                f"{rate_limiter_metrics['throttle_seconds']:.1f}s throttled, "
+                f"concurrency {rate_limiter_metrics['concurrency']:.1f} "
+                f"(max in flight {rate_limiter_metrics['max_in_flight']})"
+            )
+        for component, usage in sorted(self.usage.components.items()):
+            self.logger.info(
+                f"==> LLM usage of {component}: {usage['calls']} calls, {usage['input_tokens']} input "
+                f"and {usage['output_tokens']} output tokens, ${usage['cost_usd']:.4f}"
+            )
+        cassette = get_cassette(self.config)
+        if cassette is not None:
+            self.logger.info(
+                f"==> Cassette {cassette.path}: {cassette.recorded} LLM calls recorded, {cassette.replayed} replayed"
+            )
         return metrics, hlcntn_metrics
 
-    def evaluate_non_hlcntn_sample(self, idx, retry_num=0):
+    def log_sample_details(self, question_data, output):
+        """
+        Log the whole sample, at DEBUG level.
+        """
+        tabs = "\t\t\t\t\t\t\t\t\t"
+        answer_triplet_string = "".join(
+            [
+                f"\n{tabs}   - {idx}: {triplet}"
+                for idx, triplet in enumerate(output["answer_triplets"])
+            ]
+        )
+        self.logger.debug(
+            f"{tabs} Question: {question_data['question']}"
+            f"\n{tabs} Answer: {output['generated_answer']} "
+            f"\n{tabs} Reference documents: {output['reference_documents']} "
+            f"\n{tabs} Number of answer triplets: {len(output['answer_triplets'])} "
+            f"\n{tabs} Answer triplets: {answer_triplet_string} "
+            f"\n{tabs} Fact checking output: {output['fact_check_prediction_binary']}"
+        )
+
+    def log_progress(
+        self,
+        kind: str,
+        position: int,
+        num_samples: int,
+        idx: int,
+        output: dict,
+        metrics: dict,
+    ):
+        """
+        Log the compact progress line of a sample of kind "original" or "hlcntn" (the console of the "progress"
+        logging mode), which is also its "sample_done" event.
+        """
+        sample_usage = self.usage.sample_usage(
+            f"sample_{idx}" if kind == "original" else f"hlcntn_sample_{idx}"
+        )
+        fields = {
+            "kind": kind,
+            "idx": idx,
+            "precision": output["precision"],
+            "num_triplets": len(output["fact_check_prediction_binary"]),
+            "running_precision": metrics["precision"],
+            "tokens": sample_usage["input_tokens"] + sample_usage["output_tokens"],
+            "cost_usd": sample_usage["cost_usd"],
+        }
+        message = "[%s %d/%d] question %d: precision %.3f, running precision %.3f"
+        args = [
+            kind,
+            position + 1,
+            num_samples,
+            idx + 1,
+            output["precision"],
+            metrics["precision"],
+        ]
+        if "specificity" in metrics:
+            fields["running_specificity"] = metrics["specificity"]
+            message += ", running specificity %.3f"
+            args.append(metrics["specificity"])
+        self.logger.info(
+            message + ", %d tokens, $%.4f",
+            *args,
+            fields["tokens"],
+            fields["cost_usd"],
+            extra=event_extra("sample_done", progress=True, **fields),
+        )
+
+    def update_sample_metrics(self, kind: str, metrics: dict):
+        """
+        Update the live metrics (see utils/metrics_endpoint.py) after a sample of kind "original" or "hlcntn".
+        """
+        registry = live_metrics()
+        labels = {"experiment": self.config.experiment_name, "kind": kind}
+        registry.inc("fact_checking_samples_total", **labels)
+        registry.set("fact_checking_precision", metrics["precision"], **labels)
+        if "specificity" in metrics:
+            registry.set(
+                "fact_checking_specificity",
+                metrics["specificity"],
+                experiment=self.config.experiment_name,
+            )
+
+    def collect_metrics(self) -> list:
+        """
+        The cache and rate limiter metrics of the experiment, read when the metrics endpoint is scraped.
+
+        Returns:
+            list: (name, labels, value) triples.
+        """
+        experiment = self.config.experiment_name
+        caches = {}
+        memo = self.model.dataflow.memo
+        if memo is not None:
+            caches["dataflow_memo"] = (memo.hits, memo.misses)
+        if self.model.artifact_store is not None:
+            caches["artifact_store"] = (
+                self.model.artifact_store.reused,
+                self.model.artifact_store.computed,
+            )
+        triplet_generator = self.model.triplet_generator
+        if getattr(triplet_generator, "sentence_cache", None) is not None:
+            stats = triplet_generator.sentence_cache_stats
+            caches["sentence_cache"] = (
+                stats["sentences"] - stats["extracted_sentences"],
+                stats["extracted_sentences"],
+            )
+        samples = []
+        for cache, (hits, misses) in caches.items():
+            samples.append(
+                (
+                    "cache_lookups_total",
+                    {"experiment": experiment, "cache": cache, "result": "hit"},
+                    hits,
+                )
+            )
+            samples.append(
+                (
+                    "cache_lookups_total",
+                    {"experiment": experiment, "cache": cache, "result": "miss"},
+                    misses,
+                )
+            )
+        rate_limiter = get_rate_limiter(self.config)
+        if rate_limiter is not None:
+            rate_limiter_metrics = rate_limiter.metrics()
+            samples.append(
+                ("rate_limiter_concurrency", {}, rate_limiter_metrics["concurrency"])
+            )
+            samples.append(
+                (
+                    "rate_limiter_rate_limited_total",
+                    {},
+                    rate_limiter_metrics["rate_limited"],
+                )
+            )
+        return samples
+
+    def log_usage(self, sample: str):
+        """
+        Log the LLM tokens and cost of a sample, and the running throughput and cost of the experiment.
+        """
+        sample_usage = self.usage.sample_usage(sample)
+        self.logger.info(
+            "==> LLM usage: %d tokens, $%.4f for this sample, %.0f tokens/sec, $%.4f/sample, $%.4f in total",
+            sample_usage["input_tokens"] + sample_usage["output_tokens"],
+            sample_usage["cost_usd"],
+            self.usage.tokens_per_second(),
+            self.usage.cost_per_sample(),
+            self.usage.total["cost_usd"],
+        )
+
+    def sample_indices(self, num_samples: int) -> list:
+        """
+        The question indices evaluated by this run: the first num_samples ones, or only config.sample_idx if it is
+        set, restricted to the shard of config.shard if it is set (see utils.sharding).
+        """
+        return sharding.sample_indices(self.config, num_samples)
+
+    def pipelined_forward(self, sample_indices: list) -> dict:
+        """
+        Run the forward pass of many samples with a staged executor: answer generation, triplet generation and
+        fact checking each have their own workers (config.experiment_setup.pipeline.concurrency) and a bounded input
+        queue (queue_size, with the backpressure policy), so that the answer of a sample is generated while the
+        triplets of the previous one are fact checked. The stage metrics are logged at the end.
+
+        Args:
+            sample_indices (list): The indices of the samples.
+
+        Returns:
+            dict: sample index -> output of self.model.forward, for the samples that did not fail.
+                  The other samples are run again (sequentially) by evaluate_non_hlcntn_sample.
+        """
+        pipeline_config = self.config.experiment_setup.pipeline
+
+        def sample_stage(stage_fn):
+            # the items are (idx, value) pairs, so that the LLM usage of a stage is accounted to its sample
+            def run_stage(item):
+                idx, value = item
+                with sample_scope(f"sample_{idx}"), profile_sample(
+                    self.profiler, idx, f"sample_{idx}"
+                ):
+                    return idx, stage_fn(value)
+
+            return run_stage
+
+        executor = StagedPipelineExecutor(
+            [
+                Stage(
+                    name,
+                    sample_stage(stage_fn),
+                    concurrency=pipeline_config.concurrency[name],
+                    queue_size=pipeline_config.queue_size,
+                    backpressure=pipeline_config.backpressure,
+                )
+                for name, stage_fn in self.model.forward_stages()
+            ],
+            logger=self.logger,
+        )
+        outputs = executor.run(
+            (idx, self.dataset.data_row_by_id(idx)) for idx in sample_indices
+        )
+        executor.log_metrics()
+        return {
+            idx: output[1]
+            for idx, output in zip(sample_indices, outputs)
+            if not isinstance(output, StageError)
+        }
+
+    def evaluate_non_hlcntn_sample(self, idx, retry_num=0, output=None):
+        """
+        Run (or validate the given output of) the forward pass of a sample, retrying up to system_retry times
+        while the output is not usable (see non_hlcntn_output_error).
+        """
 
         question_data = self.dataset.data_row_by_id(idx)
 
-        # todo : change filtering logic to a method
         if retry_num >= self.config.experiment_setup.system_retry:
             self.logger.warning(
                 "=============================================================="
             )
             return question_data, None
 
-        output = self.model.forward(question_data)
+        if output is None:
+            # a retry must not reuse the memoised outputs of the rejected attempt
+            output = self.model.forward(question_data, use_memo=retry_num == 0)
+
+        error = self.non_hlcntn_output_error(question_data, output)
+        if error is not None:
+            reason, message = error
+            self.logger.warning("%s Skipping it.", message)
+            self.logger.debug("Rejected output: %s", output)
 
-        if len(output["fact_check_prediction_binary"]) == 0:
             self.logger.warning(
-                f"No fact checking could be extracted for: '{question_data['question']}'. Skipping it."
+                "==>Retrying",
+                extra=event_extra(
+                    "retry",
+                    kind="original",
+                    idx=idx,
+                    retry_num=retry_num + 1,
+                    reason=reason,
+                ),
+            )
+            current_span().add_event(
+                "retry", retry_num=retry_num + 1, reason=reason, message=message
+            )
+            live_metrics().inc(
+                "fact_checking_retries_total",
+                experiment=self.config.experiment_name,
+                kind="original",
+                reason=reason,
             )
-            self.logger.debug(f"Empty fact check prediction: {output}")
-
-            self.logger.warning("==>Retrying")
             return self.evaluate_non_hlcntn_sample(idx, retry_num + 1)
 
+        return question_data, output
+
+    def non_hlcntn_output_error(self, question_data, output):
+        """
+        Check that the output of the forward pass of a sample can be evaluated.
+
+        Returns:
+            tuple or None: (reason, message) of why the output is rejected, or None if it is valid. The reason is a
+                           short identifier (e.g. for metrics), the message is for the log.
+        """
+        if len(output["fact_check_prediction_binary"]) == 0:
+            return (
+                "no_fact_checking",
+                f"No fact checking could be extracted for: '{question_data['question']}'.",
+            )
+
         elif len(output["answer_triplets"]) != len(
             output["fact_check_prediction_binary"]
         ):
-            self.logger.error(
-                f"Number of predictions doesn't match the one for triplets for {question_data['question']}. Skipping"
+            return (
+                "prediction_length_mismatch",
+                f"Number of predictions doesn't match the one for triplets for '{question_data['question']}'.",
             )
-            self.logger.debug(f"Length mismatch output: {output}")
-
-            self.logger.warning("==>Retrying")
-            return self.evaluate_non_hlcntn_sample(idx, retry_num + 1)
 
         elif any([i == "" for i in output["answer_triplets"]]):
-            self.logger.warning(
-                f"Empty triplets exist in the answer of the question: '{question_data['question']}'. Skipping it."
+            return (
+                "empty_answer_triplet",
+                f"Empty triplets exist in the answer of the question: '{question_data['question']}'.",
             )
-            self.logger.debug(f"Empty answer triplets: {output}")
-
-            self.logger.warning("==>Retrying")
-            return self.evaluate_non_hlcntn_sample(idx, retry_num + 1)
 
         elif any([i == "" for i in question_data["reference_triplets"]]):
-            self.logger.warning(
-                f"Empty triplets exist in the reference passages of the question: '{question_data['question']}'. Skipping it."
+            return (
+                "empty_reference_triplet",
+                f"Empty triplets exist in the reference passages of the question: '{question_data['question']}'.",
             )
-            self.logger.debug(f"Empty reference triplets: {question_data}")
-
-            self.logger.warning("==>Retrying")
-            return self.evaluate_non_hlcntn_sample(idx, retry_num + 1)
 
         if (
             output["generated_answer"].startswith("There is no evidence")
             and len(output["fact_check_prediction_binary"]) == 1
         ):
-            self.logger.warning(
-                f"Answer generator found no evidence for question: '{question_data['question']}'. Skipping it."
+            return (
+                "no_evidence",
+                f"Answer generator found no evidence for question: '{question_data['question']}'.",
             )
-            self.logger.debug(f"No evidence answer: {output}")
 
-            self.logger.warning("==>Retrying")
-            return self.evaluate_non_hlcntn_sample(idx, retry_num + 1)
-
-        return question_data, output
+        return None
 
     def evaluate_hlcntn_dataset(
         self, save_result=True, do_reprompt=False, num_samples=None
@@ -224,24 +571,37 @@ class ExperimentManager:
         self.logger.info(
             "================================= Hallucination experiment started ============================="
         )
-        for idx in range(num_samples):
-
-            if hasattr(self.config, "sample_idx"):
-                if idx != self.config.sample_idx:
-                    continue
-
-            self.logger.info(f"=== Current question index: {idx + 1} ")
-
-            data, hlcntn_data, output = self.evaluate_hlcntn_sample(idx)
+        sample_indices = self.sample_indices(num_samples)
+        # the metrics of no sample, e.g. of a shard without any of the evaluated question indices
+        hlcntn_metrics = self.calculate_precision_stats(prediction_result)
+        hlcntn_metrics.update(self.calculate_hlcntn_metrics(prediction_result))
+        for position, idx in enumerate(sample_indices):
+            self.logger.info("=== Current question index: %d ", idx + 1)
+
+            with span("hlcntn_sample", "sample", idx=idx), sample_scope(
+                f"hlcntn_sample_{idx}"
+            ), profile_sample(self.profiler, idx, f"hlcntn_sample_{idx}"):
+                data, hlcntn_data, output = self.evaluate_hlcntn_sample(idx)
             if output is None:
+                live_metrics().inc(
+                    "fact_checking_samples_skipped_total",
+                    experiment=self.config.experiment_name,
+                    kind="hlcntn",
+                )
+                self.logger.warning(
+                    "[hlcntn %d/%d] question %d skipped",
+                    position + 1,
+                    len(sample_indices),
+                    idx + 1,
+                    extra=event_extra("sample_skipped", kind="hlcntn", idx=idx),
+                )
                 continue
 
             output.update(
                 {
-                    "precision": sum(
-                        list(output["fact_check_prediction_binary"].values())
-                    )
-                    / len(output["fact_check_prediction_binary"]),
+                    "precision": scoring.record_precision(
+                        output["fact_check_prediction_binary"]
+                    ),
                     "reference_documents": data["reference_documents"],
                     "reference_triplets": data["reference_triplets"],
                     "question": data["question"],
@@ -264,7 +624,10 @@ class ExperimentManager:
                 do_reprompt
             ):  # todo : think reprompter should be elsewhere. this is experiment pipeline but repropter looks more related to model not experiment
                 if output["precision"] < self.config.model.reprompter.threshold:
-                    reprompt_output = self.model.reprompter_forward(data, output)
+                    with sample_scope(f"hlcntn_sample_{idx}"), profile_sample(
+                        self.profiler, idx, f"hlcntn_sample_{idx}"
+                    ):
+                        reprompt_output = self.model.reprompter_forward(data, output)
                     if (
                         len(reprompt_output["reprompt_fact_check_prediction_binary"])
                         > 0
@@ -272,14 +635,9 @@ class ExperimentManager:
                         output.update(reprompt_output)
                         output.update(
                             {
-                                "reprompt_precision": sum(
-                                    list(
-                                        output[
-                                            "reprompt_fact_check_prediction_binary"
-                                        ].values()
-                                    )
+                                "reprompt_precision": scoring.record_precision(
+                                    output["reprompt_fact_check_prediction_binary"]
                                 )
-                                / len(output["reprompt_fact_check_prediction_binary"])
                             }
                         )
             prediction_result.append(output)
@@ -295,46 +653,79 @@ class ExperimentManager:
                     result_type="hlcntn",
                 )
 
-            tabs = "\t\t\t\t\t\t\t\t\t"
-            hallucination_indexes_as_dict = {
-                idx: value for idx, value in enumerate(output["hlcntn_triplet_index"])
-            }
-            answer_triplet_string = "".join(
-                [
-                    f"\n{tabs}   - {idx}: {triplet}"
-                    for idx, triplet in enumerate(output["answer_triplets"])
-                ]
-            )
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.log_hlcntn_sample_details(data, output)
+            self.update_sample_metrics("hlcntn", hlcntn_metrics)
+            self.logger.info("==> Current precision: %s", hlcntn_metrics["precision"])
             self.logger.info(
-                f"{tabs} Question: {data['question']}"
-                f"\n{tabs} Non-hallucinated Answer: {output['generated_non_hlcntn_answer'].strip()}"
-                f"\n{tabs} Hallucinated Answer: {output['generated_hlcntn_answer'].strip()} "
-                f"\n{tabs} Reference documents: {output['reference_documents']} "
-                f"\n{tabs} Number of answer triplets: {len(output['hlcntn_triplets'])}"
-                f"\n{tabs} Number of hallucinated triplets: {len([1 for o in output['hlcntn_triplet_index'] if o is True])}"
-                f"\n{tabs} Hallucinated answer triplets: {output['hlcntn_triplets']}"
-                f"\n{tabs} Answer triplets: {answer_triplet_string}"
-                f"\n{tabs} Hallucinated indexes: {hallucination_indexes_as_dict}"
-                f"\n{tabs} Fact checking output: {output['fact_check_prediction_binary']}"
-            )
-            self.logger.info(f"==> Current precision: {hlcntn_metrics['precision']}")
-            self.logger.info(
-                f"==> Current specificity: {hlcntn_metrics['specificity']}"
+                "==> Current specificity: %s", hlcntn_metrics["specificity"]
             )
             self.logger.info(
-                f"==> Current non-hallucinated triplets (correctly predicted as true/all): {hlcntn_metrics['num_non_hlcntn_triplets_correctly_predicted']}/{hlcntn_metrics['num_non_hlcntn_triplets']}"
+                "==> Current non-hallucinated triplets (correctly predicted as true/all): %s/%s",
+                hlcntn_metrics["num_non_hlcntn_triplets_correctly_predicted"],
+                hlcntn_metrics["num_non_hlcntn_triplets"],
             )
             self.logger.info(
-                f"==> Current hallucinated triplets (correctly predicted as hallucinations/all): {hlcntn_metrics['num_hlcntn_triplets_correctly_predicted']}/{hlcntn_metrics['num_hlcntn_triplets']}"
+                "==> Current hallucinated triplets (correctly predicted as hallucinations/all): %s/%s",
+                hlcntn_metrics["num_hlcntn_triplets_correctly_predicted"],
+                hlcntn_metrics["num_hlcntn_triplets"],
+            )
+            self.log_usage(f"hlcntn_sample_{idx}")
+            self.log_progress(
+                "hlcntn", position, len(sample_indices), idx, output, hlcntn_metrics
             )
             self.logger.info(
                 "========================================================================================="
             )
+        if save_result and not prediction_result:
+            # saved anyway, so that the shard is complete for merge_shards.py
+            self.save_experiment_result(
+                hlcntn_metrics,
+                prediction_result,
+                config=self.config,
+                result_type="hlcntn",
+            )
         self.logger.info(
             "================================= Hallucination experiment ended ========================"
         )
+        self.logger.info(
+            "Hallucination experiment ended: precision %s, specificity %s over %d samples",
+            hlcntn_metrics["precision"],
+            hlcntn_metrics["specificity"],
+            len(prediction_result),
+            extra=event_extra(
+                "experiment_ended", progress=True, kind="hlcntn", metrics=hlcntn_metrics
+            ),
+        )
         return hlcntn_metrics
 
+    def log_hlcntn_sample_details(self, data, output):
+        """
+        Log the whole hallucination sample, at DEBUG level.
+        """
+        tabs = "\t\t\t\t\t\t\t\t\t"
+        hallucination_indexes_as_dict = {
+            idx: value for idx, value in enumerate(output["hlcntn_triplet_index"])
+        }
+        answer_triplet_string = "".join(
+            [
+                f"\n{tabs}   - {idx}: {triplet}"
+                for idx, triplet in enumerate(output["answer_triplets"])
+            ]
+        )
+        self.logger.debug(
+            f"{tabs} Question: {data['question']}"
+            f"\n{tabs} Non-hallucinated Answer: {output['generated_non_hlcntn_answer'].strip()}"
+            f"\n{tabs} Hallucinated Answer: {output['generated_hlcntn_answer'].strip()} "
+            f"\n{tabs} Reference documents: {output['reference_documents']} "
+            f"\n{tabs} Number of answer triplets: {len(output['hlcntn_triplets'])}"
+            f"\n{tabs} Number of hallucinated triplets: {len([1 for o in output['hlcntn_triplet_index'] if o is True])}"
+            f"\n{tabs} Hallucinated answer triplets: {output['hlcntn_triplets']}"
+            f"\n{tabs} Answer triplets: {answer_triplet_string}"
+            f"\n{tabs} Hallucinated indexes: {hallucination_indexes_as_dict}"
+            f"\n{tabs} Fact checking output: {output['fact_check_prediction_binary']}"
+        )
+
     def evaluate_hlcntn_sample(self, idx, retry_num=0):
         #####
         data = self.dataset.data_row_by_id(idx)
@@ -351,151 +742,76 @@ class ExperimentManager:
 
         if hlcntn_data is None:
             self.logger.warning(
-                f"Failed to create hallucinated version for {data['question']}. Skipping"
+                "Failed to create hallucinated version for %s. Skipping",
+                data["question"],
             )
 
-            self.logger.warning("==>Retrying")
+            self.logger.warning(
+                "==>Retrying",
+                extra=event_extra(
+                    "retry",
+                    kind="hlcntn",
+                    idx=idx,
+                    retry_num=retry_num + 1,
+                    reason="no_hallucinated_data",
+                ),
+            )
+            current_span().add_event(
+                "retry", retry_num=retry_num + 1, reason="no_hallucinated_data"
+            )
+            live_metrics().inc(
+                "fact_checking_retries_total",
+                experiment=self.config.experiment_name,
+                kind="hlcntn",
+                reason="no_hallucinated_data",
+            )
             return self.evaluate_hlcntn_sample(idx, retry_num + 1)
 
-        output = self.model.hlcntn_forward(data, hlcntn_data)
+        output = self.model.hlcntn_forward(data, hlcntn_data, use_memo=retry_num == 0)
         if len(output["fact_check_prediction_binary"]) != len(
             hlcntn_data["hlcntn_triplet_index"]
         ):
             self.logger.warning(
-                f"Number of predictions doesn't match the one for triplets for {data['question']}. Skipping"
+                "Number of predictions doesn't match the one for triplets for %s. Skipping",
+                data["question"],
             )
-            self.logger.debug(f"Length mismatch output: {output}")
-            self.logger.debug(f"Length mismatch hlcntn_data: {hlcntn_data}")
+            self.logger.debug("Length mismatch output: %s", output)
+            self.logger.debug("Length mismatch hlcntn_data: %s", hlcntn_data)
 
-            self.logger.warning("==>Retrying")
+            self.logger.warning(
+                "==>Retrying",
+                extra=event_extra(
+                    "retry",
+                    kind="hlcntn",
+                    idx=idx,
+                    retry_num=retry_num + 1,
+                    reason="prediction_length_mismatch",
+                ),
+            )
+            current_span().add_event(
+                "retry", retry_num=retry_num + 1, reason="prediction_length_mismatch"
+            )
+            live_metrics().inc(
+                "fact_checking_retries_total",
+                experiment=self.config.experiment_name,
+                kind="hlcntn",
+                reason="prediction_length_mismatch",
+            )
             return self.evaluate_hlcntn_sample(idx, retry_num + 1)
 
         return data, hlcntn_data, output
 
     def calculate_precision_stats(self, prediction_result: list):
-        """˝
-        Calculate precision statistics from prediction results. If
-
-        Args:
-            prediction_result (list of dict): A list of dictionaries where each dictionary contains:
-                - "precision" (float): The precision score of each the fact check result.
-                - "reference_triplets" (list): A list of reference triplets.
-                - "generated_answer" (str): The generated answer. - this could be artificially generated hallucination anwer or just generated answer
-                - "reprompt_precision" (float, optional): The precision score after reprompting.
-
-        Returns:
-            dict: A dictionary containing:
-                - "precision" (float): precision score or the experiment. This is calculated by number_of_corect_predictions_for_non_hallucination / total_number_of_predictions_for_non_hallucination
-                - "avg_reprompt_score" (float or None): The average reprompt precision score, or None if not applicable.
-                - "std_reprompt_score" (float or None): The standard deviation of the reprompt precision scores, or None if not applicable.
-                - "avg_reprompt_improvement" (float or None): The average improvement in precision after reprompting, or None if not applicable.
-                - "std_reprompt_improvement" (float or None): The standard deviation of the improvement in precision after reprompting, or None if not applicable.
-                - "num_triplets" (int): The number of triplets in the experiment.
-                - "num_non_hlcntn_triplets_correctly_predicted" (int): The number of correct predictions for non-hallucination triplets.
-        """
-
-        model_predictions = []
-        for item in prediction_result:
-            # exclude hallucination triplets for hallucinated experiments
-            if "hlcntn_triplet_index" in item:
-                model_predictions.extend(
-                    [
-                        value
-                        for idx, value in item["fact_check_prediction_binary"].items()
-                        if item["hlcntn_triplet_index"][idx] == False
-                    ]
-                )
-            else:
-                model_predictions.extend(
-                    [
-                        value
-                        for idx, value in item["fact_check_prediction_binary"].items()
-                    ]
-                )
-
-        precision = sum(model_predictions) / len(
-            model_predictions
-        )  # only for non-hallucination
-        num_correct_predictions = sum(model_predictions)
-
-        precisions = [
-            item["precision"]
-            for item in prediction_result
-            if all([len(i) == 3 for i in item["reference_triplets"]])
-            and item["generated_answer"] != ""
-        ]
-        reprompt_score = [
-            item["reprompt_precision"] if "reprompt_precision" in item else None
-            for item in prediction_result
-        ]
-        reprompt_score_without_none = [
-            item for item in reprompt_score if item is not None
-        ]
-        if len(reprompt_score_without_none) > 1:
-            avg_reprompt_score = sum(reprompt_score_without_none) / len(
-                reprompt_score_without_none
-            )
-            std_reprompt_score = np.std(reprompt_score_without_none)
-            # reprompt_improvement
-            reprompt_improvement = [
-                reprompt_score[i] - precisions[i]
-                for i in range(len(precisions))
-                if reprompt_score[i] is not None
-            ]
-            avg_reprompt_improvement = sum(reprompt_improvement) / len(
-                reprompt_improvement
-            )
-            std_reprompt_improvement = np.std(reprompt_improvement)
-        else:
-            avg_reprompt_score = None
-            std_reprompt_score = None
-            avg_reprompt_improvement = None
-            std_reprompt_improvement = None
-        return {
-            "precision": precision,
-            "avg_reprompt_score": avg_reprompt_score,
-            "std_reprompt_score": std_reprompt_score,
-            "avg_reprompt_improvement": avg_reprompt_improvement,
-            "std_reprompt_improvement": std_reprompt_improvement,
-            "num_non_hlcntn_triplets": len(model_predictions),
-            "num_non_hlcntn_triplets_correctly_predicted": num_correct_predictions,
-        }
+        """
+        Calculate precision statistics from prediction results, see utils.scoring.precision_stats.
+        """
+        return scoring.precision_stats(prediction_result)
 
     def calculate_hlcntn_metrics(self, result: list):
         """
-        Calculate HLCTN (Hallucination Containment) metrics from the given result.
-
-        This function computes the specificity for the HLCTN metrics
-        based on the model predictions and ground truth values provided in the result.
-
-        Args:
-            result (list): A list of dictionaries containing the model predictions and ground truth values.
-                Each dictionary should have the following keys:
-                - "fact_check_prediction_binary" (dict): A dictionary where the keys are indices and the values are binary predictions.
-                - "hlcntn_triplet_index" (list): A list of ground truth binary values indicating the presence of hallucinations.
-
-        Returns:
-            dict: A dictionary containing the following HLCTN metrics:
-                - "specificity" (float): The specificity score, tn/(fp+tn).
-                - "num_hlcntn_triplets" (int): The number of hallucination triplets.
-                - "num_hlcntn_triplets_correctly_predicted" (int): The number of correct hallucination samples.
+        Calculate HLCTN (Hallucination Containment) metrics from the given result, see utils.scoring.hlcntn_metrics.
         """
-        model_predictions = []
-        ground_truth = []
-        for item in result:
-            model_predictions.extend(
-                [value for idx, value in item["fact_check_prediction_binary"].items()]
-            )
-            ground_truth.extend(item["hlcntn_triplet_index"])
-
-        recall, num_hlcntn_triplets_correctly_predicted = specificity_and_samples(
-            [i == False for i in ground_truth], model_predictions
-        )
-        return {
-            "specificity": recall,
-            "num_hlcntn_triplets": len([i for i in ground_truth if i == True]),
-            "num_hlcntn_triplets_correctly_predicted": num_hlcntn_triplets_correctly_predicted,
-        }
+        return scoring.hlcntn_metrics(result)
 
     def save_experiment_result(
         self,
@@ -561,6 +877,9 @@ class ExperimentManager:
         # Save results to file
         json.dump(metrics, open(metrics_path, "w"))
         json.dump(prediction_result, open(predictions_path, "w"))
+        self.usage.save(
+            f"{experiment_result_path}{self.config.path.experiment_result.usage}"
+        )
 
     def save_hlcntn_experiment_result(self, metrics: dict, prediction_result: dict):
         """
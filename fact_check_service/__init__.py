@@ -0,0 +1,8 @@
+from fact_check_service.server import *
+
+__all__ = [
+    "FactCheckService",
+    "FactCheckRequestError",
+    "LatencyStats",
+    "triplet_verdicts",
+]
@@ -0,0 +1,291 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from dataset.bioasq_dataset import BioASQDataset
+from pipeline.usage import get_usage_ledger
+from rag.llm_fact_checking_system import LLMFactCheckingSystem
+from utils.metrics_endpoint import live_metrics
+from utils.tracing import span
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+class FactCheckHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 256
+    daemon_threads = True
+
+
+class LatencyStats:
+    """
+    Thread safe latencies of the last `window` requests, with the request counts by status.
+
+    Methods:
+        record(seconds: float, status: int) -> None:
+            Records a request.
+        summary() -> dict:
+            The request counts and the mean and percentiles (in seconds) of the latencies of the window.
+    """
+
+    def __init__(self, window: int = 10000):
+        self.latencies = deque(maxlen=window)
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, status: int) -> None:
+        with self._lock:
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+            if status == 200:
+                self.latencies.append(seconds)
+
+    def summary(self) -> dict:
+        with self._lock:
+            latencies = np.array(self.latencies)
+            statuses = dict(self.statuses)
+        summary = {"requests": sum(statuses.values()), "statuses": statuses}
+        if len(latencies):
+            summary["mean_seconds"] = float(latencies.mean())
+            summary.update(
+                {
+                    f"p{percentile}_seconds": float(
+                        np.percentile(latencies, percentile)
+                    )
+                    for percentile in PERCENTILES
+                }
+            )
+        return summary
+
+
+class FactCheckRequestError(Exception):
+    """
+    An invalid /check request, answered with a 400.
+    """
+
+
+class FactCheckService:
+    """
+    A local HTTP service holding a warm LLMFactCheckingSystem, so that checking an answer against a reference pays
+    neither the process startup nor the prompt compilation and client setup:
+        - POST /check {"answer": str, "reference": str} or {"answer": str, "passage_ids": [int]}:
+          the answer triplets, the reference triplets and the verdict of every answer triplet. With passage_ids the
+          reference triplets are the corpus triplets of the passages (generated and cached on first use, a generation
+          failure is answered with a 500).
+        - GET /stats: the request counts and latency percentiles, and the LLM usage.
+        - GET /health.
+
+    The requests are served concurrently, at most max_concurrency of them at once (the others wait). They share the
+    components and their caches (dataflow memo, artifact store, sentence cache) and the rate limiter of the LLM
+    endpoint (model.llm.rate_limit). The LLM endpoint is the OpenAI API, --llm_base_url (e.g. the local simulator) or
+    a cassette (--cassette_mode).
+
+    Args:
+        config (dict): The configuration, the service settings are in config.experiment_setup.fact_check_service:
+            - host, port (int, 0 for any free port).
+            - max_concurrency (int): The number of requests checked at once.
+            - latency_window (int): The number of latest requests of the latency percentiles.
+        logger (logging.Logger): The logger.
+
+    Methods:
+        check(request: dict) -> dict:
+            Checks an answer (the body of POST /check).
+        start() -> str:
+            Starts serving in a background thread, returns the url of the service.
+        stop() -> None:
+            Stops the server.
+        serve_forever() -> None:
+            Serves in the calling thread.
+        stats() -> dict:
+            The body of GET /stats.
+    """
+
+    def __init__(self, config: dict, logger):
+        self.config = config
+        self.logger = logger
+        settings = config.experiment_setup.fact_check_service
+        self.dataset = BioASQDataset(config, logger)
+        self.system = LLMFactCheckingSystem(config, logger)
+        self.latency = LatencyStats(settings.latency_window)
+        self.slots = threading.BoundedSemaphore(settings.max_concurrency)
+        # the corpus triplets of a missing passage are generated and saved once, under the lock of the passage
+        self._passage_locks = {}
+        self._passage_locks_lock = threading.Lock()
+
+        class Handler(FactCheckRequestHandler):
+            service = self
+
+        self.server = FactCheckHTTPServer((settings.host, settings.port), Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def stats(self) -> dict:
+        return {
+            "latency": self.latency.summary(),
+            "llm_usage": dict(get_usage_ledger(self.config).total),
+        }
+
+    def validate_passage_ids(self, passage_ids) -> list:
+        if not isinstance(passage_ids, list) or not passage_ids:
+            raise FactCheckRequestError("passage_ids must be a non empty list")
+        try:
+            passage_ids = [int(passage_id) for passage_id in passage_ids]
+        except (TypeError, ValueError):
+            raise FactCheckRequestError("passage_ids must be integers")
+        unknown = [
+            passage_id
+            for passage_id in passage_ids
+            if passage_id not in self.dataset.corpus_dataset
+        ]
+        if unknown:
+            raise FactCheckRequestError(f"Unknown passage ids: {unknown}")
+        return passage_ids
+
+    def passage_lock(self, passage_id: int) -> threading.Lock:
+        with self._passage_locks_lock:
+            return self._passage_locks.setdefault(passage_id, threading.Lock())
+
+    def reference_triplets(self, passage_ids: list) -> list:
+        """
+        The reference triplets of corpus passages. The triplets of the passages missing from the corpus triplets are
+        generated (with the warm triplet generator) and saved, each passage once: requests needing the same missing
+        passage wait for it, the cached passages are served without waiting.
+
+        Raises:
+            Exception: Any error generating the triplets of a passage (answered with a 500).
+        """
+        for passage_id in passage_ids:
+            if passage_id in self.dataset.corpus_triplets:
+                continue
+            with self.passage_lock(passage_id):
+                self.dataset.get_corpus_triplet_by_idx(
+                    passage_id,
+                    save_data=self.config.save_data,
+                    triplet_generator=self.system.triplet_generator,
+                )
+        return self.dataset.relevant_reference_triplets(passage_ids)
+
+    def check(self, request: dict) -> dict:
+        """
+        Check an answer against a reference text or corpus passages.
+
+        Args:
+            request (dict): answer (str) and either reference (str) or passage_ids (list of int).
+
+        Returns:
+            dict: answer_triplets, reference_triplets, fact_check_prediction_binary and verdicts (the answer
+                  triplets with their prediction).
+
+        Raises:
+            FactCheckRequestError: If the request is invalid.
+            Exception: If the request could not be checked, e.g. the triplets of a passage could not be generated.
+        """
+        answer = request.get("answer")
+        if not isinstance(answer, str) or not answer.strip():
+            raise FactCheckRequestError("answer must be a non empty string")
+        passage_ids = None
+        if "passage_ids" in request:
+            passage_ids = self.validate_passage_ids(request["passage_ids"])
+        elif not (
+            isinstance(request.get("reference"), str) and request["reference"].strip()
+        ):
+            raise FactCheckRequestError(
+                "reference (a non empty string) or passage_ids is required"
+            )
+        with self.slots, span("check", "request"):
+            if passage_ids is not None:
+                reference = {"reference_triplets": self.reference_triplets(passage_ids)}
+            else:
+                reference = {"reference_text": request["reference"]}
+            result = self.system.direct_text_match_forward(answer, **reference)
+        return {
+            **result,
+            "verdicts": triplet_verdicts(
+                result["answer_triplets"], result["fact_check_prediction_binary"]
+            ),
+        }
+
+
+def triplet_verdicts(answer_triplets: list, predictions) -> list:
+    """
+    The answer triplets with their prediction (None if the fact checker gave none), from the predictions by triplet
+    index (a dict, keyed by int or str, or a list).
+    """
+    verdicts = []
+    for idx, triplet in enumerate(answer_triplets):
+        if isinstance(predictions, dict):
+            verdict = predictions.get(idx, predictions.get(str(idx)))
+        else:
+            verdict = predictions[idx] if idx < len(predictions) else None
+        verdicts.append({"triplet": triplet, "verdict": verdict})
+    return verdicts
+
+
+class FactCheckRequestHandler(BaseHTTPRequestHandler):
+    service: FactCheckService = None
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        if path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif path == "/stats":
+            self.send_json(200, self.service.stats())
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path.split("?")[0].rstrip("/") != "/check":
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            try:
+                request = json.loads(
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                )
+            except ValueError as e:
+                raise FactCheckRequestError(f"the body is not valid JSON: {e}")
+            if not isinstance(request, dict):
+                raise FactCheckRequestError("the body must be a JSON object")
+            status, body = 200, self.service.check(request)
+        except FactCheckRequestError as e:
+            status, body = 400, {"error": str(e)}
+        except Exception as e:
+            self.service.logger.warning("Fact checking request failed: %r", e)
+            status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+        seconds = time.perf_counter() - start
+        self.service.latency.record(seconds, status)
+        live_metrics().observe("fact_check_service_request_duration_seconds", seconds)
+        live_metrics().inc("fact_check_service_requests_total", status=str(status))
+        if status == 200:
+            body["latency_seconds"] = seconds
+        self.send_json(status, body)
+
+    def send_json(self, status: int, body: dict):
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,7 @@
+from llm_simulator.server import *
+from llm_simulator.responses import *
+
+__all__ = [
+    "LLMSimulator",
+    "canned_response",
+]
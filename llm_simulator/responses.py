@@ -0,0 +1,179 @@
+import ast
+import json
+import re
+from typing import List, Optional
+
+from utils.text_utils import split_sentences, tokenize
+
+"""
+Canned responses of the LLM simulator, in the output formats the components parse, picked from the rendered prompt:
+    - fact checking ("Input Triplets:"/"Source Triplets:"): triplet_idx:True/False lines, inside a [FINAL ANSWER]
+      section if the prompt asks for one. An input triplet is True if it shares most of its tokens with a source triplet.
+    - batched triplet extraction ("[PASSAGE id]" sections) and triplet extraction/refinement ("Input Text:"): one
+      ["subject", "predicate", "object"] triplet per sentence of the text.
+    - hallucination data generation and hallucinated triplet extraction.
+    - answer generation ("Question:"): the first sentences of the reference documents.
+"""
+
+FEW_SHOT_PATTERN = re.compile(
+    r"\[BEGIN FEW-SHOT-EXAMPLES\].*?\[END FEW-SHOT-EXAMPLES\]", re.DOTALL
+)
+PASSAGE_PATTERN = re.compile(r"\[PASSAGE ([^\]]+)\](.*?)\[END PASSAGE \1\]", re.DOTALL)
+INDEXED_TRIPLET_PATTERN = re.compile(r"^\s*-?\s*(\d+):\s*(\[.*\])\s*$", re.MULTILINE)
+# share of the tokens of an input triplet found in a source triplet for it to be supported
+SUPPORT_OVERLAP = 0.6
+MAX_TRIPLETS = 20
+
+
+def section(text: str, start: str, ends: List[str]) -> Optional[str]:
+    """
+    The text between the first `start` marker and the first of the `ends` markers after it.
+    """
+    begin = text.find(start)
+    if begin < 0:
+        return None
+    begin += len(start)
+    end = min(
+        [position for position in (text.find(e, begin) for e in ends) if position >= 0],
+        default=len(text),
+    )
+    return text[begin:end].strip()
+
+
+def passage_text(text: str) -> str:
+    """
+    The text of a batched passage section, without its candidate triplets (batched refinement).
+    """
+    return section(text, "Input Text:", ["\nCandidate Triplets:"]) or text
+
+
+def indexed_triplets(text: str) -> dict:
+    triplets = {}
+    for match in INDEXED_TRIPLET_PATTERN.finditer(text or ""):
+        try:
+            triplets[int(match.group(1))] = ast.literal_eval(match.group(2))
+        except (ValueError, SyntaxError):
+            continue
+    return triplets
+
+
+def text_triplets(text: str) -> List[List[str]]:
+    """
+    One triplet per sentence: the first two words, the third one and the rest of the sentence (at most 12 words).
+    """
+    triplets = []
+    for sentence in split_sentences(text):
+        words = sentence.rstrip(".!?").split()
+        if len(words) >= 4:
+            triplets.append([" ".join(words[:2]), words[2], " ".join(words[3:15])])
+    return triplets[:MAX_TRIPLETS]
+
+
+def is_supported(triplet, source_triplets: list) -> bool:
+    tokens = set(tokenize(" ".join(map(str, triplet))))
+    if not tokens:
+        return False
+    return any(
+        len(tokens & set(tokenize(" ".join(map(str, source))))) / len(tokens)
+        >= SUPPORT_OVERLAP
+        for source in source_triplets
+    )
+
+
+def fact_checking_response(system: str, human: str) -> str:
+    input_triplets = indexed_triplets(
+        section(human, "Input Triplets:", ["Source Triplets:"])
+    )
+    source_triplets = list(
+        indexed_triplets(
+            section(human, "Source Triplets:", ["\n\n", "Output Requirements"])
+        ).values()
+    )
+    lines = [
+        f"{idx}:{is_supported(triplet, source_triplets)}"
+        for idx, triplet in sorted(input_triplets.items())
+    ]
+    if "[FINAL ANSWER]" in system + human:
+        referred = [f"{idx}: None" for idx in sorted(input_triplets)]
+        return (
+            "[REFERRED TRIPLETS]\n"
+            + "\n".join(referred)
+            + "\n[FINAL ANSWER]\n"
+            + "\n".join(lines)
+        )
+    return "\n".join(lines)
+
+
+def reference_text(human: str) -> str:
+    for marker in [
+        "Reference Documents:",
+        "References documents:",
+        "Reference Document:",
+    ]:
+        text = section(human, marker, ["Question:", "(Optional)", "Task:"])
+        if text:
+            return text
+    return ""
+
+
+def answer_response(human: str, num_sentences: int = 3) -> str:
+    sentences = split_sentences(
+        re.sub(r"[\[\]'\"]", " ", reference_text(human)).replace("\\n", " ")
+    )
+    return (
+        " ".join(sentences[:num_sentences])
+        or "The answer cannot be determined from the provided documents."
+    )
+
+
+def hallucination_data_response(human: str) -> str:
+    answer = answer_response(human)
+    hallucinated = answer + " It is also produced in the spleen."
+    return (
+        f"Non-Hallucinated Answer:\n{answer}\n\n"
+        f"Hallucinated Answer:\n{hallucinated}\n\n"
+        "Hallucinated Details:\n• It is also produced in the spleen."
+    )
+
+
+def hallucinated_triplets_response(human: str) -> str:
+    text = section(human, "3. Answer Triplets", ["\n\nImportant"]) or ""
+    text = text.split(":", 1)[-1].strip()
+    try:
+        answer_triplets = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        answer_triplets = []
+    flags = [
+        "true" if "spleen" in str(triplet) else "false" for triplet in answer_triplets
+    ]
+    return f"Plain Boolean List:\n[{', '.join(flags)}]"
+
+
+def canned_response(messages: List[dict]) -> str:
+    """
+    The response of the simulator to chat completion messages ({"role", "content"} dicts).
+    """
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    human = FEW_SHOT_PATTERN.sub(
+        "", "\n".join(str(m["content"]) for m in messages if m["role"] != "system")
+    )
+    if "Input Triplets:" in human and "Source Triplets:" in human:
+        return fact_checking_response(system, human)
+    if "hallucination detection" in human:
+        return hallucinated_triplets_response(human)
+    if "Hallucinated Answer" in human:
+        return hallucination_data_response(human)
+    passages = PASSAGE_PATTERN.findall(human)
+    if passages:
+        return "\n".join(
+            f"[PASSAGE {passage_id}]\n{json.dumps(text_triplets(passage_text(text)))}\n[END PASSAGE {passage_id}]"
+            for passage_id, text in passages
+        )
+    if "Input Text:" in human:
+        text = section(human, "Input Text:", ["\nTask:", "\n\nCandidate Triplets:"])
+        return json.dumps(text_triplets(text or ""))
+    if "Generated Answer:" in human:
+        return section(human, "Generated Answer:", ["Reference Documents:"]) or ""
+    if "Question:" in human:
+        return answer_response(human)
+    return "OK"
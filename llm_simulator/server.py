@@ -0,0 +1,217 @@
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_simulator.responses import canned_response
+from utils.text_utils import estimate_tokens
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+
+class SimulatorHTTPServer(ThreadingHTTPServer):
+    # load tests open many connections at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class LLMSimulator:
+    """
+    A local HTTP server speaking the OpenAI chat completions protocol used by ChatOpenAI
+    (POST {base_url}/chat/completions), for load and fault testing without the API.
+
+    Every request:
+        - is rejected with a 429 (and a Retry-After) if max_in_flight requests are already being served,
+        - fails with a 429 or a 500 with the probabilities of error_rates,
+        - otherwise sleeps a latency drawn from the latency distribution plus seconds_per_input_token and
+          seconds_per_output_token per (estimated) token, and answers a canned response in the format of its prompt
+          template (see llm_simulator.responses) with its token usage.
+
+    Args:
+        settings (dict): config.model.llm.simulator:
+            - host, port (int, 0 for any free port).
+            - latency (dict): distribution ("fixed", "uniform", "exponential" or "lognormal") and median_seconds
+              (and sigma for lognormal, the spread of uniform is [0, 2 * median_seconds]).
+            - seconds_per_input_token, seconds_per_output_token (float).
+            - error_rates (dict): "429" and "500" -> probability.
+            - max_in_flight (int or None), retry_after_seconds (float).
+            - seed (int): Seed of the latency and error draws.
+
+    Methods:
+        start() -> str:
+            Starts serving in a background thread, returns the base url to give to ChatOpenAI.
+        stop() -> None:
+            Stops the server.
+        serve_forever() -> None:
+            Serves in the calling thread.
+        stats() -> dict:
+            The number of requests served and rejected.
+    """
+
+    def __init__(self, settings: dict):
+        if settings.latency.distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency distribution {settings.latency.distribution!r}, "
+                f"expected one of {LATENCY_DISTRIBUTIONS}"
+            )
+        self.settings = settings
+        self.random = random.Random(settings.seed)
+        self.in_flight = 0
+        self.counts = {"served": 0, "rejected_429": 0, "failed_500": 0}
+        self._lock = threading.Lock()
+
+        class Handler(SimulatorRequestHandler):
+            simulator = self
+
+        self.server = SimulatorHTTPServer((settings.host, settings.port), Handler)
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts, in_flight=self.in_flight)
+
+    def admit(self):
+        """
+        Decide the fate of a request: None if it is served, or the HTTP status of its error.
+        """
+        with self._lock:
+            max_in_flight = self.settings.max_in_flight
+            if max_in_flight and self.in_flight >= max_in_flight:
+                self.counts["rejected_429"] += 1
+                return 429
+            draw = self.random.random()
+            rate_429 = self.settings.error_rates.get("429", 0.0)
+            rate_500 = self.settings.error_rates.get("500", 0.0)
+            if draw < rate_429:
+                self.counts["rejected_429"] += 1
+                return 429
+            if draw < rate_429 + rate_500:
+                self.counts["failed_500"] += 1
+                return 500
+            self.in_flight += 1
+            return None
+
+    def done(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.counts["served"] += 1
+
+    def latency(self, input_tokens: int, output_tokens: int) -> float:
+        latency = self.settings.latency
+        with self._lock:
+            if latency.distribution == "fixed":
+                base = latency.median_seconds
+            elif latency.distribution == "uniform":
+                base = self.random.uniform(0, 2 * latency.median_seconds)
+            elif latency.distribution == "exponential":
+                # the median of an exponential distribution is ln(2) times its mean
+                base = self.random.expovariate(math.log(2) / latency.median_seconds)
+            else:
+                base = self.random.lognormvariate(
+                    math.log(latency.median_seconds), latency.sigma
+                )
+        return (
+            base
+            + input_tokens * self.settings.seconds_per_input_token
+            + output_tokens * self.settings.seconds_per_output_token
+        )
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    simulator: LLMSimulator = None
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        status = self.simulator.admit()
+        if status == 429:
+            self.send_json(
+                429,
+                {
+                    "error": {
+                        "message": "Rate limit reached (simulated)",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }
+                },
+                headers={
+                    "Retry-After": str(self.simulator.settings.retry_after_seconds)
+                },
+            )
+            return
+        if status == 500:
+            self.send_json(
+                500,
+                {
+                    "error": {
+                        "message": "Internal server error (simulated)",
+                        "type": "server_error",
+                    }
+                },
+            )
+            return
+        try:
+            content = canned_response(request["messages"])
+            input_tokens = sum(
+                estimate_tokens(str(message["content"]))
+                for message in request["messages"]
+            )
+            output_tokens = estimate_tokens(content)
+            time.sleep(self.simulator.latency(input_tokens, output_tokens))
+            self.send_json(
+                200,
+                {
+                    "id": f"chatcmpl-sim-{time.time_ns()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "simulator"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": input_tokens,
+                        "completion_tokens": output_tokens,
+                        "total_tokens": input_tokens + output_tokens,
+                    },
+                },
+            )
+        finally:
+            self.simulator.done()
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
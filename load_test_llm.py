@@ -0,0 +1,100 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+
+from llm_simulator import LLMSimulator
+from main import *
+from pipeline.pipeline_llm import PipelineLLM
+from utils.utils import ExperimentLogger
+
+"""
+Load test of an OpenAI compatible endpoint through PipelineLLM: for every concurrency level of
+config.model.llm.simulator.load_test, requests_per_level fact checking like requests are sent with that many threads,
+and the throughput, latency percentiles and errors are reported as a throughput vs concurrency curve
+(results/{experiment_name}/load_test.json).
+
+By default the requests go to an in-process LLM simulator (config.model.llm.simulator, on a free port), or to
+--llm_base_url (e.g. a simulator started with run_llm_simulator.py). The rate limiter (model.llm.rate_limit) applies
+if it is enabled.
+
+    python load_test_llm.py -e load_test
+    python load_test_llm.py -e load_test --llm_base_url http://127.0.0.1:8000/v1
+"""
+
+
+def load_test_prompt(i: int) -> str:
+    return (
+        "Input Triplets:\n"
+        f'0: ["TSH", "is secreted by", "the anterior pituitary gland {i}"]\n'
+        '-1: ["T4", "is converted to", "T3 in peripheral tissues"]\n\n'
+        "Source Triplets:\n"
+        '0: ["TSH", "is secreted by", "the anterior pituitary gland"]\n'
+        '-1: ["T3", "is produced by", "deiodination of T4"]\n\n'
+        "Output one line triplet_idx:True or triplet_idx:False per input triplet."
+    )
+
+
+def run_level(llm: PipelineLLM, concurrency: int, num_requests: int) -> dict:
+    latencies = []
+    errors = {}
+
+    def request(i):
+        start = time.perf_counter()
+        try:
+            llm.invoke_model(load_test_prompt(i))
+        except openai.APIError as e:
+            name = type(e).__name__
+            errors[name] = errors.get(name, 0) + 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(request, range(num_requests)))
+    wall_time = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "requests": num_requests,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "throughput": len(latencies) / wall_time,
+        "latency_p50": float(np.percentile(latencies, 50)) if latencies else None,
+        "latency_p95": float(np.percentile(latencies, 95)) if latencies else None,
+        "wall_time": wall_time,
+    }
+
+
+if __name__ == "__main__":
+    experiment_result_path = (
+        f"{config.path.experiment_result.base}{config.experiment_name}/"
+    )
+    logger = ExperimentLogger(
+        "", log_path=experiment_result_path, logger_level=config.logger_level
+    )
+    simulator = None
+    if not config.model.llm.base_url:
+        simulator_settings = edict(config.model.llm.simulator)
+        simulator_settings.port = 0
+        simulator = LLMSimulator(simulator_settings)
+        config.model.llm.base_url = simulator.start()
+    logger.info(f"==> Load test of {config.model.llm.base_url}")
+
+    llm = PipelineLLM(config)
+    load_test = config.model.llm.simulator.load_test
+    curve = []
+    for concurrency in load_test.concurrency_levels:
+        result = run_level(llm, concurrency, load_test.requests_per_level)
+        curve.append(result)
+        logger.info(
+            f"==> concurrency {concurrency:3d}: {result['throughput']:.1f} requests/s, "
+            f"latency p50 {result['latency_p50'] or 0:.3f}s p95 {result['latency_p95'] or 0:.3f}s, "
+            f"errors {result['errors']}"
+        )
+    if simulator is not None:
+        logger.info(f"==> Simulator: {simulator.stats()}")
+        simulator.stop()
+    with open(f"{experiment_result_path}load_test.json", "w") as f:
+        json.dump(curve, f, indent=4)
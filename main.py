@@ -2,6 +2,8 @@ import argparse
 import json
 from easydict import EasyDict as edict
 
+from utils.sharding import parse_shard, shard_dir_name
+
 """
 Main is just for configurations
 """
@@ -42,6 +44,14 @@ def args2dict(config_file=None):
         --demo_target_model (str): Path or name of the target model for demo. used only in generate_demonstrations.py .
         --demo_data_path (str): Path to demo data.  used only in generate_demonstrations.py .
         --demo_data_generation_method (str): How demo data is generated.  used only in generate_demonstrations.py .
+        --sweep (str): Path to the JSON grid of config values of a sweep. used only in sweep.py .
+        --shard (str): Evaluate only the shard i/N of the question indices (0 <= i < N), saved in results/{experiment_name}/shard_{i}_of_{N}/.
+        --cache_dir (str): Cache directory (path.cache), e.g. on a network file system shared by the shards.
+        --cassette_mode (str): "record" the LLM calls into a cassette, or "replay" them offline (model.llm.cassette.mode).
+        --cassette_path (str): The cassette file (model.llm.cassette.path).
+        --llm_base_url (str): Base url of an OpenAI compatible endpoint for the LLM components (model.llm.base_url), e.g. the local simulator.
+        --benchmark_scenario (str): Run only this benchmark scenario, in this process. used only in benchmarks/run_benchmarks.py .
+        --profile (str): Profile the samples "all", "every:N" or "i,j,k" (question indices) (experiment_setup.profiling.samples).
     """
     args = argparse.ArgumentParser(description="experiment")
     args.add_argument("-c", "--config", default=config_file, type=str)
@@ -61,6 +71,16 @@ def args2dict(config_file=None):
     args.add_argument("--demo_data_generation_method", default=None, type=str)
     args.add_argument("--inline_answer", default=None, type=str)
     args.add_argument("--inline_reference", default=None, type=str)
+    args.add_argument("--sweep", default=None, type=str)
+    args.add_argument("--shard", default=None, type=str)
+    args.add_argument("--cache_dir", default=None, type=str)
+    args.add_argument(
+        "--cassette_mode", default=None, type=str, choices=["record", "replay"]
+    )
+    args.add_argument("--cassette_path", default=None, type=str)
+    args.add_argument("--llm_base_url", default=None, type=str)
+    args.add_argument("--benchmark_scenario", default=None, type=str)
+    args.add_argument("--profile", default=None, type=str)
     config_dict = config_parser(args.parse_args())
     return config_dict
 
@@ -68,7 +88,39 @@ def args2dict(config_file=None):
 def override_experiment_path(config):
     if hasattr(config, "sample_idx"):
         config.experiment_name = f"{config.experiment_name}_{config.sample_idx}"
+    if hasattr(config, "shard"):
+        config.shard_index, config.num_shards = parse_shard(config.shard)
+        config.experiment_name = f"{config.experiment_name}/{shard_dir_name(config.shard_index, config.num_shards)}"
+    if hasattr(config, "cache_dir"):
+        config.path.cache = config.cache_dir.rstrip("/") + "/"
+    if hasattr(config, "cassette_mode"):
+        config.model.llm.cassette.mode = config.cassette_mode
+    if hasattr(config, "cassette_path"):
+        config.model.llm.cassette.path = config.cassette_path
+    if hasattr(config, "llm_base_url"):
+        config.model.llm.base_url = config.llm_base_url
+    if hasattr(config, "profile"):
+        config.experiment_setup.profiling.samples = config.profile
     return config
 
 
-config = args2dict(config_file="training")
+def __getattr__(name):
+    # the command line is parsed on the first use of `config` (`from main import *` in a script), not on import
+    if name == "config":
+        config = args2dict(config_file="training")
+        globals()["config"] = config
+        return config
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = [
+    "argparse",
+    "json",
+    "edict",
+    "parse_shard",
+    "shard_dir_name",
+    "config_parser",
+    "args2dict",
+    "override_experiment_path",
+    "config",
+]
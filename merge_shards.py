@@ -0,0 +1,165 @@
+import json
+import os
+import shutil
+from typing import Optional
+
+from main import *
+from pipeline.usage import add_usage
+from utils.scoring import score_predictions
+from utils.sharding import SHARD_DIR_PATTERN, shard_dir_name
+from utils.utils import ExperimentLogger
+
+"""
+Merges the results of a sharded experiment (run_experiment.py --shard i/N, one run per shard, possibly on different
+machines sharing results/ and --cache_dir) into results/{experiment_name}/. The predictions of all the shards are
+concatenated in question index order and the metrics are recomputed on them with utils/scoring.py, so the global
+precision is the share of all the triplets predicted as true, not an average of the shard precisions. The LLM usage
+and cost of the shards (usage.json) are merged too.
+
+    python run_experiment.py -e my_experiment --shard 0/4 --cache_dir /mnt/shared/cache/
+    ...
+    python run_experiment.py -e my_experiment --shard 3/4 --cache_dir /mnt/shared/cache/
+    python merge_shards.py -e my_experiment
+"""
+
+# files saved once per experiment directory by ExperimentManager.save_experiment_result
+EXPERIMENT_INFO_FILES = ["config.json", "prompt_bank.json", "commit_info.json"]
+
+
+def shard_dirs(experiment_result_path: str) -> list:
+    """
+    The shard directories of an experiment, in shard order. All the shards of the same number of shards must be
+    present.
+    """
+    shards = {}
+    for name in os.listdir(experiment_result_path):
+        match = SHARD_DIR_PATTERN.match(name)
+        if match and os.path.isdir(f"{experiment_result_path}{name}"):
+            shards[int(match.group(1))] = int(match.group(2))
+    if not shards:
+        raise FileNotFoundError(
+            f"No shard_i_of_N directory in {experiment_result_path}"
+        )
+    num_shards = set(shards.values())
+    if len(num_shards) != 1:
+        raise ValueError(
+            f"Shards of different numbers of shards in {experiment_result_path}: {sorted(num_shards)}"
+        )
+    num_shards = num_shards.pop()
+    missing = sorted(set(range(num_shards)) - set(shards))
+    if missing:
+        raise ValueError(
+            f"Missing shards {missing} of {num_shards} in {experiment_result_path}"
+        )
+    return [
+        f"{experiment_result_path}{shard_dir_name(shard_index, num_shards)}/"
+        for shard_index in range(num_shards)
+    ]
+
+
+def merge_predictions(dirs: list, predictions_file_name: str) -> Optional[list]:
+    """
+    The predictions of all the shards, sorted by question index, or None if no shard has the predictions file.
+    Shards without any sample (e.g. more shards than samples) have an empty predictions file.
+    A question index must not be in several shards.
+    """
+    if not any(
+        os.path.exists(f"{shard_dir}{predictions_file_name}") for shard_dir in dirs
+    ):
+        return None
+    prediction_result = []
+    for shard_dir in dirs:
+        predictions_path = f"{shard_dir}{predictions_file_name}"
+        if not os.path.exists(predictions_path):
+            logger.warning(f"==> No {predictions_file_name} in {shard_dir}")
+            continue
+        with open(predictions_path, "r") as f:
+            prediction_result.extend(json.load(f))
+    indices = [item["idx"] for item in prediction_result]
+    if len(indices) != len(set(indices)):
+        raise ValueError(
+            f"Question indices in several shards of {predictions_file_name}, the shards are not a partition"
+        )
+    return sorted(prediction_result, key=lambda item: item["idx"])
+
+
+def merge_usage(dirs: list, usage_file_name: str) -> dict:
+    """
+    The LLM usage of all the shards (see pipeline/usage.py): the totals and the components are summed, the samples
+    are joined. The tokens/sec are summed too, as the shards run concurrently.
+    """
+    merged = {
+        "total": {},
+        "components": {},
+        "samples": {},
+        "tokens_per_second": 0.0,
+        "prices": {},
+    }
+    for shard_dir in dirs:
+        usage_path = f"{shard_dir}{usage_file_name}"
+        if not os.path.exists(usage_path):
+            logger.warning(f"==> No {usage_file_name} in {shard_dir}")
+            continue
+        with open(usage_path, "r") as f:
+            usage = json.load(f)
+        add_usage(merged["total"], usage["total"])
+        for component, component_usage in usage["components"].items():
+            add_usage(merged["components"].setdefault(component, {}), component_usage)
+        merged["samples"].update(usage["samples"])
+        merged["tokens_per_second"] += usage["tokens_per_second"]
+        merged["prices"] = usage["prices"]
+    merged["cost_usd_per_sample"] = (
+        sum(sample["cost_usd"] for sample in merged["samples"].values())
+        / len(merged["samples"])
+        if merged["samples"]
+        else 0.0
+    )
+    return merged
+
+
+if __name__ == "__main__":
+    experiment_result_path = (
+        f"{config.path.experiment_result.base}{config.experiment_name}/"
+    )
+    logger = ExperimentLogger(
+        "", log_path=experiment_result_path, logger_level=config.logger_level
+    )
+    dirs = shard_dirs(experiment_result_path)
+    for file_name in EXPERIMENT_INFO_FILES:
+        if os.path.exists(f"{dirs[0]}{file_name}"):
+            shutil.copyfile(
+                f"{dirs[0]}{file_name}", f"{experiment_result_path}{file_name}"
+            )
+
+    experiment_result = config.path.experiment_result
+    for predictions_file_name, metrics_file_name in [
+        (experiment_result.predictions, experiment_result.metrics),
+        (
+            experiment_result.hallucination_predictions,
+            experiment_result.hallucination_metrics,
+        ),
+    ]:
+        prediction_result = merge_predictions(dirs, predictions_file_name)
+        if prediction_result is None:
+            continue
+        metrics = score_predictions(prediction_result)
+        with open(f"{experiment_result_path}{predictions_file_name}", "w") as f:
+            json.dump(prediction_result, f)
+        with open(f"{experiment_result_path}{metrics_file_name}", "w") as f:
+            json.dump(metrics, f)
+        logger.info(
+            f"==> Merged {len(prediction_result)} records of {len(dirs)} shards into "
+            f"{experiment_result_path}{predictions_file_name}: precision {metrics['precision']:.4f}"
+            + (
+                f", specificity {metrics['specificity']:.4f}"
+                if "specificity" in metrics
+                else ""
+            )
+        )
+
+    usage = merge_usage(dirs, experiment_result.usage)
+    with open(f"{experiment_result_path}{experiment_result.usage}", "w") as f:
+        json.dump(usage, f, indent=4)
+    logger.info(
+        f"==> Merged LLM usage: {usage['total'].get('calls', 0)} calls, ${usage['total'].get('cost_usd', 0.0):.4f}"
+    )
@@ -1,47 +1,107 @@
-from model.answer_generator.base_llm_answer_generator import *
-from model.answer_generator.llm_multishot_answer_generator import *
+import importlib
+from collections.abc import Mapping
 
-from model.triplet_generator.llm_multishot_triplet_generator import *
-from model.triplet_generator.llm_triplet_generator import *
+"""
+The components are resolved lazily: importing `model` imports none of the component modules (nor LangChain), the
+module of a component is imported the first time its class is looked up in model_name_class_mapping or imported from
+`model`.
+"""
 
-from model.fact_checker.llm_multishot_split_fact_checker import *
-from model.fact_checker.llm_multishot_fact_checker import *
-from model.fact_checker.partial_match_fact_checker import *
-from model.fact_checker.exact_match_fact_checker import *
-from model.fact_checker.llm_split_fact_checker import *
-from model.fact_checker.llm_fact_checker import *
+# class name -> module of the class
+COMPONENT_MODULES = {
+    "BaseLLMAnswerGenerator": "model.answer_generator.base_llm_answer_generator",
+    "LLMMultiShotAnswerGenerator": "model.answer_generator.llm_multishot_answer_generator",
+    "LLMMultiShotTripletGenerator": "model.triplet_generator.llm_multishot_triplet_generator",
+    "LLMTripletGenerator": "model.triplet_generator.llm_triplet_generator",
+    "RuleBasedTripletGenerator": "model.triplet_generator.rule_based_triplet_generator",
+    "LLMMultiShotSplitFactChecker": "model.fact_checker.llm_multishot_split_fact_checker",
+    "LLMMultiShotFactChecker": "model.fact_checker.llm_multishot_fact_checker",
+    "PartialMatchFactChecker": "model.fact_checker.partial_match_fact_checker",
+    "ExactMatchFactChecker": "model.fact_checker.exact_match_fact_checker",
+    "LLMSplitFactChecker": "model.fact_checker.llm_split_fact_checker",
+    "LLMFactChecker": "model.fact_checker.llm_fact_checker",
+    "LLMMultiShotHallucinationDataGenerator": "model.hallucination_data_generator.llm_multishot_hallucination_data_generator",
+    "LLMHallucinationDataGenerator": "model.hallucination_data_generator.llm_hallucination_data_generator",
+    "HallucinationDataGenerator": "model.hallucination_data_generator.hallucination_data_generator",
+    "Reprompter": "model.reprompter.reprompter",
+}
+
+
+def resolve_component(class_name: str) -> type:
+    """
+    The component class `class_name`, importing its module (see COMPONENT_MODULES) on first use.
+    """
+    return getattr(importlib.import_module(COMPONENT_MODULES[class_name]), class_name)
+
+
+class LazyComponentMapping(Mapping):
+    """
+    A read only mapping of component names to component classes, resolving a class when it is looked up.
+
+    Args:
+        class_names (dict): component name -> class name (a key of COMPONENT_MODULES).
+    """
+
+    def __init__(self, class_names: dict):
+        self.class_names = class_names
 
-from model.hallucination_data_generator.llm_multishot_hallucination_data_generator import *
-from model.hallucination_data_generator.llm_hallucination_data_generator import *
+    def __getitem__(self, name: str) -> type:
+        return resolve_component(self.class_names[name])
+
+    def __iter__(self):
+        return iter(self.class_names)
+
+    def __len__(self) -> int:
+        return len(self.class_names)
+
+    def __repr__(self) -> str:
+        return f"LazyComponentMapping({self.class_names})"
 
-from model.reprompter.reprompter import *
 
 model_name_class_mapping = {
-    "answer_generator": {
-        "base_llm": BaseLLMAnswerGenerator,
-        "llm_n_shot": LLMMultiShotAnswerGenerator,
-    },
-    "triplet_generator": {
-        "llm": LLMTripletGenerator,
-        "llm_n_shot": LLMMultiShotTripletGenerator,
-    },
-    "fact_checker": {
-        "exact_match": ExactMatchFactChecker,
-        "partial_match": PartialMatchFactChecker,
-        "llm": LLMFactChecker,
-        "llm_split": LLMSplitFactChecker,
-        "llm_n_shot": LLMMultiShotFactChecker,
-        "llm_n_shot_split": LLMMultiShotSplitFactChecker,
-    },
-    "hallucination_data_generator": {
-        "llm": LLMHallucinationDataGenerator,
-        "llm_n_shot": LLMMultiShotHallucinationDataGenerator,
-    },
-    "reprompter": {"llm": Reprompter},
+    "answer_generator": LazyComponentMapping(
+        {
+            "base_llm": "BaseLLMAnswerGenerator",
+            "llm_n_shot": "LLMMultiShotAnswerGenerator",
+        }
+    ),
+    "triplet_generator": LazyComponentMapping(
+        {
+            "llm": "LLMTripletGenerator",
+            "llm_n_shot": "LLMMultiShotTripletGenerator",
+            "openie": "RuleBasedTripletGenerator",
+        }
+    ),
+    "fact_checker": LazyComponentMapping(
+        {
+            "exact_match": "ExactMatchFactChecker",
+            "partial_match": "PartialMatchFactChecker",
+            "llm": "LLMFactChecker",
+            "llm_split": "LLMSplitFactChecker",
+            "llm_n_shot": "LLMMultiShotFactChecker",
+            "llm_n_shot_split": "LLMMultiShotSplitFactChecker",
+        }
+    ),
+    "hallucination_data_generator": LazyComponentMapping(
+        {
+            "llm": "LLMHallucinationDataGenerator",
+            "llm_n_shot": "LLMMultiShotHallucinationDataGenerator",
+        }
+    ),
+    "reprompter": LazyComponentMapping({"llm": "Reprompter"}),
 }
+
+
+def __getattr__(name: str):
+    if name in COMPONENT_MODULES:
+        return resolve_component(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 __all__ = [
     "BaseLLMAnswerGenerator",
     "LLMTripletGenerator",
+    "RuleBasedTripletGenerator",
     "ExactMatchFactChecker",
     "PartialMatchFactChecker",
     "LLMFactChecker",
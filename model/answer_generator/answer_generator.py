@@ -1,5 +1,6 @@
 from utils.utils import *
 from pipeline import *
+from utils.tracing import span
 from abc import abstractmethod
 from typing import List
 
@@ -16,6 +17,9 @@ class AnswerGenerator(PipelineLLM):
     Methods:
         - forward(data: str) -> str: An abstract method to be implemented in subclasses, defining
                                      how the input data is processed to generate an answer.
+        - run(reference_documents: List[str], question: str) -> dict: Prompts and runs forward with the inputs and
+                                     outputs named as in input_output_format (used by rag/dataflow.py).
+        - run_prompt(question_prompt) -> dict: `run` from an already built prompt (e.g. a reprompt).
     """
 
     def __init__(self, config: dict, logger: logging.Logger):
@@ -29,6 +33,17 @@ class AnswerGenerator(PipelineLLM):
         """
         raise NotImplementedError
 
+    def run(self, reference_documents: List[str], question: str) -> dict:
+        question_prompt = self.get_model_prompt(
+            reference_documents=reference_documents, question=question
+        )
+        with span(f"{type(self).__name__}.forward", "component"):
+            return {"generated_answer": self.forward(question_prompt)}
+
+    def run_prompt(self, question_prompt) -> dict:
+        with span(f"{type(self).__name__}.forward", "component"):
+            return {"generated_answer": self.forward(question_prompt)}
+
     @property
     def input_output_format(self):
         return {
@@ -45,7 +45,11 @@ class BaseLLMAnswerGenerator(AnswerGenerator, PipelinePrompt):
         Returns:
             str: The content generated by the model.
         """
-        return self.model.invoke(message_list).content
+        return self.invoke_model(message_list)
+
+    @property
+    def prompt_template_names(self):
+        return ["answer_generation"]
 
     def get_model_prompt(self, reference_documents: List[str], question: str, **kwargs):
 
@@ -25,7 +25,11 @@ class LLMMultiShotAnswerGenerator(AnswerGenerator, PipelineDemonstration):
         Returns:
             str: The content generated by the model.
         """
-        return self.model.invoke(message_list).content
+        return self.invoke_model(message_list)
+
+    @property
+    def prompt_template_names(self):
+        return ["n_shot_answer_generation"]
 
     def get_model_prompt(self, reference_documents: List[str], question: str, **kwargs):
         examples = self.get_demo_data_by_idx(
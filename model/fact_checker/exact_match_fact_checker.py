@@ -35,7 +35,10 @@ class ExactMatchFactChecker(FactChecker):
         Returns:
             Tuple[Dict[int, bool], None]: A dictionary where the keys are the indices of the input triplets and the values are booleans indicating whether each triplet exists in the source dataset, and None.
         """
-        reference_triplets = self.flatten_triplets(reference_triplets)
+        reference_triplets = self.canonicalise_triplets(
+            self.flatten_triplets(reference_triplets)
+        )
+        answer_triplets = self.canonicalise_triplets(answer_triplets)
 
         fact_check_prediction_binary = {
             idx: self.check_triplet_exists_in_dataset(
@@ -1,5 +1,7 @@
 from utils.utils import *
+from utils.entity_normalizer import get_entity_canonicaliser
 from pipeline import *
+from utils.tracing import span
 from abc import abstractmethod
 from typing import List, Tuple
 
@@ -18,6 +20,9 @@ class FactChecker(PipelineBase):
     check_triplet_exists_in_dataset(triplet: List[List], source_triplets: List[List])
         Abstract method to check if a triplet exists in the dataset. Must be implemented by subclasses.
 
+    run(answer_triplets: List[List], reference_triplets: List[List]) -> dict
+        Runs forward with the inputs and outputs named as in input_output_format (used by rag/dataflow.py).
+
     Properties:
     input_output_format
         Returns the expected input and output format for the fact-checking pipeline.
@@ -26,6 +31,7 @@ class FactChecker(PipelineBase):
     def __init__(self, config: dict, logger: logging.Logger):
         super().__init__(config)
         self.logger = logger
+        self.canonicaliser = get_entity_canonicaliser(config, logger)
 
     @abstractmethod
     def forward(
@@ -47,6 +53,13 @@ class FactChecker(PipelineBase):
         """
         raise NotImplementedError
 
+    def run(self, answer_triplets: List[List], reference_triplets: List[List]) -> dict:
+        with span(f"{type(self).__name__}.forward", "component"):
+            fact_check_prediction_binary, prediction_raw = self.forward(
+                answer_triplets, reference_triplets
+            )
+        return {"fact_check_prediction_binary": fact_check_prediction_binary}
+
     @property
     def input_output_format(self):
         return {
@@ -60,6 +73,15 @@ class FactChecker(PipelineBase):
         """
         return [triplet for sublist in triplet_segments for triplet in sublist]
 
+    def canonicalise_triplets(self, triplets: List[List[str]]) -> List[List[str]]:
+        """
+        Rewrite the entity aliases of the triplets into their canonical forms (see utils/entity_normalizer.py),
+        so that "TTF1" and "thyroid transcription factor 1" match. No-op if entity normalisation is off.
+        """
+        if self.canonicaliser is None:
+            return triplets
+        return self.canonicaliser.canonicalise_triplets(triplets)
+
     def merge_segment_outputs(self, output_list):
         if not output_list:
             self.logger.error("Empty fect check output list")
@@ -1,5 +1,6 @@
 from model.fact_checker.fact_checker import *
 from pipeline import *
+from utils.tracing import span
 
 
 class LLMFactChecker(FactChecker, PipelineLLM, PipelinePrompt):
@@ -47,10 +48,17 @@ class LLMFactChecker(FactChecker, PipelineLLM, PipelinePrompt):
         """
         if self.config.model.fact_checker.split_reference_triplets:
             output_list = []
-            for segment in reference_triplets:
-                fact_check_prediction, _ = self.model_forward(
-                    answer_triplets, segment, False  # temporal hard code
-                )
+            for segment_idx, segment in enumerate(reference_triplets):
+                with span(
+                    "segment",
+                    "segment",
+                    segment=segment_idx,
+                    num_segments=len(reference_triplets),
+                    num_reference_triplets=len(segment),
+                ):
+                    fact_check_prediction, _ = self.model_forward(
+                        answer_triplets, segment, False  # temporal hard code
+                    )
                 output_list.append(fact_check_prediction)
             return self.merge_segment_outputs(output_list), None
         else:
@@ -71,7 +79,7 @@ class LLMFactChecker(FactChecker, PipelineLLM, PipelinePrompt):
             answer_triplets=answer_triplets, reference_triplets=reference_triplets
         )
         # Invoke the LLM with the constructed prompt to get the raw matching result as text
-        match_result = self.model.invoke(triplet_comparison_prompt).content
+        match_result = self.invoke_model(triplet_comparison_prompt)
         # Parse the raw string output into a structured dictionary of triplet_idx: boolean_result
         if return_prompt:
             return (
@@ -82,6 +90,10 @@ class LLMFactChecker(FactChecker, PipelineLLM, PipelinePrompt):
         else:
             return self.parse_triplet_comparison_output(match_result), None
 
+    @property
+    def prompt_template_names(self):
+        return ["triplet_match_test"]
+
     def get_model_prompt(
         self,
         answer_triplets: List[List],
@@ -1,5 +1,6 @@
 from model.fact_checker.fact_checker import *
 from pipeline import *
+from utils.tracing import span
 
 
 class LLMMultiShotFactChecker(FactChecker, PipelineLLM, PipelineDemonstration):
@@ -47,7 +48,7 @@ class LLMMultiShotFactChecker(FactChecker, PipelineLLM, PipelineDemonstration):
         """
         if self.config.model.fact_checker.split_reference_triplets:
             output_list = []
-            for segment in reference_triplets:
+            for segment_idx, segment in enumerate(reference_triplets):
                 self.logger.debug(
                     "Segment: %s",
                     "\n-".join(
@@ -58,9 +59,16 @@ class LLMMultiShotFactChecker(FactChecker, PipelineLLM, PipelineDemonstration):
                     ),
                 )
                 self.logger.debug("segment length: %s", len(segment))
-                fact_check_prediction, _ = self.model_forward(
-                    answer_triplets, segment, False  # temporal hard code
-                )
+                with span(
+                    "segment",
+                    "segment",
+                    segment=segment_idx,
+                    num_segments=len(reference_triplets),
+                    num_reference_triplets=len(segment),
+                ):
+                    fact_check_prediction, _ = self.model_forward(
+                        answer_triplets, segment, False  # temporal hard code
+                    )
                 output_list.append(fact_check_prediction)
             return self.merge_segment_outputs(output_list), None
         else:
@@ -86,7 +94,7 @@ class LLMMultiShotFactChecker(FactChecker, PipelineLLM, PipelineDemonstration):
                 answer_triplets=answer_triplets, reference_triplets=reference_triplets
             )
         # Invoke the LLM with the constructed prompt to get the raw matching result as text
-        match_result = self.model.invoke(triplet_comparison_prompt).content
+        match_result = self.invoke_model(triplet_comparison_prompt)
         # Parse the raw string output into a structured dictionary of triplet_idx: boolean_result
         if return_prompt:
             if self.config.model.fact_checker.inquiry_mode:
@@ -107,6 +115,13 @@ class LLMMultiShotFactChecker(FactChecker, PipelineLLM, PipelineDemonstration):
             else:
                 return self.parse_triplet_comparison_output(match_result), None
 
+    @property
+    def prompt_template_names(self):
+        return [
+            "n_shot_triplet_match_test_1",
+            self.config.model.fact_checker.inquiry_prompt,
+        ]
+
     def get_model_prompt(
         self,
         answer_triplets: List[List],
@@ -141,7 +156,9 @@ class LLMMultiShotFactChecker(FactChecker, PipelineLLM, PipelineDemonstration):
             demo_type="fact_checker",
         )
         # Use the template message with the formatted input (answer and reference triplets)
-        return self.message_list_template["n_shot_triplet_match_test_inquiry_3"].invoke(
+        return self.message_list_template[
+            self.config.model.fact_checker.inquiry_prompt
+        ].invoke(
             input=self.triplet_comparison_input_formatter(
                 answer_triplets=answer_triplets,
                 reference_triplets=reference_triplets,
@@ -1,5 +1,6 @@
 from model.fact_checker.fact_checker import *
 from pipeline import *
+from utils.tracing import span
 
 
 class LLMSplitFactChecker(FactChecker, PipelineLLM, PipelinePrompt):
@@ -57,18 +58,29 @@ class LLMSplitFactChecker(FactChecker, PipelineLLM, PipelinePrompt):
         """
         comparison_result = {}
 
+        num_answer_triplets = len(answer_triplets)
         for idx, answer_triplets in enumerate(answer_triplets):
-            splitted_triplet_comparison_prompt = self.get_model_prompt(
-                answer_triplets=answer_triplets,
-                reference_triplets=reference_triplets,
-            )
-            match_result = self.model.invoke(splitted_triplet_comparison_prompt).content
-            parsed_output = self.parse_splitted_triplet_comparison_output(
-                match_result, answer_triplets
-            )
+            with span(
+                "segment",
+                "segment",
+                answer_triplet=idx,
+                num_segments=num_answer_triplets,
+            ):
+                splitted_triplet_comparison_prompt = self.get_model_prompt(
+                    answer_triplets=answer_triplets,
+                    reference_triplets=reference_triplets,
+                )
+                match_result = self.invoke_model(splitted_triplet_comparison_prompt)
+                parsed_output = self.parse_splitted_triplet_comparison_output(
+                    match_result, answer_triplets
+                )
             comparison_result[idx] = parsed_output
         return comparison_result, None
 
+    @property
+    def prompt_template_names(self):
+        return ["triplet_match_test"]
+
     def get_model_prompt(
         self, answer_triplets: list, reference_triplets: list, **kwargs
     ):
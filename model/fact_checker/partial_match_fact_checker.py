@@ -31,7 +31,10 @@ class PartialMatchFactChecker(FactChecker):
                     - The first dictionary maps indices to boolean values indicating if a match was found.
                     - The second dictionary maps indices to the detailed match results.
         """
-        source_triplets = self.flatten_triplets(source_triplets)
+        source_triplets = self.canonicalise_triplets(
+            self.flatten_triplets(source_triplets)
+        )
+        data = self.canonicalise_triplets(data)
 
         match_results = {
             idx: self.check_partial_match_in_dataset(
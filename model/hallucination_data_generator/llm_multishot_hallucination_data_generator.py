@@ -183,9 +183,7 @@ class LLMMultiShotHallucinationDataGenerator(
             reference_documents=original_dataset["reference_documents"],
             question=original_dataset["question"],
         )
-        hlcntn_data_generation_output = self.model.invoke(
-            hlcntn_generation_prompt
-        ).content
+        hlcntn_data_generation_output = self.invoke_model(hlcntn_generation_prompt)
 
         generated_non_hlcntn_answer, generated_hlcntn_answer, hlcntn_part = (
             self.parse_hlcntn_data_generation_output(hlcntn_data_generation_output)
@@ -260,7 +258,7 @@ class LLMMultiShotHallucinationDataGenerator(
             non_hallucinated_triplets=non_hlcntn_triplets,
             answer_triplets=hlcntn_triplets,
         )
-        hlcntn_extraction_output = self.model.invoke(hlcntn_generation_prompt).content
+        hlcntn_extraction_output = self.invoke_model(hlcntn_generation_prompt)
         hlcntn_index = self.validate_and_parse_hlcntn_extraction_output(
             hlcntn_extraction_output, hlcntn_generation_prompt
         )
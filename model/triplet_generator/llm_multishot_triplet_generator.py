@@ -1,6 +1,28 @@
 from model.triplet_generator.triplet_generator import *
+from model.triplet_generator.rule_based_triplet_generator import (
+    RuleBasedTripletGenerator,
+)
 from utils.utils import *
+from utils.cache import PersistentCache
+from utils.text_utils import estimate_tokens, split_sentences
+from utils.entity_normalizer import get_entity_canonicaliser, normalise_alias
 from pipeline import *
+from typing import Any, Dict, Optional
+import ast
+import json
+import os
+import re
+
+BATCH_SECTION_PATTERN = re.compile(
+    r"\[PASSAGE ([^\]]+)\](.*?)\[END PASSAGE \1\]", re.DOTALL
+)
+
+
+def get_chunking_curve_path(config) -> str:
+    """
+    Path of the latency/tokens curve measured by calibrate_chunking.py for the configured generator model.
+    """
+    return f"{config.path.data.base}{config.path.data.chunking_curve}_{config.model.llm.generator_model}.json"
 
 
 class LLMMultiShotTripletGenerator(
@@ -17,6 +39,15 @@ class LLMMultiShotTripletGenerator(
     forward(self, data: str) -> List[Tuple[str, str, str]]
         Generates triplets from the input data.
 
+    forward_batch(self, passages: Dict[Any, str]) -> Dict[Any, List]
+        Generates triplets for many passages, packing several passages per request.
+
+    forward_sentences(self, data: str, return_prompt: bool = False) -> List
+        Generates triplets sentence by sentence, only extracting the sentences missing from the sentence cache.
+
+    forward_chunked(self, data: str) -> List
+        Generates triplets of a long passage from overlapping sentence windows extracted concurrently.
+
     default_triplet(self)
         Returns the default triplet.
 
@@ -34,12 +65,30 @@ class LLMMultiShotTripletGenerator(
         TripletGenerator.__init__(self, config, logger)
         PipelineLLM.__init__(self, config)
         PipelineDemonstration.__init__(self, config)
+        self.sentence_cache = None
+        if self.config.model.triplet_generator.sentence_cache.enabled:
+            self.sentence_cache = PersistentCache(
+                f"{self.config.path.cache}triplet_sentences"
+            )
+        self.sentence_cache_stats = {"sentences": 0, "extracted_sentences": 0}
+        # part of the sentence cache keys, so that editing the prompts invalidates the cached sentences
+        self.sentence_cache_prompt_hash = self.prompt_template_hash()
+        # rule based pre-extraction, the LLM only refines its candidate triplets
+        self.openie = None
+        if self.config.model.triplet_generator.openie_prepass:
+            self.openie = RuleBasedTripletGenerator(config, logger)
+        self.chunking = self.config.model.triplet_generator.chunking
+        self.chunking_curve = (
+            self.load_chunking_curve() if self.chunking.enabled else None
+        )
 
     def forward(
         self, data: str, return_prompt: bool = False
     ) -> List[Tuple[str, str, str]]:
         """
         Processes the input data to generate triplets using a model.
+        If the sentence cache is enabled, the text is processed sentence by sentence (see `forward_sentences`),
+        otherwise if chunking is enabled, long texts are processed in overlapping windows (see `forward_chunked`).
 
         Args:
             data (str): The input text data from which triplets are to be generated.
@@ -47,8 +96,26 @@ class LLMMultiShotTripletGenerator(
         Returns:
             List[Tuple[str, str, str]]: A list of triplets generated from the input data.
         """
-        triplet_generation_prompt = self.get_model_prompt(text_input=data)
-        triplet_generation_output = self.model.invoke(triplet_generation_prompt).content
+        if self.sentence_cache is not None:
+            return self.forward_sentences(data, return_prompt=return_prompt)
+        if (
+            self.chunking.enabled
+            and not return_prompt
+            and estimate_tokens(data) > self.chunking.min_passage_tokens
+        ):
+            return self.forward_chunked(data)
+        return self.forward_single(data, return_prompt=return_prompt)
+
+    def forward_single(
+        self, data: str, return_prompt: bool = False, usage: Optional[dict] = None
+    ):
+        """
+        Generates the triplets of the whole input text with a single request (see `invoke_model` for `usage`).
+        """
+        triplet_generation_prompt = self.get_extraction_prompt(data)
+        triplet_generation_output = self.invoke_model(
+            triplet_generation_prompt, usage=usage
+        )
         if return_prompt:
             return (
                 self.parse_triplet_generation_output(triplet_generation_output),
@@ -57,10 +124,473 @@ class LLMMultiShotTripletGenerator(
         else:
             return self.parse_triplet_generation_output(triplet_generation_output)
 
+    def forward_chunked(self, data: str) -> List:
+        """
+        Generates the triplets of a long passage. The passage is split into windows of whole sentences, consecutive
+        windows sharing `chunking.overlap_sentences` sentences so that facts spanning a window boundary are seen whole.
+        The windows are extracted concurrently (at most `chunking.max_concurrency` requests in flight), and the merged
+        triplets are deduplicated (see `dedupe_triplets`).
+
+        The window size is picked per passage from the measured latency curve (see `choose_chunk_tokens`).
+
+        Args:
+            data (str): The input text data from which triplets are to be generated.
+
+        Returns:
+            List: The deduplicated triplets of all the windows, in order of first appearance.
+        """
+        chunk_tokens = self.choose_chunk_tokens(data)
+        chunks = self.chunk_passage(data, chunk_tokens)
+        if len(chunks) == 1:
+            return self.forward_single(data)
+
+        outputs = self.invoke_model_batch(
+            [self.get_extraction_prompt(chunk) for chunk in chunks],
+            max_concurrency=self.chunking.max_concurrency,
+        )
+        triplets = [
+            triplet
+            for output in outputs
+            for triplet in self.parse_triplet_generation_output(output)
+        ]
+        merged = self.dedupe_triplets(triplets)
+        self.logger.debug(
+            f"==> Chunked triplet generation: {len(chunks)} windows of ~{chunk_tokens} tokens, "
+            f"{len(triplets)} triplets, {len(merged)} after deduplication"
+        )
+        return merged
+
+    def chunk_passage(self, data: str, chunk_tokens: int) -> List[str]:
+        """
+        Split a text into windows of whole sentences of at most `chunk_tokens` tokens (a longer sentence is a window
+        on its own). Consecutive windows share their last / first `chunking.overlap_sentences` sentences.
+
+        Returns:
+            List[str]: The windows, in order.
+        """
+        sentences = split_sentences(data)
+        sentence_tokens = [estimate_tokens(sentence) for sentence in sentences]
+        chunks, start = [], 0
+        while start < len(sentences):
+            end, tokens = start, 0
+            while end < len(sentences) and (
+                end == start or tokens + sentence_tokens[end] <= chunk_tokens
+            ):
+                tokens += sentence_tokens[end]
+                end += 1
+            chunks.append(" ".join(sentences[start:end]))
+            if end >= len(sentences):
+                break
+            start = max(end - self.chunking.overlap_sentences, start + 1)
+        return chunks
+
+    def choose_chunk_tokens(self, data: str) -> int:
+        """
+        Pick the window size minimising the estimated wall time of a passage. With the curve of calibrate_chunking.py
+        (the latency of a wave of `max_concurrency` concurrent requests, per window size) the wall time of a size is
+        its number of waves times its latency; ties go to the larger window, which repeats the prompt fewer times.
+        Without a curve, `chunking.chunk_tokens` is used.
+
+        Returns:
+            int: The window size, in tokens.
+        """
+        if not self.chunking_curve:
+            return self.chunking.chunk_tokens
+        best_time, best_chunk_tokens = None, None
+        for point in self.chunking_curve["points"]:
+            num_chunks = len(self.chunk_passage(data, point["chunk_tokens"]))
+            num_waves = -(-num_chunks // self.chunking.max_concurrency)
+            estimated_time = num_waves * point["latency"]
+            if (
+                best_time is None
+                or estimated_time < best_time
+                or (
+                    estimated_time == best_time
+                    and point["chunk_tokens"] > best_chunk_tokens
+                )
+            ):
+                best_time, best_chunk_tokens = estimated_time, point["chunk_tokens"]
+        return best_chunk_tokens
+
+    def load_chunking_curve(self) -> Optional[dict]:
+        """
+        Load the latency/tokens curve of the generator model, or None if calibrate_chunking.py has not been run.
+        """
+        curve_path = get_chunking_curve_path(self.config)
+        if not os.path.exists(curve_path):
+            self.logger.info(
+                f"==> No chunking curve at {curve_path}, using windows of {self.chunking.chunk_tokens} tokens"
+            )
+            return None
+        with open(curve_path, "r") as f:
+            return json.load(f)
+
+    def dedupe_triplets(self, triplets: List) -> List:
+        """
+        Remove the duplicated triplets of overlapping windows. Triplets are compared lower cased with collapsed
+        whitespaces, and on their canonical entities if entity normalisation is enabled. Default (empty) triplets
+        are dropped.
+
+        Returns:
+            List: The first occurrence of every triplet, in order.
+        """
+        canonicaliser = get_entity_canonicaliser(self.config, self.logger)
+        unique_triplets, seen = [], set()
+        for triplet in triplets:
+            if list(triplet) == self.default_triplet:
+                continue
+            key_triplet = (
+                canonicaliser.canonicalise_triplet(triplet)
+                if canonicaliser is not None
+                else triplet
+            )
+            key = tuple(normalise_alias(element) for element in key_triplet)
+            if key not in seen:
+                seen.add(key)
+                unique_triplets.append(list(triplet))
+        return unique_triplets
+
+    def forward_batch(self, passages: Dict[Any, str]) -> Dict[Any, List]:
+        """
+        Generates triplets for many passages, packing several passages (with their ids) in a single prompt so that the
+        instructions and the few-shot examples are sent once per batch instead of once per passage.
+        Batches are limited by `model.triplet_generator.batch.max_prompt_tokens` and `max_passages`.
+        Any passage whose section is missing or cannot be parsed falls back to a single-passage call (`forward`).
+
+        Args:
+            passages (Dict[Any, str]): passage id -> passage text.
+
+        Returns:
+            Dict[Any, List]: passage id -> triplets, in the order of `passages`.
+        """
+        return {
+            passage_id: triplets
+            for passage_id, (triplets, _) in self.extract_batch(passages).items()
+        }
+
+    def extract_batch(self, passages: Dict[Any, str]) -> Dict[Any, Tuple[List, str]]:
+        """
+        `forward_batch`, also reporting the name of the prompt each passage was extracted with: the batched prompt, or
+        the single-text prompt for single-passage batches and fallbacks.
+
+        Returns:
+            Dict[Any, Tuple[List, str]]: passage id -> (triplets, prompt name), in the order of `passages`.
+        """
+        results = {}
+        num_fallbacks = 0
+        # the usage of this call only, self.token_usage also counts the concurrent calls of the component
+        usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+        for batch_ids in self.pack_passages(passages):
+            if len(batch_ids) == 1:
+                results[batch_ids[0]] = (
+                    self.forward_single(passages[batch_ids[0]], usage=usage),
+                    self.extraction_prompt_name,
+                )
+                continue
+
+            batch_prompt = self.get_batch_model_prompt(
+                {passage_id: passages[passage_id] for passage_id in batch_ids}
+            )
+            batch_output = self.invoke_model(batch_prompt, usage=usage)
+            sections = self.parse_batch_triplet_generation_output(
+                batch_output, batch_ids
+            )
+            for passage_id in batch_ids:
+                if sections[passage_id] is None:
+                    self.logger.debug(
+                        "Batched triplet generation failed for passage %s, falling back to a single call",
+                        passage_id,
+                    )
+                    num_fallbacks += 1
+                    results[passage_id] = (
+                        self.forward_single(passages[passage_id], usage=usage),
+                        self.extraction_prompt_name,
+                    )
+                else:
+                    results[passage_id] = (sections[passage_id], self.batch_prompt_name)
+
+        self.logger.debug(
+            f"==> Batched triplet generation: {len(passages)} passages in {usage['calls']} calls "
+            f"({num_fallbacks} fallbacks), "
+            f"{usage['input_tokens'] / max(len(passages), 1):.0f} input / "
+            f"{usage['output_tokens'] / max(len(passages), 1):.0f} output tokens per passage"
+        )
+        return {passage_id: results[passage_id] for passage_id in passages}
+
+    def forward_sentences(self, data: str, return_prompt: bool = False) -> List:
+        """
+        Generates the triplets of a text sentence by sentence, memoising the triplets of every sentence in a persistent
+        cache. Texts that share sentences (retries, reprompts, the original and the hallucinated answer) only send their
+        new or changed sentences to the LLM, all together in one batched request (`forward_batch`).
+        Only the successfully parsed extractions are cached (see `is_failed_extraction`), so that a retry extracts the
+        failed sentences again.
+
+        Args:
+            data (str): The input text data from which triplets are to be generated.
+            return_prompt (bool): Whether to also return the prompt, None as the sentences are extracted in batches
+                                  (or not at all when they are all cached).
+
+        Returns:
+            List: The triplets of all the sentences, in the order of the sentences.
+        """
+        sentences = split_sentences(data)
+        # normalised sentence -> its first occurrence, sent to the LLM if it is not cached
+        unique_sentences = {}
+        for sentence in sentences:
+            unique_sentences.setdefault(" ".join(sentence.split()), sentence)
+        sentence_triplets = {
+            normalised: self.get_cached_sentence(normalised)
+            for normalised in unique_sentences
+        }
+
+        new_sentences = [
+            normalised
+            for normalised, triplets in sentence_triplets.items()
+            if triplets is None
+        ]
+        if new_sentences:
+            extracted = self.extract_batch(
+                {
+                    idx: unique_sentences[normalised]
+                    for idx, normalised in enumerate(new_sentences)
+                }
+            )
+            for idx, normalised in enumerate(new_sentences):
+                triplets, prompt_name = extracted[idx]
+                if not self.is_failed_extraction(triplets):
+                    self.sentence_cache.set(
+                        self.sentence_cache_key(normalised, prompt_name), triplets
+                    )
+                sentence_triplets[normalised] = triplets
+
+        self.sentence_cache_stats["sentences"] += len(sentences)
+        self.sentence_cache_stats["extracted_sentences"] += len(new_sentences)
+        self.logger.debug(
+            f"==> Sentence cache: {len(new_sentences)}/{len(sentences)} sentences extracted"
+        )
+        triplets = [
+            list(triplet)
+            for sentence in sentences
+            for triplet in sentence_triplets[" ".join(sentence.split())]
+        ]
+        if return_prompt:
+            return triplets, None
+        return triplets
+
+    def is_failed_extraction(self, triplets) -> bool:
+        """
+        Whether the triplets of an extraction come from a failed parse: default triplets, or not a list of triplets.
+        """
+        return not isinstance(triplets, (list, tuple)) or any(
+            not isinstance(triplet, (list, tuple))
+            or len(triplet) != 3
+            or list(triplet) == self.default_triplet
+            for triplet in triplets
+        )
+
+    def get_cached_sentence(self, sentence: str) -> Optional[List]:
+        """
+        The cached triplets of a sentence, extracted with the batched or the single-text prompt, or None.
+        """
+        for prompt_name in (self.batch_prompt_name, self.extraction_prompt_name):
+            triplets = self.sentence_cache.get(
+                self.sentence_cache_key(sentence, prompt_name)
+            )
+            if triplets is not None:
+                return triplets
+        return None
+
+    def sentence_cache_key(self, sentence: str, prompt_name: str) -> str:
+        """
+        Key of a sentence in the sentence cache. It includes everything changing the extraction of the sentence:
+        the name of the prompt it was extracted with, the prompt templates (their content, not only their name),
+        the LLM endpoint and the model settings.
+        """
+        return self.sentence_cache.make_key(
+            prompt_name,
+            self.sentence_cache_prompt_hash,
+            self.config.model.llm.get("base_url"),
+            self.config.model.llm.generator_model,
+            self.config.model.llm.temperature,
+            self.config.model.triplet_generator.num_shot,
+            " ".join(sentence.split()),
+        )
+
+    def pack_passages(self, passages: Dict[Any, str]) -> List[List[Any]]:
+        """
+        Greedily pack the passages into batches, in order. The fixed part of the prompt (instructions and examples)
+        is counted once per batch. A passage larger than the budget goes alone in its batch.
+
+        Returns:
+            List[List[Any]]: The passage ids of each batch.
+        """
+        batch_config = self.config.model.triplet_generator.batch
+        prompt_overhead = estimate_tokens(
+            "".join(message.content for message in self.get_batch_model_prompt({}))
+        )
+        budget = batch_config.max_prompt_tokens - prompt_overhead
+
+        batches, current_batch, current_tokens = [], [], 0
+        for passage_id, passage in passages.items():
+            passage_tokens = estimate_tokens(
+                self.format_batch_passage(passage_id, passage)
+            )
+            if current_batch and (
+                current_tokens + passage_tokens > budget
+                or len(current_batch) >= batch_config.max_passages
+            ):
+                batches.append(current_batch)
+                current_batch, current_tokens = [], 0
+            current_batch.append(passage_id)
+            current_tokens += passage_tokens
+        if current_batch:
+            batches.append(current_batch)
+        return batches
+
+    def format_batch_passage(self, passage_id: Any, passage: str) -> str:
+        """
+        The section of a passage in a batched prompt. With the OpenIE pre-pass, the section carries the candidate
+        triplets of its passage.
+        """
+        if self.openie is not None:
+            candidate_triplets = json.dumps(
+                self.openie.forward(passage), ensure_ascii=False
+            )
+            passage = f"Input Text: {passage}\nCandidate Triplets: {candidate_triplets}"
+        return f"[PASSAGE {passage_id}]\n{passage}\n[END PASSAGE {passage_id}]"
+
+    def get_batch_model_prompt(self, passages: Dict[Any, str]):
+        """
+        Create the prompt of a batch of passages, with the same few-shot examples as `get_model_prompt`.
+        With the OpenIE pre-pass, the batched refinement prompt is used instead.
+
+        Args:
+            passages (Dict[Any, str]): passage id -> passage text.
+
+        Returns:
+            The generated prompt for batched triplet generation.
+        """
+        examples = self.get_demo_data_by_idx(
+            idx=9999,
+            num_samples=self.config.model.triplet_generator.num_shot,
+            demo_type="triplet_generator",
+        )
+        input_text = "\n\n".join(
+            self.format_batch_passage(passage_id, passage)
+            for passage_id, passage in passages.items()
+        )
+        return self.message_list_template[self.batch_prompt_name].invoke(
+            input={
+                "input_text": input_text,
+                "examples": examples,
+            }
+        )
+
+    def parse_batch_triplet_generation_output(
+        self, batch_output: str, passage_ids: List[Any]
+    ) -> Dict[Any, Optional[List]]:
+        """
+        Split the output of a batched request into its passage sections and parse each of them.
+
+        Args:
+            batch_output (str): The raw output of the batched request.
+            passage_ids (List[Any]): The passage ids of the batch.
+
+        Returns:
+            Dict[Any, Optional[List]]: passage id -> triplets, or None if the section is missing or not parsable.
+        """
+        sections = {
+            match.group(1).strip(): match.group(2)
+            for match in BATCH_SECTION_PATTERN.finditer(batch_output)
+        }
+        return {
+            passage_id: self.parse_triplet_section(sections.get(str(passage_id)))
+            for passage_id in passage_ids
+        }
+
+    def parse_triplet_section(self, section: Optional[str]) -> Optional[List]:
+        """
+        Strictly parse the triplets of a passage section, unlike `parse_triplet_generation_output`
+        a failure is reported (None) instead of being replaced by default triplets.
+        """
+        if section is None:
+            return None
+        try:
+            result = ast.literal_eval(self.preprocess_output(section))
+        except (ValueError, SyntaxError):
+            return None
+        if not isinstance(result, (list, tuple)) or not all(
+            isinstance(triplet, (list, tuple)) and len(triplet) == 3
+            for triplet in result
+        ):
+            return None
+        return [list(triplet) for triplet in result]
+
+    @property
+    def prompt_template_names(self):
+        return [
+            "n_shot_triplet_generation",
+            "n_shot_batch_triplet_generation",
+            "n_shot_triplet_refinement",
+            "n_shot_batch_triplet_refinement",
+        ]
+
+    @property
+    def extraction_prompt_name(self) -> str:
+        """
+        The single-text extraction prompt (see `get_extraction_prompt`).
+        """
+        if self.openie is not None:
+            return "n_shot_triplet_refinement"
+        return "n_shot_triplet_generation"
+
+    @property
+    def batch_prompt_name(self) -> str:
+        """
+        The batched extraction prompt (see `get_batch_model_prompt`).
+        """
+        if self.openie is not None:
+            return "n_shot_batch_triplet_refinement"
+        return "n_shot_batch_triplet_generation"
+
     @property
     def default_triplet(self):
         return ["", "", ""]
 
+    def get_extraction_prompt(self, text_input: str):
+        """
+        The single-text extraction prompt: the refinement prompt with the OpenIE pre-pass, the generation prompt otherwise.
+        """
+        if self.openie is not None:
+            return self.get_refinement_prompt(text_input=text_input)
+        return self.get_model_prompt(text_input=text_input)
+
+    def get_refinement_prompt(self, text_input: str):
+        """
+        Create a prompt asking the LLM to refine the candidate triplets of the rule based extractor
+        instead of extracting the triplets from scratch.
+
+        Args:
+            text_input (str): The input text.
+
+        Returns:
+            The generated prompt for triplet refinement.
+        """
+        examples = self.get_demo_data_by_idx(
+            idx=9999,
+            num_samples=self.config.model.triplet_generator.num_shot,
+            demo_type="triplet_generator",
+        )
+        return self.message_list_template["n_shot_triplet_refinement"].invoke(
+            input={
+                "input_text": text_input,
+                "candidate_triplets": json.dumps(
+                    self.openie.forward(text_input), ensure_ascii=False
+                ),
+                "examples": examples,
+            }
+        )
+
     def get_model_prompt(self, text_input: str):
         """
         Create a prompt for triplet generation using the provided text input.
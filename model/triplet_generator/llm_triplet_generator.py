@@ -3,6 +3,7 @@ from utils.utils import *
 from pipeline import *
 from typing import Optional
 
+
 class LLMTripletGenerator(TripletGenerator, PipelineLLM, PipelinePrompt):
     """
     LLMTripletGenerator is a class that generates triplets from input data using a language model.
@@ -46,7 +47,7 @@ class LLMTripletGenerator(TripletGenerator, PipelineLLM, PipelinePrompt):
             List[Tuple[str, str, str]]: A list of triplets generated from the input data.
         """
         triplet_generation_prompt = self.get_model_prompt(text_input=data)
-        triplet_generation_output = self.model.invoke(triplet_generation_prompt).content
+        triplet_generation_output = self.invoke_model(triplet_generation_prompt)
         if return_prompt:
             return (
                 self.parse_triplet_generation_output(triplet_generation_output),
@@ -59,6 +60,10 @@ class LLMTripletGenerator(TripletGenerator, PipelineLLM, PipelinePrompt):
     def default_triplet(self):
         return ["", "", ""]
 
+    @property
+    def prompt_template_names(self):
+        return ["triplet_generation_test"]
+
     def get_model_prompt(self, text_input: Optional[str] = None, **kwargs):
         """
         Create a prompt for triplet generation using the provided text input.
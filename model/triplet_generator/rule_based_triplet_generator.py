@@ -0,0 +1,332 @@
+from model.triplet_generator.triplet_generator import *
+from utils.text_utils import split_sentences
+from typing import Optional
+import re
+
+# base forms of the relation verbs, the inflected forms are generated below
+RELATION_VERBS = """
+abolish accelerate accumulate act activate administer affect alleviate alter antagonize appear assess associate attenuate
+bind block catalyze cause change characterize cleave compare comprise confer consist contain contribute control convert
+correlate counteract cure decline decrease define degrade delay demonstrate depend deplete derive describe detect determine
+develop diagnose differ diminish display disrupt downregulate down-regulate drop elevate elicit eliminate enable encode
+enhance evaluate exacerbate examine exceed exert exhibit express extinguish facilitate form function generate govern
+hydrolyze identify impair impede improve inactivate include increase indicate induce infect influence inhibit initiate
+interact interfere investigate involve lack limit localize lower maintain measure mediate metabolize mimic modify modulate
+mutate normalize observe occur originate overexpress phosphorylate play potentiate precede predict present preserve prevent
+produce prolong promote propose protect provide raise reach receive recruit reduce regulate relate release remain replace
+report represent repress require restore result reveal reverse secrete sensitize serve shorten signal silence stabilize
+stimulate suggest suppress survive target transport treat trigger upregulate up-regulate use worsen yield
+""".split()
+
+IRREGULAR_VERB_FORMS = """
+arise arises arose arisen become becomes became bind binds bound do does did done fall falls fell fallen find finds found
+give gives gave given know knows knew known lead leads led make makes made rise rises rose risen see sees saw seen
+show shows showed shown take takes took taken undergo undergoes underwent undergone
+""".split()
+
+COPULAS = {"is", "are", "was", "were", "be", "been", "being"}
+AUXILIARIES = COPULAS | set(
+    "has have had can could may might will would should must does do did".split()
+)
+NEGATIONS = {"not", "no", "never"}
+PREPOSITIONS = set(
+    "to with in by of for from on into as at between against through via within".split()
+)
+# a verb candidate after one of these words is a noun ("the increase in TSH")
+NOUN_CONTEXT = set(
+    "the a an this these that those its their his her our of in for with on by its no any each".split()
+)
+DISCOURSE_MARKERS = [
+    "however",
+    "moreover",
+    "furthermore",
+    "in addition",
+    "additionally",
+    "thus",
+    "therefore",
+    "hence",
+    "in conclusion",
+    "in summary",
+    "finally",
+    "in contrast",
+    "conversely",
+    "similarly",
+    "overall",
+    "and",
+    "but",
+]
+DETERMINERS = {"the", "a", "an"}
+PRONOUNS = {"it", "they", "this", "these", "he", "she"}
+CLAUSE_SPLIT_PATTERN = re.compile(
+    r";|,\s+(?:and|but|whereas|while)\s+|\s+(?:whereas|while)\s+", re.IGNORECASE
+)
+TOKEN_PATTERN = re.compile(r"[^\s,;:]+|[,;:]")
+
+
+def inflections(verb: str) -> List[str]:
+    """
+    The 3rd person, past and gerund forms of a regular verb.
+    """
+    if verb.endswith("e"):
+        past, gerund = verb + "d", verb[:-1] + "ing"
+    elif verb.endswith("y") and verb[-2] not in "aeiou":
+        past, gerund = verb[:-1] + "ied", verb + "ing"
+    else:
+        past, gerund = verb + "ed", verb + "ing"
+    if verb.endswith(("s", "sh", "ch", "x", "z")):
+        third = verb + "es"
+    elif verb.endswith("y") and verb[-2] not in "aeiou":
+        third = verb[:-1] + "ies"
+    else:
+        third = verb + "s"
+    return [verb, third, past, gerund]
+
+
+VERB_FORMS = set(IRREGULAR_VERB_FORMS) | {
+    form for verb in RELATION_VERBS for form in inflections(verb)
+}
+
+
+class RuleBasedTripletGenerator(TripletGenerator):
+    """
+    RuleBasedTripletGenerator is a pure Python, CPU only OpenIE-style triplet generator. It does not call any LLM.
+
+    Every sentence is split into clauses, and in each clause the first relation phrase
+    (auxiliaries, adverbs, negation, a relation verb, and a trailing preposition) splits the clause into
+    [subject, relation, object]. Pronoun subjects are resolved to the subject of the previous triplet, and
+    coordinated verb phrases ("X activates A and inhibits B") produce one triplet per verb.
+
+    Each extraction gets an affinity in [0, 1] (how reliable the relation cue is, times the quality of the subject and
+    object chunks). As in CoreNLP OpenIE, `openie.affinity_probability_cap` is the affinity above which the confidence is
+    1.0, below it the confidence is affinity / cap. Extractions with a confidence under `openie.min_confidence` are dropped.
+
+    Methods:
+        forward(data: str, return_prompt: bool = False) -> List[List[str]]:
+            Extracts the triplets of a text.
+        forward_with_confidence(data: str) -> List[Tuple[List[str], float]]:
+            Extracts the triplets of a text with their confidence.
+    """
+
+    def __init__(self, config: dict, logger: logging.Logger):
+        super().__init__(config, logger)
+        model_params = self.config.model.triplet_generator.model_params
+        self.affinity_probability_cap = model_params.get(
+            "openie.affinity_probability_cap", 1 / 3
+        )
+        self.min_confidence = model_params.get("openie.min_confidence", 0.5)
+
+    def forward(self, data: str, return_prompt: bool = False) -> List[List[str]]:
+        """
+        Extracts the triplets of a text.
+
+        Args:
+            data (str): The input text.
+            return_prompt (bool): Whether to also return the prompt, None as no LLM is involved (same interface as
+                                  the LLM triplet generators).
+
+        Returns:
+            List[List[str]]: The triplets, in order of appearance, or (triplets, None) with return_prompt.
+        """
+        triplets = [triplet for triplet, _ in self.forward_with_confidence(data)]
+        if return_prompt:
+            return triplets, None
+        return triplets
+
+    def forward_with_confidence(self, data: str) -> List[Tuple[List[str], float]]:
+        """
+        Extracts the triplets of a text with their confidence.
+
+        Args:
+            data (str): The input text.
+
+        Returns:
+            List[Tuple[List[str], float]]: (triplet, confidence) pairs, in order of appearance, without duplicates.
+        """
+        extractions = []
+        seen = set()
+        previous_subject = None
+        for sentence in split_sentences(str(data)):
+            for clause in CLAUSE_SPLIT_PATTERN.split(sentence.rstrip(".!?")):
+                for subject, relation, obj, affinity in self.extract_clause(
+                    clause, previous_subject
+                ):
+                    confidence = self.confidence(affinity)
+                    if confidence < self.min_confidence:
+                        continue
+                    previous_subject = subject
+                    if (subject, relation, obj) not in seen:
+                        seen.add((subject, relation, obj))
+                        extractions.append(([subject, relation, obj], confidence))
+        return extractions
+
+    def confidence(self, affinity: float) -> float:
+        if affinity >= self.affinity_probability_cap:
+            return 1.0
+        return affinity / self.affinity_probability_cap
+
+    def extract_clause(
+        self, clause: str, previous_subject: Optional[str] = None
+    ) -> List[Tuple[str, str, str, float]]:
+        """
+        Extract the (subject, relation, object, affinity) tuples of a clause.
+        """
+        tokens = TOKEN_PATTERN.findall(clause)
+        lowered = [token.lower() for token in tokens]
+        relation_span = self.find_relation(lowered, start=1)
+        if relation_span is None:
+            return []
+        relation_start, relation_end, relation_affinity = relation_span
+        if relation_end < len(lowered) and lowered[relation_end] == "that":
+            # "we found that X regulates Y": the facts are in the complement clause
+            return self.extract_clause(
+                " ".join(tokens[relation_end + 1 :]), previous_subject
+            )
+
+        subject_tokens = self.clean_subject(tokens[:relation_start])
+        if len(subject_tokens) == 0:
+            return []
+        subject_affinity = (
+            1.0 if len(subject_tokens) <= 10 else 10 / len(subject_tokens)
+        )
+        if " ".join(subject_tokens).lower() in PRONOUNS:
+            if previous_subject is None:
+                subject_affinity = 0.3
+            else:
+                subject_tokens = previous_subject.split()
+                subject_affinity = 0.8
+        subject = " ".join(subject_tokens)
+
+        extractions = []
+        relation = " ".join(tokens[relation_start:relation_end])
+        rest = relation_end
+        while True:
+            # "X activates A and inhibits B": the object stops at a coordinated relation
+            next_span = None
+            for idx in range(rest + 1, len(lowered) - 1):
+                if lowered[idx] in ("and", "or"):
+                    next_span = self.find_relation(
+                        lowered, start=idx + 1, max_start=idx + 1
+                    )
+                    if next_span is not None:
+                        break
+            object_end = idx if next_span is not None else len(tokens)
+            object_tokens = self.clean_object(tokens[rest:object_end])
+            if len(object_tokens) > 0:
+                object_affinity = (
+                    1.0 if len(object_tokens) <= 20 else 20 / len(object_tokens)
+                )
+                extractions.append(
+                    (
+                        subject,
+                        relation,
+                        " ".join(object_tokens),
+                        relation_affinity * subject_affinity * object_affinity,
+                    )
+                )
+            if next_span is None:
+                return extractions
+            relation_start, rest, relation_affinity = next_span
+            relation = " ".join(tokens[relation_start:rest])
+
+    def find_relation(
+        self, lowered: List[str], start: int, max_start: Optional[int] = None
+    ) -> Optional[Tuple[int, int, float]]:
+        """
+        Find the first relation phrase at or after `start` (and at or before `max_start` if given).
+
+        Returns:
+            Optional[Tuple[int, int, float]]: (start, end, affinity) of the relation phrase, or None.
+        """
+        last_start = len(lowered) - 1 if max_start is None else max_start
+        idx = start
+        while idx <= min(last_start, len(lowered) - 1):
+            token = lowered[idx]
+            is_auxiliary = token in AUXILIARIES
+            is_verb = token in VERB_FORMS and lowered[idx - 1] not in NOUN_CONTEXT
+            if (
+                is_verb
+                and token.endswith("s")
+                and idx + 1 < len(lowered)
+                and lowered[idx + 1] in VERB_FORMS
+                and not lowered[idx + 1].endswith(("ed", "ing"))
+            ):
+                # "intrathymic signals extinguish": a plural noun followed by the verb
+                is_verb = False
+            if not (is_auxiliary or is_verb):
+                idx += 1
+                continue
+
+            end = idx
+            has_auxiliary = False
+            while end < len(lowered) and (
+                lowered[end] in AUXILIARIES
+                or lowered[end] in NEGATIONS
+                or (lowered[end].endswith("ly") and end > idx)
+            ):
+                has_auxiliary = has_auxiliary or lowered[end] in AUXILIARIES
+                end += 1
+
+            verb_affinity = None
+            if end < len(lowered) and lowered[end] in VERB_FORMS:
+                verb_affinity = (
+                    0.9 if has_auxiliary or not lowered[end].endswith("ed") else 0.6
+                )
+                end += 1
+            elif (
+                has_auxiliary
+                and end < len(lowered)
+                and lowered[end].endswith(("ed", "en"))
+                and len(lowered[end]) > 4
+            ):
+                # passive voice with a verb missing from the lexicon ("was upregulated")
+                verb_affinity = 0.6
+                end += 1
+            elif has_auxiliary and lowered[idx] in COPULAS | {"has", "have", "had"}:
+                verb_affinity = 0.7
+            if verb_affinity is None or end >= len(lowered):
+                idx = end + 1 if end > idx else idx + 1
+                continue
+
+            # "are specialized to function as", "appears to regulate"
+            if (
+                end + 1 < len(lowered)
+                and lowered[end] == "to"
+                and lowered[end + 1] in VERB_FORMS
+            ):
+                end += 2
+            if end < len(lowered) - 1 and lowered[end] in PREPOSITIONS:
+                end += 1
+            return idx, end, verb_affinity
+        return None
+
+    def clean_subject(self, tokens: List[str]) -> List[str]:
+        """
+        Strip the discourse markers, determiners, punctuations and relative pronouns around a subject.
+        """
+        text = " ".join(tokens).strip(" ,:")
+        changed = True
+        while changed:
+            changed = False
+            for marker in DISCOURSE_MARKERS:
+                if text.lower().startswith(marker + " ") or text.lower().startswith(
+                    marker + ","
+                ):
+                    text = text[len(marker) :].strip(" ,")
+                    changed = True
+        tokens = text.split()
+        while tokens and tokens[0].lower() in DETERMINERS:
+            tokens = tokens[1:]
+        while tokens and tokens[-1].lower() in {"which", "that", "who", ","}:
+            tokens = tokens[:-1]
+        return [token for token in tokens if token != ","]
+
+    def clean_object(self, tokens: List[str]) -> List[str]:
+        """
+        Strip the determiners and trailing punctuations of an object.
+        """
+        tokens = [token for token in tokens if token not in {",", ":"}]
+        while tokens and tokens[0].lower() in DETERMINERS | {"that"}:
+            tokens = tokens[1:]
+        while tokens and tokens[-1].lower() in PREPOSITIONS | {"and", "or"}:
+            tokens = tokens[:-1]
+        return tokens
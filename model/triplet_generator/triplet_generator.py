@@ -1,5 +1,6 @@
 from utils.utils import *
 from pipeline import *
+from utils.tracing import span
 from abc import abstractmethod
 from typing import List, Tuple
 
@@ -14,6 +15,9 @@ class TripletGenerator(PipelineBase):
         forward(data: str) -> List[Tuple[str, str, str]]:
             Abstract method that must be implemented by subclasses to generate triplets from the input data. Raises NotImplementedError if not overridden.
 
+        run(generated_answer: str) -> dict:
+            Runs forward with the inputs and outputs named as in input_output_format (used by rag/dataflow.py).
+
     Properties:
         input_output_format:
             Returns a dictionary specifying the expected input and output format for the triplet generation process.
@@ -30,6 +34,10 @@ class TripletGenerator(PipelineBase):
         """
         raise NotImplementedError
 
+    def run(self, generated_answer: str) -> dict:
+        with span(f"{type(self).__name__}.forward", "component"):
+            return {"answer_triplets": self.forward(generated_answer)}
+
     @property
     def input_output_format(self):
         return {
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+CASSETTE_MODES = ("record", "replay")
+REPLAY_LATENCIES = ("none", "recorded")
+
+# process-wide cassettes by path, so that all the LLM components of a run record to (or replay from) the same file
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+class CassetteMissError(KeyError):
+    """
+    Raised in replay mode for a prompt that is not in the cassette.
+    """
+
+
+def prompt_messages(prompt) -> List[List[str]]:
+    """
+    The rendered messages of a prompt, as [role, content] pairs.
+
+    Args:
+        prompt: Anything `ChatOpenAI.invoke` accepts (prompt value, message list or string).
+    """
+    if hasattr(prompt, "to_messages"):
+        prompt = prompt.to_messages()
+    if isinstance(prompt, list):
+        return [
+            [
+                getattr(message, "type", "human"),
+                str(getattr(message, "content", message)),
+            ]
+            for message in prompt
+        ]
+    return [["human", str(prompt)]]
+
+
+class LLMCassette:
+    """
+    Records the LLM calls of a run, or replays them without any API call.
+
+    A cassette is a JSON lines file with one call per line: the model settings and the rendered prompt messages, their
+    key (a hash of both), the response content, its latency and its token usage. In record mode, every call is sent to
+    the LLM and appended to the file. In replay mode, the response of a prompt is served from the file (with its
+    recorded latency if replay_latency is "recorded"), and a prompt that was not recorded raises CassetteMissError.
+    A prompt recorded several times is replayed with its responses in recorded order (then the last one again).
+
+    Methods:
+        call(model_settings: dict, prompt, fn: Callable[[], Any]) -> AIMessage:
+            Records the response of fn, or replays the recorded one.
+    """
+
+    def __init__(self, path: str, mode: str, replay_latency: str = "none"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(
+                f"Unknown cassette mode {mode!r}, expected one of {CASSETTE_MODES}"
+            )
+        if replay_latency not in REPLAY_LATENCIES:
+            raise ValueError(
+                f"Unknown replay latency {replay_latency!r}, expected one of {REPLAY_LATENCIES}"
+            )
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.recorded = 0
+        self.replayed = 0
+        self.records = {}
+        self._next_record = {}
+        self._lock = threading.Lock()
+        if mode == "replay":
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"No cassette to replay at {path}")
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.records.setdefault(record["key"], []).append(record)
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # a new recording replaces the previous one
+            open(path, "w").close()
+
+    @staticmethod
+    def record_key(model_settings: dict, messages: List[List[str]]) -> str:
+        return hashlib.sha256(
+            json.dumps(
+                [model_settings, messages], sort_keys=True, ensure_ascii=False
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def call(self, model_settings: dict, prompt, fn: Callable[[], Any]) -> "AIMessage":
+        """
+        Get the response of a prompt.
+
+        Args:
+            model_settings (dict): The settings the response depends on (model name, temperature).
+            prompt: The prompt, see prompt_messages.
+            fn (Callable[[], Any]): Sends the prompt to the LLM (record mode only).
+
+        Returns:
+            AIMessage: The response, with its token usage.
+        """
+        messages = prompt_messages(prompt)
+        key = self.record_key(model_settings, messages)
+        if self.mode == "replay":
+            return self.replay(key)
+
+        start = time.perf_counter()
+        response = fn()
+        record = {
+            "key": key,
+            "model_settings": model_settings,
+            "messages": messages,
+            "content": response.content,
+            "usage_metadata": dict(getattr(response, "usage_metadata", None) or {}),
+            "latency": time.perf_counter() - start,
+        }
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self.recorded += 1
+        return response
+
+    def replay(self, key: str) -> "AIMessage":
+        from langchain_core.messages import AIMessage
+
+        with self._lock:
+            records = self.records.get(key)
+            if not records:
+                raise CassetteMissError(
+                    f"Prompt {key} is not in the cassette {self.path}, record it again"
+                )
+            index = self._next_record.get(key, 0)
+            self._next_record[key] = index + 1
+            record = records[min(index, len(records) - 1)]
+            self.replayed += 1
+        if self.replay_latency == "recorded":
+            time.sleep(record["latency"])
+        return AIMessage(
+            content=record["content"],
+            usage_metadata=record["usage_metadata"] or None,
+        )
+
+
+def get_cassette(config) -> Optional[LLMCassette]:
+    """
+    Get the process-wide cassette of config.model.llm.cassette, or None if its mode is not set.
+    """
+    cassette_config = config.model.llm.get("cassette", {})
+    if not cassette_config.get("mode"):
+        return None
+    with _cassettes_lock:
+        path = cassette_config.path
+        if path not in _cassettes:
+            _cassettes[path] = LLMCassette(
+                path,
+                cassette_config.mode,
+                replay_latency=cassette_config.get("replay_latency", "none"),
+            )
+        return _cassettes[path]
@@ -78,7 +78,7 @@ class PipelineDemonstration(PipelinePrompt):
         """
         demo_file_list = [
             i
-            for i in glob(f"{demo_file_path}/*")
+            for i in glob(f"{demo_file_path}/*.json")
             if i.split("/")[-1].replace(".json", "") != idx
         ]
         # Shuffle and sample files (with replacement if num_samples exceeds list size)
@@ -115,7 +115,7 @@ class PipelineDemonstration(PipelinePrompt):
         """
         demo_file_list = [
             i
-            for i in glob(f"{demo_file_path}/*")
+            for i in glob(f"{demo_file_path}/*.json")
             if i.split("/")[-1].replace(".json", "") != idx
         ]
 
@@ -1,8 +1,17 @@
 from pipeline.pipeline_base import *
+from pipeline.cassette import get_cassette
+from pipeline.rate_limiter import get_rate_limiter
+from pipeline.usage import get_usage_ledger
+from utils.text_utils import estimate_tokens
+from utils.metrics_endpoint import live_metrics
+from utils.tracing import in_context, span
 from utils.utils import *
 
-from langchain_openai import ChatOpenAI
-import openai
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import os
+import threading
+import time
 
 
 class PipelineLLM(PipelineBase):
@@ -13,13 +22,177 @@ class PipelineLLM(PipelineBase):
                                 (not currently used).
         model (ChatOpenAI): An LLM model instance for generating outputs using
                             langchian_openai.
+        token_usage (dict): The number of calls and input/output tokens of this instance, updated by `invoke_model`.
+        usage_ledger (UsageLedger): The usage and cost accounting of the run (per component class and sample),
+                                    updated by `invoke_model`.
+        rate_limiter (AdaptiveRateLimiter): The limiter shared by the LLM components of the process
+                                            (config.model.llm.rate_limit), or None.
+        cassette (LLMCassette): The cassette recording or replaying the LLM calls of the process
+                                (config.model.llm.cassette), or None.
     """
 
     def __init__(self, config: dict):
+        # deferred until a component is built: LangChain and the OpenAI client are slow to import
+        import openai
+        from langchain_openai import ChatOpenAI
+
         super().__init__(config)
-        self.openai = openai.OpenAI()  # not used yet
+        self.cassette = get_cassette(self.config)
+        # a replayed run makes no API call and does not need an API key
+        api_key = (
+            os.environ.get("OPENAI_API_KEY") or "cassette-replay"
+            if self.cassette is not None and self.cassette.mode == "replay"
+            else None
+        )
+        self.openai = openai.OpenAI(api_key=api_key)  # not used yet
+        self.rate_limiter = get_rate_limiter(self.config)
+        # e.g. a local OpenAI compatible server
+        base_url = self.config.model.llm.get("base_url")
         self.model = ChatOpenAI(
             model=self.config.model.llm.generator_model,
             temperature=self.config.model.llm.temperature,
-            max_retries=self.config.model.llm.request_max_try,
+            # the rate limiter retries the rate limited requests and the transient errors itself
+            max_retries=(
+                0
+                if self.rate_limiter is not None
+                else self.config.model.llm.request_max_try
+            ),
+            **({"base_url": base_url} if base_url else {}),
+            **({"api_key": api_key} if api_key else {}),
+        )
+        self.token_usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+        self.usage_ledger = get_usage_ledger(self.config)
+        self._token_usage_lock = threading.Lock()
+
+    def invoke_model(self, prompt, usage: Optional[dict] = None) -> str:
+        """
+        Invoke the LLM and record the token usage of the call.
+
+        Args:
+            prompt: Anything `ChatOpenAI.invoke` accepts (prompt value, message list or string).
+            usage (dict, optional): calls/input_tokens/output_tokens counters of the caller, the call is added to
+                                    them too (unlike `token_usage`, they only count the caller's own calls).
+
+        Returns:
+            str: The content of the response.
+        """
+        response = self.invoke_model_response(prompt)
+        self.record_token_usage(response)
+        if usage is not None:
+            response_usage = getattr(response, "usage_metadata", None) or {}
+            usage["calls"] += 1
+            usage["input_tokens"] += response_usage.get("input_tokens", 0)
+            usage["output_tokens"] += response_usage.get("output_tokens", 0)
+        return response.content
+
+    def invoke_model_response(self, prompt):
+        """
+        Invoke the LLM, through the cassette and the rate limiter if there are ones, and return the whole response.
+        """
+        component = type(self).__name__
+        registry = live_metrics()
+        registry.inc("llm_requests_in_flight", component=component)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            with span("llm_call", "llm", component=type(self).__name__) as llm_span:
+                if self.cassette is not None:
+                    response = self.cassette.call(
+                        {
+                            "model": self.config.model.llm.generator_model,
+                            "temperature": self.config.model.llm.temperature,
+                        },
+                        prompt,
+                        lambda: self.invoke_llm(prompt),
+                    )
+                    llm_span.set(cassette=self.cassette.mode)
+                else:
+                    response = self.invoke_llm(prompt)
+                usage = getattr(response, "usage_metadata", None) or {}
+                llm_span.set(
+                    input_tokens=usage.get("input_tokens", 0),
+                    output_tokens=usage.get("output_tokens", 0),
+                )
+                status = "ok"
+                return response
+        finally:
+            registry.inc("llm_requests_in_flight", -1.0, component=component)
+            registry.observe(
+                "llm_request_duration_seconds",
+                time.perf_counter() - start,
+                component=component,
+            )
+            registry.inc("llm_requests_total", component=component, status=status)
+
+    def invoke_llm(self, prompt):
+        if self.rate_limiter is None:
+            return self.model.invoke(prompt)
+        return self.rate_limiter.call(
+            lambda: self.model.invoke(prompt),
+            estimated_tokens=self.estimate_request_tokens(prompt),
+        )
+
+    def estimate_request_tokens(self, prompt) -> int:
+        """
+        Estimated number of tokens of a request: its prompt and
+        config.model.llm.rate_limit.estimated_output_tokens.
+        """
+        if hasattr(prompt, "to_string"):
+            text = prompt.to_string()
+        elif isinstance(prompt, list):
+            text = "".join(
+                str(getattr(message, "content", message)) for message in prompt
+            )
+        else:
+            text = str(prompt)
+        return (
+            estimate_tokens(text)
+            + self.config.model.llm.rate_limit.estimated_output_tokens
+        )
+
+    def invoke_model_batch(self, prompts: list, max_concurrency: int = None) -> list:
+        """
+        Invoke the LLM on several prompts concurrently and record the token usage of every call.
+        Every request goes through `invoke_model_response` (cassette, rate limiter, span and live metrics).
+
+        Args:
+            prompts (list): The prompts.
+            max_concurrency (int, optional): The maximum number of requests in flight. Defaults to no limit.
+
+        Returns:
+            list: The contents of the responses, in the order of the prompts.
+        """
+        with span(
+            "llm_batch", "llm", component=type(self).__name__, size=len(prompts)
+        ), ThreadPoolExecutor(
+            max_workers=max_concurrency or max(1, len(prompts))
+        ) as executor:
+            futures = [
+                executor.submit(in_context(self.invoke_model_response), prompt)
+                for prompt in prompts
+            ]
+            responses = [future.result() for future in futures]
+        for response in responses:
+            self.record_token_usage(response)
+        return [response.content for response in responses]
+
+    def record_token_usage(self, response) -> None:
+        usage = getattr(response, "usage_metadata", None) or {}
+        with self._token_usage_lock:
+            self.token_usage["calls"] += 1
+            self.token_usage["input_tokens"] += usage.get("input_tokens", 0)
+            self.token_usage["output_tokens"] += usage.get("output_tokens", 0)
+        call_usage = self.usage_ledger.record(
+            type(self).__name__, self.config.model.llm.generator_model, usage
+        )
+        registry = live_metrics()
+        for token_type in ("input_tokens", "output_tokens"):
+            registry.inc(
+                "llm_tokens_total",
+                call_usage[token_type],
+                component=type(self).__name__,
+                type=token_type.replace("_tokens", ""),
+            )
+        registry.inc(
+            "llm_cost_usd_total", call_usage["cost_usd"], component=type(self).__name__
         )
@@ -1,14 +1,12 @@
 import json
 
-from langchain_core.messages import merge_message_runs
-
 from pipeline.pipeline_base import PipelineBase
-from langchain.prompts import HumanMessagePromptTemplate, SystemMessagePromptTemplate
-from langchain_core.prompts import ChatPromptTemplate
+from utils.artifact_store import content_hash
 from easydict import EasyDict as edict
 from abc import abstractmethod
 from typing import Any
 
+
 class PipelinePrompt(PipelineBase):
     """
     A pipeline for any class using prompts.
@@ -28,6 +26,8 @@ class PipelinePrompt(PipelineBase):
         super().__init__(config)
         self.prompts = edict(json.load(open(self.config.path.prompts)))
         self.prompt_templates = self.get_prompt_templates()
+        from langchain_core.messages import merge_message_runs
+
         self.merger = merge_message_runs()
         self.message_list_template = self.get_message_list_templates()
 
@@ -45,6 +45,11 @@ class PipelinePrompt(PipelineBase):
         Raises:
             NotImplementedError: If the message type is not supported.
         """
+        from langchain.prompts import (
+            HumanMessagePromptTemplate,
+            SystemMessagePromptTemplate,
+        )
+
         if message_type == "human":
             return HumanMessagePromptTemplate.from_template(template_dict["format"])
         elif message_type == "system":
@@ -76,6 +81,8 @@ class PipelinePrompt(PipelineBase):
         Returns:
             dict: A dictionary containing message list templates
         """
+        from langchain_core.prompts import ChatPromptTemplate
+
         message_list_template = {}
         for template_name, _ in self.prompts["human"].items():
 
@@ -90,6 +97,34 @@ class PipelinePrompt(PipelineBase):
             )
         return message_list_template
 
+    @property
+    def prompt_template_names(self) -> list:
+        """
+        Names of the message list templates used by the class. Override it in the subclasses.
+        """
+        return []
+
+    def prompt_template_hash(self) -> str:
+        """
+        Hash of the prompt templates (and directions) used by the class, part of the key of its stage artifacts
+        (see utils/artifact_store.py), so that editing another prompt does not invalidate them.
+
+        Returns:
+            str: The sha256 of the templates.
+        """
+        return content_hash(
+            {
+                "templates": {
+                    name: [
+                        self.prompts["system"][f"{name}_instruction"],
+                        self.prompts["human"][name],
+                    ]
+                    for name in self.prompt_template_names
+                },
+                "directions": getattr(self, "directions", None),
+            }
+        )
+
     @abstractmethod
     def get_model_prompt(self, **kwargs) -> Any:
         """
@@ -0,0 +1,348 @@
+import itertools
+import random
+import threading
+import time
+from typing import Any, Callable, Optional
+
+
+from utils.tracing import current_span
+
+# process-wide limiters by endpoint and model, so that all the LLM components share the limits of the API key
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+# cap of the exponential backoff between the retries of a transient error
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class TokenBucket:
+    """
+    A token bucket holding at most `per_minute` units and refilled at `per_minute` units per minute.
+    The level can go negative when a request used more than it reserved, delaying the next requests.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """
+        Seconds until `amount` units are available (0 if they are).
+        """
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimitPermit:
+    """
+    A request slot given by AdaptiveRateLimiter.acquire, to be given back with AdaptiveRateLimiter.release.
+    """
+
+    def __init__(self, epoch: int, estimated_tokens: int):
+        self.epoch = epoch
+        self.estimated_tokens = estimated_tokens
+        self.started = time.monotonic()
+
+
+class AdaptiveRateLimiter:
+    """
+    A client side rate limiter for the LLM requests of a process, shared by all the PipelineLLM instances
+    (see get_rate_limiter).
+
+    A request waits until:
+        - fewer than `concurrency` requests are in flight,
+        - the requests/minute and the (estimated) tokens/minute token buckets have room for it,
+        - the pause following a 429 (its Retry-After, or backoff_seconds) is over.
+    The number of tokens of a request is estimated from its prompt (plus estimated_output_tokens) when it is sent,
+    and the tokens bucket is corrected with the actual usage of the response.
+
+    The concurrency is adapted with additive increase/multiplicative decrease (AIMD): every successful request adds
+    additive_increase / concurrency (about +additive_increase per round of requests), and a 429 or a latency above
+    latency_target_seconds multiplies it by multiplicative_decrease. Only the first congestion signal of the requests
+    sent under the current concurrency decreases it, so a burst of concurrent 429s halves the concurrency once instead
+    of collapsing it.
+
+    The OpenAI client does not retry the requests sent through the limiter (see PipelineLLM), so the limiter also
+    retries the transient errors the client would have retried (see `is_transient_error`: timeouts, connection
+    errors, 5xx), up to max_transient_retries times with an exponential backoff from backoff_seconds. They do not
+    change the concurrency.
+
+    Methods:
+        call(fn: Callable[[], Any], estimated_tokens: int) -> Any:
+            Runs a request under the limiter, retrying it on 429 up to max_retries times and on transient errors up
+            to max_transient_retries times.
+        acquire(estimated_tokens: int) -> RateLimitPermit:
+            Waits for a request slot.
+        release(permit: RateLimitPermit, rate_limited: bool = False, failed: bool = False, used_tokens: int = None, retry_after: float = None) -> None:
+            Gives a slot back with the outcome of its request.
+        metrics() -> dict:
+            The limiter state and counters.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        initial_concurrency: float = 4,
+        min_concurrency: float = 1,
+        max_concurrency: float = 32,
+        additive_increase: float = 1,
+        multiplicative_decrease: float = 0.5,
+        latency_target_seconds: Optional[float] = None,
+        max_retries: int = 6,
+        backoff_seconds: float = 1.0,
+        max_transient_retries: int = 1,
+    ):
+        self.requests_bucket = TokenBucket(requests_per_minute)
+        self.tokens_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = float(initial_concurrency)
+        self.min_concurrency = float(min_concurrency)
+        self.max_concurrency = float(max_concurrency)
+        self.additive_increase = additive_increase
+        self.multiplicative_decrease = multiplicative_decrease
+        self.latency_target_seconds = latency_target_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_transient_retries = max_transient_retries
+
+        self.in_flight = 0
+        self.epoch = 0
+        self.paused_until = 0.0
+        self.stats = {
+            "requests": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "retried": 0,
+            "decreases": 0,
+            "throttle_seconds": 0.0,
+            "latency_seconds": 0.0,
+            "max_in_flight": 0,
+        }
+        self._condition = threading.Condition()
+
+    def acquire(self, estimated_tokens: int) -> RateLimitPermit:
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = None
+                if self.in_flight < max(1, int(self.concurrency)):
+                    wait = max(
+                        self.paused_until - now,
+                        self.requests_bucket.wait_time(1, now),
+                        self.tokens_bucket.wait_time(estimated_tokens, now),
+                    )
+                    if wait <= 0:
+                        break
+                # woken up earlier by release when a slot or a concurrency increase frees room
+                self._condition.wait(wait)
+            self.requests_bucket.take(1)
+            self.tokens_bucket.take(estimated_tokens)
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(
+                self.stats["max_in_flight"], self.in_flight
+            )
+            self.stats["throttle_seconds"] += time.monotonic() - start
+            return RateLimitPermit(self.epoch, estimated_tokens)
+
+    def release(
+        self,
+        permit: RateLimitPermit,
+        rate_limited: bool = False,
+        failed: bool = False,
+        used_tokens: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ) -> None:
+        latency = time.monotonic() - permit.started
+        with self._condition:
+            self.in_flight -= 1
+            if used_tokens is not None:
+                # give back (or take) the difference between the estimate and the actual usage
+                self.tokens_bucket.level += permit.estimated_tokens - used_tokens
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                self.paused_until = max(
+                    self.paused_until,
+                    time.monotonic()
+                    + (retry_after if retry_after is not None else self.backoff_seconds)
+                    * random.uniform(1.0, 1.25),
+                )
+                self.decrease(permit)
+            elif failed:
+                self.stats["failed"] += 1
+            else:
+                self.stats["requests"] += 1
+                self.stats["latency_seconds"] += latency
+                if (
+                    self.latency_target_seconds is not None
+                    and latency > self.latency_target_seconds
+                ):
+                    self.decrease(permit)
+                else:
+                    self.concurrency = min(
+                        self.max_concurrency,
+                        self.concurrency + self.additive_increase / self.concurrency,
+                    )
+            self._condition.notify_all()
+
+    def decrease(self, permit: RateLimitPermit) -> None:
+        # the requests sent before the last decrease already saw the congestion, don't decrease again for them
+        if permit.epoch != self.epoch:
+            return
+        self.epoch += 1
+        self.stats["decreases"] += 1
+        self.concurrency = max(
+            self.min_concurrency, self.concurrency * self.multiplicative_decrease
+        )
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int) -> Any:
+        """
+        Run a request under the limiter.
+
+        Args:
+            fn (Callable[[], Any]): Sends the request and returns the response (an AIMessage with usage_metadata).
+            estimated_tokens (int): The estimated number of tokens of the request.
+
+        Returns:
+            Any: The response of fn.
+
+        Raises:
+            openai.RateLimitError: If the request is still rate limited after max_retries retries.
+            Exception: The error of the request if it is not transient, or still failing after max_transient_retries
+                       retries.
+        """
+        import openai
+
+        rate_limited_retries, transient_retries = 0, 0
+        for attempt in itertools.count():
+            permit = self.acquire(estimated_tokens)
+            try:
+                response = fn()
+            except openai.RateLimitError as e:
+                # a rejected request did not use its tokens
+                self.release(
+                    permit,
+                    rate_limited=True,
+                    used_tokens=0,
+                    retry_after=retry_after_seconds(e),
+                )
+                current_span().add_event(
+                    "rate_limited",
+                    attempt=attempt,
+                    retry_after=retry_after_seconds(e) or 0.0,
+                    final=rate_limited_retries == self.max_retries,
+                )
+                if rate_limited_retries == self.max_retries:
+                    raise
+                rate_limited_retries += 1
+                continue
+            except Exception as e:
+                self.release(permit, failed=True)
+                final = transient_retries == self.max_transient_retries
+                if not is_transient_error(e) or final:
+                    raise
+                current_span().add_event(
+                    "transient_error", attempt=attempt, error=type(e).__name__
+                )
+                with self._condition:
+                    self.stats["retried"] += 1
+                time.sleep(
+                    min(
+                        self.backoff_seconds * 2**transient_retries,
+                        MAX_BACKOFF_SECONDS,
+                    )
+                    * random.uniform(1.0, 1.25)
+                )
+                transient_retries += 1
+                continue
+            except BaseException:
+                self.release(permit, failed=True)
+                raise
+            usage = getattr(response, "usage_metadata", None) or {}
+            self.release(permit, used_tokens=usage.get("total_tokens"))
+            if attempt > 0:
+                current_span().set(attempts=attempt + 1)
+            return response
+
+    def metrics(self) -> dict:
+        with self._condition:
+            now = time.monotonic()
+            self.requests_bucket.refill(now)
+            self.tokens_bucket.refill(now)
+            return {
+                **self.stats,
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "requests_bucket_level": self.requests_bucket.level,
+                "tokens_bucket_level": self.tokens_bucket.level,
+                "avg_latency_seconds": self.stats["latency_seconds"]
+                / max(1, self.stats["requests"]),
+            }
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Whether an error of a request is worth retrying: the errors the OpenAI client retries itself, i.e. connection
+    errors and timeouts, and the 408, 409 and 5xx responses (the 429s are handled by the limiter).
+    """
+    import openai
+
+    if isinstance(error, openai.APIConnectionError):  # APITimeoutError included
+        return True
+    return isinstance(error, openai.APIStatusError) and (
+        error.status_code in (408, 409) or error.status_code >= 500
+    )
+
+
+def retry_after_seconds(error: "openai.RateLimitError") -> Optional[float]:
+    """
+    The Retry-After of a 429 response, if the server sent one.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_rate_limiter(config) -> Optional[AdaptiveRateLimiter]:
+    """
+    Get the process-wide rate limiter of the LLM endpoint and model of the config, or None if
+    config.model.llm.rate_limit is not enabled.
+    """
+    llm_config = config.model.llm
+    rate_limit = llm_config.get("rate_limit", {})
+    if not rate_limit.get("enabled", False):
+        return None
+    key = (llm_config.get("base_url"), llm_config.generator_model)
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = AdaptiveRateLimiter(
+                requests_per_minute=rate_limit.requests_per_minute,
+                tokens_per_minute=rate_limit.tokens_per_minute,
+                initial_concurrency=rate_limit.initial_concurrency,
+                min_concurrency=rate_limit.min_concurrency,
+                max_concurrency=rate_limit.max_concurrency,
+                additive_increase=rate_limit.additive_increase,
+                multiplicative_decrease=rate_limit.multiplicative_decrease,
+                latency_target_seconds=rate_limit.latency_target_seconds,
+                max_retries=rate_limit.max_retries,
+                backoff_seconds=rate_limit.backoff_seconds,
+                # the retries the OpenAI client would have made without the limiter
+                max_transient_retries=llm_config.request_max_try,
+            )
+        return _rate_limiters[key]
@@ -0,0 +1,198 @@
+import contextvars
+import json
+import threading
+import time
+from typing import Dict, Optional
+
+# process-wide ledgers by experiment, so that all the LLM components of a run account to the same ledger
+_usage_ledgers = {}
+_usage_ledgers_lock = threading.Lock()
+
+# the sample the LLM calls of the current context are accounted to
+_current_sample = contextvars.ContextVar("current_sample", default=None)
+
+USAGE_KEYS = (
+    "calls",
+    "input_tokens",
+    "cached_input_tokens",
+    "output_tokens",
+    "unpriced_calls",
+)
+
+
+def empty_usage() -> dict:
+    return {**{key: 0 for key in USAGE_KEYS}, "cost_usd": 0.0}
+
+
+def add_usage(total: dict, usage: dict) -> None:
+    for key, value in usage.items():
+        total[key] = total.get(key, 0) + value
+
+
+class UsageLedger:
+    """
+    The LLM calls, tokens and cost of a run, per component class, per sample and in total.
+
+    The cost of a call is priced with the price table of config.model.llm.prices (USD per million input, cached
+    input and output tokens, by model name, the longest model name prefix applying to dated model versions). Calls of
+    a model without price are counted as unpriced_calls. A call is accounted to the sample of its context (see
+    `sample_scope`), if any.
+
+    Args:
+        prices (dict): model name -> {"input", "cached_input", "output"} prices per million tokens.
+
+    Methods:
+        record(component: str, model: str, usage_metadata: dict) -> dict:
+            Accounts a call, returns its usage.
+        sample_usage(sample: str) -> dict:
+            The usage of a sample.
+        tokens_per_second() -> float:
+            The input and output tokens per second since the first call.
+        summary() -> dict:
+            The usage in total, per component and per sample, and the price table.
+        save(path: str) -> None:
+            Saves the summary as JSON.
+    """
+
+    def __init__(self, prices: Optional[dict] = None):
+        self.prices = dict(prices or {})
+        self.total = empty_usage()
+        self.components: Dict[str, dict] = {}
+        self.samples: Dict[str, dict] = {}
+        self.first_call_time = None
+        self._lock = threading.Lock()
+
+    def model_prices(self, model: str) -> Optional[dict]:
+        if model in self.prices:
+            return self.prices[model]
+        prefixes = [name for name in self.prices if model.startswith(name)]
+        return self.prices[max(prefixes, key=len)] if prefixes else None
+
+    def call_usage(self, model: str, usage_metadata: dict) -> dict:
+        input_tokens = usage_metadata.get("input_tokens", 0)
+        cached_input_tokens = (usage_metadata.get("input_token_details") or {}).get(
+            "cache_read", 0
+        ) or 0
+        output_tokens = usage_metadata.get("output_tokens", 0)
+        usage = {
+            "calls": 1,
+            "input_tokens": input_tokens,
+            "cached_input_tokens": cached_input_tokens,
+            "output_tokens": output_tokens,
+            "unpriced_calls": 0,
+            "cost_usd": 0.0,
+        }
+        prices = self.model_prices(model)
+        if prices is None:
+            usage["unpriced_calls"] = 1
+            return usage
+        cached_price = prices.get("cached_input", prices["input"])
+        usage["cost_usd"] = (
+            (input_tokens - cached_input_tokens) * prices["input"]
+            + cached_input_tokens * cached_price
+            + output_tokens * prices["output"]
+        ) / 1_000_000
+        return usage
+
+    def record(self, component: str, model: str, usage_metadata: dict) -> dict:
+        usage = self.call_usage(model, usage_metadata or {})
+        sample = _current_sample.get()
+        with self._lock:
+            if self.first_call_time is None:
+                self.first_call_time = time.monotonic()
+            add_usage(self.total, usage)
+            add_usage(self.components.setdefault(component, empty_usage()), usage)
+            if sample is not None:
+                sample_usage = self.samples.setdefault(
+                    sample, {**empty_usage(), "components": {}}
+                )
+                add_usage(
+                    sample_usage["components"].setdefault(component, empty_usage()),
+                    usage,
+                )
+                add_usage(sample_usage, usage)
+        return usage
+
+    def sample_usage(self, sample: str) -> dict:
+        with self._lock:
+            usage = self.samples.get(sample)
+            return dict(usage) if usage is not None else empty_usage()
+
+    def tokens_per_second(self) -> float:
+        with self._lock:
+            if self.first_call_time is None:
+                return 0.0
+            elapsed = max(time.monotonic() - self.first_call_time, 1e-9)
+            return (self.total["input_tokens"] + self.total["output_tokens"]) / elapsed
+
+    def cost_per_sample(self) -> float:
+        with self._lock:
+            if not self.samples:
+                return 0.0
+            return sum(usage["cost_usd"] for usage in self.samples.values()) / len(
+                self.samples
+            )
+
+    def summary(self) -> dict:
+        tokens_per_second = self.tokens_per_second()
+        cost_per_sample = self.cost_per_sample()
+        with self._lock:
+            return {
+                "total": dict(self.total),
+                "components": {
+                    component: dict(usage)
+                    for component, usage in sorted(self.components.items())
+                },
+                "samples": {
+                    sample: {
+                        **usage,
+                        "components": {
+                            component: dict(component_usage)
+                            for component, component_usage in usage[
+                                "components"
+                            ].items()
+                        },
+                    }
+                    for sample, usage in self.samples.items()
+                },
+                "tokens_per_second": tokens_per_second,
+                "cost_usd_per_sample": cost_per_sample,
+                "prices": self.prices,
+            }
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=4)
+
+
+class SampleScope:
+    def __init__(self, sample: str):
+        self.sample = sample
+        self._token = None
+
+    def __enter__(self) -> str:
+        self._token = _current_sample.set(self.sample)
+        return self.sample
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        _current_sample.reset(self._token)
+        return False
+
+
+def sample_scope(sample: str) -> SampleScope:
+    """
+    Account the LLM calls made in the current context (until the returned context manager exits) to `sample`.
+    """
+    return SampleScope(sample)
+
+
+def get_usage_ledger(config) -> UsageLedger:
+    """
+    Get the process-wide usage ledger of the run of a config (config.experiment_name), priced with
+    config.model.llm.prices.
+    """
+    key = f"{config.path.experiment_result.base}{config.experiment_name}"
+    with _usage_ledgers_lock:
+        if key not in _usage_ledgers:
+            _usage_ledgers[key] = UsageLedger(config.model.llm.get("prices"))
+        return _usage_ledgers[key]
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from utils.artifact_store import ArtifactStore
+from utils.tracing import in_context, span
+
+
+class DataflowNode:
+    """
+    A node of a Dataflow: a function from named inputs to named outputs.
+
+    Args:
+        name (str): The node name.
+        fn (Callable[..., Dict[str, Any]]): Called with the inputs as keyword arguments (declared names),
+                                            returns a dict of the outputs (declared names).
+        inputs (List[str]): The declared input names.
+        outputs (List[str]): The declared output names.
+        rename (Dict[str, str], optional): declared name -> name in the dataflow, so that the same component can be
+                                           used twice in a graph (e.g. for the answer and for the reference text).
+        memo_scope (str, optional): Nodes with the same memo scope share memoised outputs. Defaults to the node name.
+        artifact_config (Any, optional): The config slice of the node. If given (and the dataflow has an artifact
+                                         store), the node outputs are persisted as artifacts (see utils/artifact_store.py).
+        prompt_hash (str, optional): The hash of the prompt templates of the node, part of the artifact key.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Dict[str, Any]],
+        inputs: List[str],
+        outputs: List[str],
+        rename: Optional[Dict[str, str]] = None,
+        memo_scope: Optional[str] = None,
+        artifact_config: Any = None,
+        prompt_hash: Optional[str] = None,
+    ):
+        self.name = name
+        self.fn = fn
+        self.declared_inputs = list(inputs)
+        self.declared_outputs = list(outputs)
+        self.rename = rename or {}
+        self.memo_scope = memo_scope or name
+        self.artifact_config = artifact_config
+        self.prompt_hash = prompt_hash
+
+    @classmethod
+    def from_component(
+        cls,
+        name: str,
+        component,
+        rename: Optional[Dict[str, str]] = None,
+        artifact_config: Any = None,
+    ) -> "DataflowNode":
+        """
+        A node running `component.run`, with the inputs and outputs declared by `component.input_output_format`.
+        Nodes of the same component share their memoised outputs and artifacts.
+        """
+        return cls(
+            name,
+            component.run,
+            inputs=component.input_output_format["input"],
+            outputs=component.input_output_format["output"],
+            rename=rename,
+            memo_scope=f"{type(component).__name__}.run",
+            artifact_config=artifact_config,
+            prompt_hash=(
+                component.prompt_template_hash()
+                if hasattr(component, "prompt_template_hash")
+                else None
+            ),
+        )
+
+    @property
+    def inputs(self) -> List[str]:
+        return [self.rename.get(key, key) for key in self.declared_inputs]
+
+    @property
+    def outputs(self) -> List[str]:
+        return [self.rename.get(key, key) for key in self.declared_outputs]
+
+
+class NodeMemo:
+    """
+    A bounded (least recently used) in-memory store of node outputs, keyed by the memo scope of the node and a hash
+    of its inputs. It can be shared by several dataflows.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(node: DataflowNode, inputs: Dict[str, Any]) -> str:
+        # prompts and other objects without a JSON form are hashed by their string representation
+        return hashlib.sha256(
+            json.dumps(
+                [node.memo_scope, inputs],
+                sort_keys=True,
+                ensure_ascii=False,
+                default=str,
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+    def set(self, key: str, outputs: Dict[str, Any]) -> None:
+        with self._lock:
+            self.entries[key] = outputs
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class Dataflow:
+    """
+    A small dataflow engine. The execution graph is built from the inputs and outputs declared by the nodes:
+    a node depends on the nodes producing its inputs. On `run`, every node whose inputs are available is submitted
+    to a thread pool, so independent nodes run concurrently.
+
+    Nodes are skipped when all their outputs are given as inputs of the run, or when they are not needed for the
+    requested targets. Node outputs are memoised by a hash of their inputs (see NodeMemo), and the outputs of the
+    nodes with an artifact config are persisted in the artifact store, so that a rerun only executes the nodes whose
+    inputs, config slice or prompts changed.
+
+    Methods:
+        run(targets: Optional[Iterable[str]] = None, use_memo: bool = True, **inputs) -> Dict[str, Any]:
+            Runs the graph on the inputs.
+    """
+
+    def __init__(
+        self,
+        nodes: List[DataflowNode],
+        logger: Optional[logging.Logger] = None,
+        max_workers: int = 4,
+        memo: Optional[NodeMemo] = None,
+        artifact_store: Optional[ArtifactStore] = None,
+    ):
+        self.nodes = {node.name: node for node in nodes}
+        self.logger = logger or logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.memo = memo
+        self.artifact_store = artifact_store
+        self.producers = {}
+        for node in nodes:
+            for key in node.outputs:
+                if key in self.producers:
+                    raise ValueError(
+                        f"{key} is produced by both {self.producers[key]} and {node.name}"
+                    )
+                self.producers[key] = node.name
+        self.topological_order()
+
+    def dependencies(self, node: DataflowNode) -> Set[str]:
+        return {self.producers[key] for key in node.inputs if key in self.producers}
+
+    def topological_order(self) -> List[str]:
+        """
+        The node names in an execution order. Raises ValueError if the graph has a cycle.
+        """
+        order, visiting, visited = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"The dataflow has a cycle through {name}")
+            visiting.add(name)
+            for dependency in self.dependencies(self.nodes[name]):
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+            order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+        return order
+
+    def plan(
+        self, available: Iterable[str], targets: Optional[Iterable[str]]
+    ) -> Set[str]:
+        """
+        The names of the nodes to run: the producers of the targets (all the outputs by default) and,
+        recursively, of their missing inputs. Raises ValueError if an input is neither available nor produced.
+        """
+        available = set(available)
+        wanted = list(self.producers) if targets is None else list(targets)
+        to_run, missing = set(), set()
+        while wanted:
+            key = wanted.pop()
+            if key in available:
+                continue
+            if key not in self.producers:
+                missing.add(key)
+                continue
+            name = self.producers[key]
+            if name not in to_run:
+                to_run.add(name)
+                wanted.extend(self.nodes[name].inputs)
+        if missing:
+            raise ValueError(f"Missing dataflow inputs: {sorted(missing)}")
+        return to_run
+
+    def run(
+        self,
+        targets: Optional[Iterable[str]] = None,
+        use_memo: bool = True,
+        **inputs,
+    ) -> Dict[str, Any]:
+        """
+        Runs the graph on the inputs.
+
+        Args:
+            targets (Iterable[str], optional): The values to compute. Defaults to all the node outputs.
+            use_memo (bool): Whether memoised outputs and stored artifacts can be reused. New outputs are memoised
+                             and stored either way, so a retry with use_memo=False replaces them.
+            **inputs: The input values, by name.
+
+        Returns:
+            Dict[str, Any]: The inputs and all the computed values, by name.
+        """
+        values = dict(inputs)
+        pending = self.plan(values, targets)
+        if not pending:
+            return values
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            running = {}
+            while pending or running:
+                ready = [
+                    name
+                    for name in pending
+                    if all(key in values for key in self.nodes[name].inputs)
+                ]
+                for name in ready:
+                    pending.remove(name)
+                    node = self.nodes[name]
+                    node_inputs = {
+                        declared: values[key]
+                        for declared, key in zip(node.declared_inputs, node.inputs)
+                    }
+                    running[
+                        executor.submit(
+                            in_context(self.run_node), node, node_inputs, use_memo
+                        )
+                    ] = node
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    outputs = future.result()
+                    for declared, key in zip(node.declared_outputs, node.outputs):
+                        values[key] = outputs[declared]
+        return values
+
+    def run_node(
+        self, node: DataflowNode, inputs: Dict[str, Any], use_memo: bool
+    ) -> Dict[str, Any]:
+        with span(node.name, "stage") as stage_span:
+            if self.memo is None:
+                return self.compute_node(node, inputs, use_memo)
+            key = self.memo.make_key(node, inputs)
+            if use_memo:
+                outputs = self.memo.get(key)
+                if outputs is not None:
+                    self.logger.debug(
+                        f"==> Dataflow node {node.name}: memoised outputs reused"
+                    )
+                    stage_span.set(memoised=True)
+                    return outputs
+            outputs = self.compute_node(node, inputs, use_memo)
+            self.memo.set(key, outputs)
+            return outputs
+
+    def compute_node(
+        self, node: DataflowNode, inputs: Dict[str, Any], use_memo: bool
+    ) -> Dict[str, Any]:
+        if self.artifact_store is None or node.artifact_config is None:
+            return node.fn(**inputs)
+        key = self.artifact_store.artifact_key(
+            node.memo_scope, node.artifact_config, node.prompt_hash, inputs
+        )
+        return self.artifact_store.get_or_compute(
+            key, lambda: node.fn(**inputs), refresh=not use_memo
+        )
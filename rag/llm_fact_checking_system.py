@@ -1,7 +1,12 @@
 from utils.utils import *
 from pipeline import *
-from model import *
-from typing import Dict, Any, List
+from model import model_name_class_mapping
+from dataset.corpus_graph import CorpusGraph
+from dataset.corpus_triplet_index import CorpusTripletIndex
+from rag.dataflow import Dataflow, DataflowNode, NodeMemo
+from utils.artifact_store import get_artifact_store
+from utils.tracing import span
+from typing import Dict, Any, List, Optional, Callable, Tuple
 
 
 class LLMFactCheckingSystem(PipelineBase):
@@ -13,9 +18,27 @@ class LLMFactCheckingSystem(PipelineBase):
       3)Defines methods needed in above process.
     """
 
-    def __init__(self, config: dict, logger: logging.Logger):
+    def __init__(
+        self,
+        config: dict,
+        logger: logging.Logger,
+        corpus_graph: Optional[CorpusGraph] = None,
+        corpus_triplet_index: Optional[CorpusTripletIndex] = None,
+    ):
         super().__init__(config)
         self.logger = logger
+        if (
+            corpus_graph is None
+            and self.config.model.fact_checker.reference_scope == "graph"
+        ):
+            corpus_graph = CorpusGraph(config, logger)
+        self.corpus_graph = corpus_graph
+        if (
+            corpus_triplet_index is None
+            and self.config.model.fact_checker.reference_scope == "corpus"
+        ):
+            corpus_triplet_index = CorpusTripletIndex(config, logger)
+        self.corpus_triplet_index = corpus_triplet_index
         self.answer_generator = model_name_class_mapping["answer_generator"][
             config.model.answer_generator.model_name
         ](config, logger)
@@ -31,8 +54,143 @@ class LLMFactCheckingSystem(PipelineBase):
         self.hallucination_data_generator = model_name_class_mapping[
             "hallucination_data_generator"
         ][config.model.hallucination_data_generator.model_name](config, logger)
+        self.build_dataflows()
 
-    def forward(self, data: Dict[str, Any]):
+    def build_dataflows(self):
+        """
+        Build the dataflow graphs of the forward passes from the components' input_output_format (see rag/dataflow.py):
+            - self.dataflow: reference_documents, question -> generated_answer -> answer_triplets, then the reference
+              triplets of the fact checker are selected (reference scope) and the answer triplets are fact checked.
+            - self.prompt_dataflow: the same graph from an already built question_prompt (reprompts).
+            - self.text_match_dataflow: the answer and the reference texts are turned into triplets concurrently,
+              then fact checked.
+        They share the memoised node outputs. With experiment_setup.artifact_store.enabled, the generated answers,
+        answer triplets and fact checking predictions are also persisted as artifacts keyed by the config slice and
+        the prompts of their stage (see utils/artifact_store.py), so reruns only execute the stages that changed.
+        """
+        dataflow_config = self.config.experiment_setup.dataflow
+        memo = NodeMemo(dataflow_config.memo_size) if dataflow_config.memoise else None
+        self.artifact_store = None
+        if self.config.experiment_setup.artifact_store.enabled:
+            self.artifact_store = get_artifact_store(
+                f"{self.config.path.cache}artifacts"
+            )
+        llm_config = self.config.model.llm
+        entity_normalisation = self.config.experiment_setup.entity_normalisation
+        answer_artifact_config = {
+            "answer_generator": self.config.model.answer_generator,
+            "llm": llm_config,
+        }
+        triplet_artifact_config = {
+            "triplet_generator": self.config.model.triplet_generator,
+            "llm": llm_config,
+            "entity_normalisation": entity_normalisation,
+        }
+        fact_check_artifact_config = {
+            "fact_checker": self.config.model.fact_checker,
+            "llm": llm_config,
+            "entity_normalisation": entity_normalisation,
+        }
+        answer_fact_checking_nodes = [
+            DataflowNode.from_component(
+                "answer_triplet_generation",
+                self.triplet_generator,
+                artifact_config=triplet_artifact_config,
+            ),
+            DataflowNode(
+                "reference_selection",
+                self.select_reference_triplets,
+                inputs=[
+                    "answer_triplets",
+                    "reference_triplets",
+                    "relevant_passage_ids",
+                ],
+                outputs=["fact_check_reference_triplets"],
+            ),
+            DataflowNode.from_component(
+                "fact_checking",
+                self.fact_checker,
+                rename={"reference_triplets": "fact_check_reference_triplets"},
+                artifact_config=fact_check_artifact_config,
+            ),
+        ]
+        self.dataflow = Dataflow(
+            [
+                DataflowNode.from_component(
+                    "answer_generation",
+                    self.answer_generator,
+                    artifact_config=answer_artifact_config,
+                ),
+                *answer_fact_checking_nodes,
+            ],
+            logger=self.logger,
+            max_workers=dataflow_config.max_workers,
+            memo=memo,
+            artifact_store=self.artifact_store,
+        )
+        # the prompt is an input of the node, so its templates are not part of the artifact key
+        self.prompt_dataflow = Dataflow(
+            [
+                DataflowNode(
+                    "answer_generation",
+                    self.answer_generator.run_prompt,
+                    inputs=["question_prompt"],
+                    outputs=["generated_answer"],
+                    memo_scope=f"{type(self.answer_generator).__name__}.run_prompt",
+                    artifact_config=answer_artifact_config,
+                ),
+                *answer_fact_checking_nodes,
+            ],
+            logger=self.logger,
+            max_workers=dataflow_config.max_workers,
+            memo=memo,
+            artifact_store=self.artifact_store,
+        )
+        self.text_match_dataflow = Dataflow(
+            [
+                DataflowNode.from_component(
+                    "answer_triplet_generation",
+                    self.triplet_generator,
+                    artifact_config=triplet_artifact_config,
+                ),
+                DataflowNode.from_component(
+                    "reference_triplet_generation",
+                    self.triplet_generator,
+                    rename={
+                        "generated_answer": "reference_text",
+                        "answer_triplets": "reference_triplets",
+                    },
+                    artifact_config=triplet_artifact_config,
+                ),
+                DataflowNode.from_component(
+                    "fact_checking",
+                    self.fact_checker,
+                    artifact_config=fact_check_artifact_config,
+                ),
+            ],
+            logger=self.logger,
+            max_workers=dataflow_config.max_workers,
+            memo=memo,
+            artifact_store=self.artifact_store,
+        )
+
+    def token_usage(self) -> Dict[str, int]:
+        """
+        The LLM calls and tokens of all the components since they were created.
+        """
+        usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+        for component in (
+            self.answer_generator,
+            self.triplet_generator,
+            self.fact_checker,
+            self.reprompter,
+            self.hallucination_data_generator,
+        ):
+            for key, value in getattr(component, "token_usage", {}).items():
+                usage[key] += value
+        return usage
+
+    def forward(self, data: Dict[str, Any], use_memo: bool = True):
         """
         The whole process of actual forward pass of the system. Processes the input data and generates a response using the model.
 
@@ -41,18 +199,61 @@ class LLMFactCheckingSystem(PipelineBase):
                 - "reference_documents" (List[str]): A list of reference documents.
                 - "question" (str): The question to be answered.
                 - "reference_triplets" (Any): Additional data required for the model.
+            use_memo (bool): Whether memoised outputs of the dataflow nodes can be reused. False for retries.
 
         Returns:
             Any: The output generated by the model based on the input data.
         """
+        with span("forward", "system", use_memo=use_memo):
+            values = self.dataflow.run(
+                targets=["fact_check_prediction_binary"],
+                use_memo=use_memo,
+                **self.dataflow_inputs(data),
+            )
+        return self.model_forward_output(values)
 
-        question_prompt = self.answer_generator.get_model_prompt(
-            reference_documents=data["reference_documents"], question=data["question"]
-        )
+    def dataflow_inputs(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        The inputs of self.dataflow for a data row.
+        """
+        return {
+            "reference_documents": data["reference_documents"],
+            "question": data["question"],
+            "reference_triplets": data["reference_triplets"],
+            "relevant_passage_ids": data.get("relevant_passage_ids"),
+        }
+
+    def forward_stages(self) -> List[Tuple[str, Callable[[Any], Any]]]:
+        """
+        The stages of `forward`, for a staged executor (rag.pipeline_executor) running several data rows at once.
+        Each stage runs the dataflow up to its target. The first stage takes a data row, the last one returns the
+        same output as `forward`.
 
-        return self.model_forward(question_prompt, data["reference_triplets"])
+        Returns:
+            List[Tuple[str, Callable]]: (stage name, stage function) pairs, in order.
+        """
+        return [
+            (
+                "answer_generation",
+                lambda data: self.dataflow.run(
+                    targets=["generated_answer"], **self.dataflow_inputs(data)
+                ),
+            ),
+            (
+                "triplet_generation",
+                lambda values: self.dataflow.run(targets=["answer_triplets"], **values),
+            ),
+            (
+                "fact_checking",
+                lambda values: self.model_forward_output(
+                    self.dataflow.run(
+                        targets=["fact_check_prediction_binary"], **values
+                    )
+                ),
+            ),
+        ]
 
-    def reprompter_forward(self, data: dict, output: dict):
+    def reprompter_forward(self, data: dict, output: dict, use_memo: bool = True):
         """
         Processes the forward pass for the reprompter model.
 
@@ -66,6 +267,7 @@ class LLMFactCheckingSystem(PipelineBase):
                 - answer_triplets (list): A list of answer triplets.
                 - fact_check_prediction_binary (bool): The binary prediction result of fact-checking.
             dataset: The dataset being used (not utilized in the current implementation).
+            use_memo (bool): Whether memoised outputs of the dataflow nodes can be reused. False for retries.
 
         Returns:
             dict: A dictionary with keys prefixed by "reprompt_" containing the output from the reprompter model.
@@ -78,11 +280,22 @@ class LLMFactCheckingSystem(PipelineBase):
             prediction_binary=output["fact_check_prediction_binary"],
         )
 
-        output = self.model_forward(reprompt_prompt, data["reference_triplets"])
+        output = self.model_forward(
+            reprompt_prompt,
+            data["reference_triplets"],
+            passage_ids=data.get("relevant_passage_ids"),
+            use_memo=use_memo,
+        )
 
         return {f"reprompt_{k}": v for k, v in output.items()}
 
-    def model_forward(self, question_prompt: str, source_triplets: List[List[str]]):
+    def model_forward(
+        self,
+        question_prompt: str,
+        source_triplets: List[List[str]],
+        passage_ids: Optional[List[int]] = None,
+        use_memo: bool = True,
+    ):
         """
         Forward pass of just models. Processes a question prompt and source triplets to generate an answer, extract triplets from the answer,
         and perform fact-checking.
@@ -90,6 +303,8 @@ class LLMFactCheckingSystem(PipelineBase):
         Args:
             question_prompt (str): The input question prompt to generate an answer for.
             source_triplets (List[List[str]]): A list of source triplets to fact-check the generated answer against.
+            passage_ids (List[int], optional): The relevant passage ids of the question, used to restrict the reference scope.
+            use_memo (bool): Whether memoised outputs of the dataflow nodes can be reused. False for retries.
 
         Returns:
             dict: A dictionary containing the following keys:
@@ -99,21 +314,79 @@ class LLMFactCheckingSystem(PipelineBase):
                 - "generated_answer" (str): The generated answer based on the question prompt.
                 - "question_prompt" (str): The original question prompt.
         """
-        generated_answer = self.answer_generator.forward(question_prompt)
+        with span("model_forward", "system", use_memo=use_memo):
+            values = self.prompt_dataflow.run(
+                targets=["fact_check_prediction_binary"],
+                use_memo=use_memo,
+                question_prompt=question_prompt,
+                reference_triplets=source_triplets,
+                relevant_passage_ids=passage_ids,
+            )
+        return self.model_forward_output(values)
 
-        answer_triplets, triplet_generator_prompt = self.triplet_generator.forward(
-            generated_answer, return_prompt=True
-        )
-        fact_check_prediction_binary, prediction_raw = self.fact_checker.forward(
-            answer_triplets, source_triplets, return_prompt=False
-        )
+    def model_forward_output(self, values: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "fact_check_prediction_binary": values["fact_check_prediction_binary"],
+            "answer_triplets": values["answer_triplets"],
+            "generated_answer": values["generated_answer"],
+        }
+
+    def select_reference_triplets(
+        self,
+        answer_triplets: List[List[str]],
+        reference_triplets: List[List[str]],
+        relevant_passage_ids: Optional[List[int]] = None,
+    ) -> Dict[str, Any]:
+        """
+        The reference selection node of the dataflow, see `get_reference_triplets`.
+        """
         return {
-            "fact_check_prediction_binary": fact_check_prediction_binary,
-            "answer_triplets": answer_triplets,
-            "generated_answer": generated_answer,
+            "fact_check_reference_triplets": self.get_reference_triplets(
+                answer_triplets, reference_triplets, passage_ids=relevant_passage_ids
+            )
         }
 
-    def hlcntn_forward(self, data, hlcntn_data):
+    def get_reference_triplets(
+        self,
+        answer_triplets: List[List[str]],
+        reference_triplets: List[List[str]],
+        passage_ids: Optional[List[int]] = None,
+    ):
+        """
+        Select the reference triplets the fact checker compares the answer triplets against,
+        depending on config.model.fact_checker.reference_scope:
+            - "passages": all the triplets of the relevant passages (the given reference_triplets).
+            - "graph": only the corpus graph neighbourhood of the answer triplet entities, restricted to the relevant passages.
+              Falls back to the passage triplets when the neighbourhood is empty.
+            - "corpus": open-world mode, the top config.model.fact_checker.corpus_top_k corpus triplets of each answer triplet,
+              looked up in the corpus-wide triplet index regardless of the relevant passages.
+
+        Args:
+            answer_triplets (List[List[str]]): The triplets extracted from the generated answer.
+            reference_triplets (List[List[str]]): The reference triplets of the relevant passages.
+            passage_ids (List[int], optional): The relevant passage ids of the question.
+
+        Returns:
+            List[List[str]]: The reference triplets, in the same (segmented) format as the input.
+        """
+        if self.config.model.fact_checker.reference_scope == "graph":
+            neighbourhood = self.corpus_graph.answer_neighbourhood_segments(
+                answer_triplets,
+                hops=self.config.model.fact_checker.graph_hops,
+                passage_ids=passage_ids,
+            )
+            if sum(len(segment) for segment in neighbourhood) > 0:
+                return neighbourhood
+            self.logger.debug(
+                "Empty graph neighbourhood for the answer triplets, using the passage triplets"
+            )
+        elif self.config.model.fact_checker.reference_scope == "corpus":
+            return self.corpus_triplet_index.candidate_segments(
+                answer_triplets, top_k=self.config.model.fact_checker.corpus_top_k
+            )
+        return reference_triplets
+
+    def hlcntn_forward(self, data, hlcntn_data, use_memo: bool = True):
         """
         Perform forward pass for hallucination data fact-checking.
 
@@ -123,6 +396,7 @@ class LLMFactCheckingSystem(PipelineBase):
             hlcntn_data (dict): A dictionary containing hallucination data.
                 - "answer_triplets" (list): List of answer triplets generated from hallucination data.
                 - "generated_answer" (str): The generated answer from hallucination data.
+            use_memo (bool): Whether memoised outputs of the dataflow nodes can be reused. False for retries.
 
         Returns:
             dict: A dictionary containing the fact-checking results.
@@ -131,44 +405,45 @@ class LLMFactCheckingSystem(PipelineBase):
                 - "answer_triplets" (list): The answer triplets from hallucination data.
                 - "generated_answer" (str): The generated answer from hallucination data.
         """
-        prediction_binary, prediction_raw = self.fact_checker.forward(
-            hlcntn_data[
-                "answer_triplets"
-            ],  # we should change the first input if we want to generate triplet from hallucination data at inference time
-            data["reference_triplets"],
-            return_prompt=False,
-        )
-        return {
-            "fact_check_prediction_binary": prediction_binary,
-            "answer_triplets": hlcntn_data["answer_triplets"],
-            "generated_answer": hlcntn_data["generated_answer"],
-        }
+        # the answer triplets are given, so only the reference selection and the fact checking run.
+        # we should not give them if we want to generate triplet from hallucination data at inference time
+        with span("hlcntn_forward", "system", use_memo=use_memo):
+            values = self.dataflow.run(
+                targets=["fact_check_prediction_binary"],
+                use_memo=use_memo,
+                generated_answer=hlcntn_data["generated_answer"],
+                answer_triplets=hlcntn_data["answer_triplets"],
+                reference_triplets=data["reference_triplets"],
+                relevant_passage_ids=data.get("relevant_passage_ids"),
+            )
+        return self.model_forward_output(values)
 
-    def direct_text_match_forward(self, answer_text, reference_text):
+    def direct_text_match_forward(
+        self, answer_text, reference_text=None, reference_triplets=None
+    ):
         """
         input:
             - answer_text: The text to be checked.
             - reference_text: The reference text to compare against.
+            - reference_triplets: Or the triplets of the reference, e.g. of corpus passages, then the reference
+              triplet generation is skipped.
         output:
             -  the triplets from the answer text
             -  the fact checker output
             -  which triplet is predicted as False
         """
+        if reference_triplets is not None:
+            reference = {"reference_triplets": reference_triplets}
+        else:
+            reference = {"reference_text": reference_text}
 
-        answer_triplets = self.triplet_generator.forward(
-            answer_text, return_prompt=False
-        )
-
-        reference_triplets = self.triplet_generator.forward(
-            reference_text, return_prompt=False
-        )
-
-        fact_check_prediction_binary, prediction_raw = self.fact_checker.forward(
-            answer_triplets, reference_triplets, return_prompt=False
-        )
-
+        # the answer and the reference triplets are extracted concurrently
+        with span("direct_text_match_forward", "system"):
+            values = self.text_match_dataflow.run(
+                generated_answer=answer_text, **reference
+            )
         return {
-            "answer_triplets": answer_triplets,
-            "reference_triplets": reference_triplets,
-            "fact_check_prediction_binary": fact_check_prediction_binary,
+            "answer_triplets": values["answer_triplets"],
+            "reference_triplets": values["reference_triplets"],
+            "fact_check_prediction_binary": values["fact_check_prediction_binary"],
         }
@@ -0,0 +1,248 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from utils.tracing import in_context
+
+BACKPRESSURE_POLICIES = ("block", "drop")
+# end of stream marker, one per worker of the next stage
+_STOP = object()
+
+
+class StageError:
+    """
+    The result of an item that failed in a stage (or was dropped by its backpressure policy).
+    """
+
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+
+    def __repr__(self):
+        return f"StageError(stage={self.stage!r}, error={self.error!r})"
+
+
+class Stage:
+    """
+    A stage of a StagedPipelineExecutor.
+
+    Args:
+        name (str): The stage name, used in the metrics.
+        fn (Callable[[Any], Any]): Transforms the output of the previous stage into the input of the next one.
+        concurrency (int): The number of worker threads of the stage.
+        queue_size (int): The capacity of the input queue of the stage.
+        backpressure (str): What a worker of the previous stage does when the input queue of the stage is full:
+            - "block": wait for a free slot, so a slow stage throttles the stages before it.
+            - "drop": give up on the item, its result is a StageError.
+            The items of the first stage come from the input iterable, which always waits for a free slot (dropping
+            them would only make a fast producer give up on most of its items).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Any],
+        concurrency: int = 1,
+        queue_size: int = 4,
+        backpressure: str = "block",
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(
+                f"Unknown backpressure policy {backpressure}, expected one of {BACKPRESSURE_POLICIES}"
+            )
+        self.name = name
+        self.fn = fn
+        self.concurrency = max(int(concurrency), 1)
+        self.queue_size = max(int(queue_size), 1)
+        self.backpressure = backpressure
+
+
+class StageMetrics:
+    """
+    Counters of a stage, updated by its workers and by the workers feeding its queue.
+    """
+
+    def __init__(self, stage: Stage):
+        self.stage = stage
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.queue_depth_sum = 0
+        self.queue_depth_samples = 0
+        self.max_queue_depth = 0
+        self.lock = threading.Lock()
+
+    def sample_queue_depth(self, depth: int) -> None:
+        with self.lock:
+            self.queue_depth_sum += depth
+            self.queue_depth_samples += 1
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def as_dict(self, wall_time: float) -> Dict[str, Any]:
+        return {
+            "concurrency": self.stage.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "busy_time": self.busy_time,
+            # share of the worker time spent processing items
+            "utilisation": self.busy_time
+            / max(wall_time * self.stage.concurrency, 1e-9),
+            # time spent by the previous stage waiting for a free slot in this stage's queue
+            "blocked_time": self.blocked_time,
+            "avg_queue_depth": self.queue_depth_sum / max(self.queue_depth_samples, 1),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_size": self.stage.queue_size,
+        }
+
+
+class StagedPipelineExecutor:
+    """
+    Runs items through a sequence of stages, each stage with its own worker threads and a bounded input queue,
+    so that different items are in different stages at the same time (item i+1 is in the first stage while
+    item i is in the second one). The results keep the order of the input items.
+
+    An exception raised by a stage becomes the result of the item (a StageError) and the item skips the following
+    stages. The per-stage metrics (utilisation, queue depth, time blocked by backpressure) show the bottleneck:
+    the stage with the highest utilisation and a full input queue.
+
+    Methods:
+        run(items: Iterable[Any]) -> List[Any]:
+            Runs the items through all the stages.
+        metrics() -> Dict[str, Dict[str, Any]]:
+            The metrics of every stage of the last run.
+        log_metrics() -> None:
+            Logs the metrics of the last run.
+    """
+
+    def __init__(self, stages: List[Stage], logger: Optional[logging.Logger] = None):
+        if len(stages) == 0:
+            raise ValueError("A pipeline needs at least one stage")
+        self.stages = stages
+        self.logger = logger or logging.getLogger(__name__)
+        self.stage_metrics = {stage.name: StageMetrics(stage) for stage in stages}
+        self.wall_time = 0.0
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        """
+        Runs the items through all the stages.
+
+        Args:
+            items (Iterable[Any]): The inputs of the first stage. They are consumed lazily, as the first queue has room.
+
+        Returns:
+            List[Any]: The output of the last stage (or a StageError) of every item, in the order of the items.
+        """
+        self.stage_metrics = {stage.name: StageMetrics(stage) for stage in self.stages}
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        results = {}
+        results_lock = threading.Lock()
+
+        def put(stage_idx: int, entry, source: bool = False) -> None:
+            stage = self.stages[stage_idx]
+            metrics = self.stage_metrics[stage.name]
+            target = queues[stage_idx]
+            metrics.sample_queue_depth(target.qsize())
+            # the backpressure policy applies to the handoffs between stages, the source feed always blocks
+            if stage.backpressure == "drop" and not source:
+                try:
+                    target.put_nowait(entry)
+                except queue.Full:
+                    with metrics.lock:
+                        metrics.dropped += 1
+                    with results_lock:
+                        results[entry[0]] = StageError(
+                            stage.name, RuntimeError("dropped by backpressure")
+                        )
+                return
+            start = time.perf_counter()
+            target.put(entry)
+            with metrics.lock:
+                metrics.blocked_time += time.perf_counter() - start
+
+        def worker(stage_idx: int) -> None:
+            stage = self.stages[stage_idx]
+            metrics = self.stage_metrics[stage.name]
+            while True:
+                entry = queues[stage_idx].get()
+                if entry is _STOP:
+                    return
+                position, value = entry
+                start = time.perf_counter()
+                try:
+                    output = stage.fn(value)
+                except Exception as e:
+                    self.logger.warning(
+                        f"Stage {stage.name} failed for item {position}: {e}"
+                    )
+                    output = StageError(stage.name, e)
+                with metrics.lock:
+                    metrics.busy_time += time.perf_counter() - start
+                    metrics.processed += 1
+                    metrics.failed += isinstance(output, StageError)
+                if stage_idx + 1 < len(self.stages) and not isinstance(
+                    output, StageError
+                ):
+                    put(stage_idx + 1, (position, output))
+                else:
+                    with results_lock:
+                        results[position] = output
+
+        start = time.perf_counter()
+        workers = []
+        for stage_idx, stage in enumerate(self.stages):
+            workers.append(
+                [
+                    threading.Thread(
+                        # the spans of the stages are children of the current span
+                        target=in_context(worker),
+                        args=(stage_idx,),
+                        name=f"{stage.name}-{worker_idx}",
+                        daemon=True,
+                    )
+                    for worker_idx in range(stage.concurrency)
+                ]
+            )
+            for thread in workers[-1]:
+                thread.start()
+
+        num_items = 0
+        for position, item in enumerate(items):
+            put(0, (position, item), source=True)
+            num_items += 1
+
+        # stop the stages in order: a stage is stopped once all the workers feeding it have returned
+        for stage_idx, stage in enumerate(self.stages):
+            for _ in range(stage.concurrency):
+                queues[stage_idx].put(_STOP)
+            for thread in workers[stage_idx]:
+                thread.join()
+        self.wall_time = time.perf_counter() - start
+        return [results[position] for position in range(num_items)]
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: metrics.as_dict(self.wall_time)
+            for name, metrics in self.stage_metrics.items()
+        }
+
+    def log_metrics(self) -> None:
+        stage_metrics = self.metrics()
+        for name, metrics in stage_metrics.items():
+            self.logger.info(
+                f"==> Stage {name}: {metrics['processed']} items ({metrics['failed']} failed, "
+                f"{metrics['dropped']} dropped) on {metrics['concurrency']} workers, "
+                f"utilisation {metrics['utilisation']:.0%}, "
+                f"queue depth avg {metrics['avg_queue_depth']:.1f} / max {metrics['max_queue_depth']} "
+                f"of {metrics['queue_size']}, blocked upstream {metrics['blocked_time']:.1f}s"
+            )
+        bottleneck = max(
+            stage_metrics, key=lambda name: stage_metrics[name]["utilisation"]
+        )
+        self.logger.info(
+            f"==> Pipeline wall time {self.wall_time:.1f}s, bottleneck stage: {bottleneck}"
+        )
@@ -0,0 +1,64 @@
+import glob
+import json
+import os
+import time
+
+from main import *
+from utils.scoring import score_predictions
+from utils.utils import ExperimentLogger
+
+"""
+Recomputes the metrics of saved predictions with the current scoring code (utils/scoring.py), without any LLM call.
+Every predictions*.json of results/{experiment_name}/ is scored, and its metrics are written next to it with a
+"_rescored" suffix (predictions.json -> metrics_rescored.json,
+predictions_hallucination.json -> metrics_hallucination_rescored.json).
+
+    python rescore.py -e my_experiment
+"""
+
+
+def rescored_metrics_file_name(predictions_file_name: str) -> str:
+    experiment_result = config.path.experiment_result
+    metrics_file_name = {
+        experiment_result.predictions: experiment_result.metrics,
+        experiment_result.hallucination_predictions: experiment_result.hallucination_metrics,
+    }.get(
+        predictions_file_name,
+        predictions_file_name.replace("predictions", "metrics", 1),
+    )
+    root, extension = os.path.splitext(metrics_file_name)
+    return f"{root}_rescored{extension}"
+
+
+if __name__ == "__main__":
+    experiment_result_path = (
+        f"{config.path.experiment_result.base}{config.experiment_name}/"
+    )
+    logger = ExperimentLogger(
+        "", log_path=experiment_result_path, logger_level=config.logger_level
+    )
+    predictions_paths = sorted(glob.glob(f"{experiment_result_path}predictions*.json"))
+    if not predictions_paths:
+        logger.warning(f"==> No predictions*.json in {experiment_result_path}")
+
+    for predictions_path in predictions_paths:
+        start = time.perf_counter()
+        with open(predictions_path, "r") as f:
+            prediction_result = json.load(f)
+        if not prediction_result:
+            logger.warning(f"==> {predictions_path} has no prediction, skipped")
+            continue
+        metrics = score_predictions(prediction_result)
+        metrics_path = f"{experiment_result_path}{rescored_metrics_file_name(os.path.basename(predictions_path))}"
+        with open(metrics_path, "w") as f:
+            json.dump(metrics, f)
+        logger.info(
+            f"==> Rescored {len(prediction_result)} records of {predictions_path} in "
+            f"{time.perf_counter() - start:.3f}s: precision {metrics['precision']:.4f}"
+            + (
+                f", specificity {metrics['specificity']:.4f}"
+                if "specificity" in metrics
+                else ""
+            )
+            + f" -> {metrics_path}"
+        )
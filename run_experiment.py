@@ -17,6 +17,8 @@ if __name__ == "__main__":
         "",
         log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
         logger_level=config.logger_level,
+        console=config.experiment_setup.logging.console,
+        event_log=config.experiment_setup.logging.event_log,
     )
     experiment_manager = ExperimentManager(config, logger)
     experiment_manager.run_experiment(
@@ -0,0 +1,47 @@
+import json
+
+from easydict import EasyDict as edict
+
+from fact_check_service import FactCheckService
+from llm_simulator import LLMSimulator
+from main import *
+from utils.metrics_endpoint import start_metrics_endpoint
+from utils.utils import ExperimentLogger
+
+"""
+Serves the fact checking service (fact_check_service/, settings in config.experiment_setup.fact_check_service) until
+interrupted, with a warm LLMFactCheckingSystem:
+
+    python run_fact_check_service.py -e fact_check_service
+    curl -X POST http://127.0.0.1:8100/check -d '{"answer": "...", "reference": "..."}'
+    curl -X POST http://127.0.0.1:8100/check -d '{"answer": "...", "passage_ids": [1, 2]}'
+    curl http://127.0.0.1:8100/stats
+
+With fact_check_service.simulator the LLM calls go to an in-process LLM simulator (config.model.llm.simulator, on a
+free port), otherwise to --llm_base_url or a cassette (--cassette_mode replay) if they are given. The latency
+percentiles are logged when the service stops.
+"""
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    simulator = None
+    if config.experiment_setup.fact_check_service.simulator:
+        simulator = LLMSimulator(edict({**config.model.llm.simulator, "port": 0}))
+        config.model.llm.base_url = simulator.start()
+        logger.info(f"==> LLM simulator serving on {config.model.llm.base_url}")
+    metrics_url = start_metrics_endpoint(config)
+    if metrics_url is not None:
+        logger.info(f"==> Metrics endpoint: {metrics_url}")
+    service = FactCheckService(config, logger)
+    logger.info(f"==> Fact checking service serving on {service.url}")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"==> Fact checking service stopped: {json.dumps(service.stats())}")
+    finally:
+        if simulator is not None:
+            simulator.stop()
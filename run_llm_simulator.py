@@ -0,0 +1,24 @@
+from llm_simulator import LLMSimulator
+from main import *
+from utils.utils import ExperimentLogger
+
+"""
+Serves the local OpenAI compatible LLM simulator (llm_simulator/, settings in config.model.llm.simulator) until
+interrupted. Point the LLM components at it with --llm_base_url:
+
+    python run_llm_simulator.py -e llm_simulator
+    python run_experiment.py -e simulated_run --num_test_samples 20 --llm_base_url http://127.0.0.1:8000/v1
+"""
+
+if __name__ == "__main__":
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{config.path.experiment_result.base}{config.experiment_name}/",
+        logger_level=config.logger_level,
+    )
+    simulator = LLMSimulator(config.model.llm.simulator)
+    logger.info(f"==> LLM simulator serving on {simulator.base_url}")
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"==> LLM simulator stopped: {simulator.stats()}")
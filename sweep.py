@@ -0,0 +1,179 @@
+import copy
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from easydict import EasyDict as edict
+
+from dataset.experiment_dataset import ExperimentDataset
+from experiment_manager import ExperimentManager
+from main import *
+from utils.sharding import sample_indices
+from utils.utils import ExperimentLogger
+
+load_dotenv()
+
+"""
+Runs one experiment per combination of a grid of config values, given as a JSON file of dotted config keys:
+
+    {
+        "model.fact_checker.num_shot": [1, 2],
+        "model.fact_checker.inquiry_prompt": ["n_shot_triplet_match_test_inquiry_1", "n_shot_triplet_match_test_inquiry_3"]
+    }
+
+    python sweep.py -e fact_checker_sweep --sweep sweep.json --num_test_samples 20
+
+The stage artifact store (experiment_setup.artifact_store) is enabled and shared by all the configurations, so a stage
+whose config slice, prompts and inputs are the same across configurations (usually answer and triplet generation) runs
+once. The configurations run concurrently (experiment_setup.sweep.max_concurrency): one computes a shared stage while
+the others wait for its output, then only their differing downstream stages run.
+
+The hallucinated data of the samples is loaded (or generated) once before the configurations start, with the base
+config, and shared by all of them: their specificities are measured on the same hallucinated answers, and they never
+generate nor write the same hallucinated sample concurrently.
+
+Each configuration saves its results in results/{experiment_name}/{variant}/, and the comparison table of the metrics,
+LLM tokens, cost and wall time per configuration is saved to results/{experiment_name}/sweep_results.json and .md.
+"""
+
+
+def set_config_value(config: edict, dotted_key: str, value) -> None:
+    *parents, key = dotted_key.split(".")
+    node = config
+    for parent in parents:
+        node = node[parent]
+    if key not in node:
+        raise KeyError(f"Unknown config key in the sweep grid: {dotted_key}")
+    node[key] = value
+
+
+def variant_configs(base_config: edict, grid: dict) -> list:
+    """
+    One config per combination of the grid values, with the variant name (short key=value pairs) as sub directory
+    of the experiment.
+    """
+    variants = []
+    for values in itertools.product(*grid.values()):
+        variant_config = edict(copy.deepcopy(base_config))
+        variant_name = "__".join(
+            f"{key.split('.')[-1]}={value}" for key, value in zip(grid, values)
+        )
+        for key, value in zip(grid, values):
+            set_config_value(variant_config, key, value)
+        variant_config.experiment_setup.artifact_store.enabled = True
+        variant_config.experiment_name = f"{base_config.experiment_name}/{variant_name}"
+        variants.append((variant_name, variant_config))
+    return variants
+
+
+def prepare_hallucination_data(config: edict, logger) -> dict:
+    """
+    Load or generate (and save, with config.save_data) the hallucinated data of the samples of the sweep, once for
+    all the configurations.
+
+    Returns:
+        dict: question index -> hallucinated data, None for the samples whose generation failed (skipped by every
+              configuration).
+    """
+    dataset = ExperimentDataset(config, logger)
+    num_samples = (
+        config.num_test_samples
+        if "num_test_samples" in config
+        else len(dataset.qa_dataset)
+    )
+    return {
+        idx: dataset.hlcntn_data_row_by_id(idx, save_data=config.save_data)
+        for idx in sample_indices(config, num_samples)
+    }
+
+
+def run_variant(
+    variant_name: str, variant_config: edict, hlcntn_data: dict = None
+) -> dict:
+    logger = ExperimentLogger(
+        "",
+        log_path=f"{variant_config.path.experiment_result.base}{variant_config.experiment_name}/",
+        logger_level=variant_config.logger_level,
+    )
+    start = time.perf_counter()
+    experiment_manager = ExperimentManager(variant_config, logger)
+    # the shared hallucinated data, so that the configuration does not generate its own
+    experiment_manager.dataset.hlcntn_dataset.update(hlcntn_data or {})
+    metrics, hlcntn_metrics = experiment_manager.run_experiment(
+        save_result=variant_config.save_result,
+        evalute_hlcntn=variant_config.evalute_hlcntn,
+        do_reprompt=variant_config.do_reprompt,
+    )
+    return {
+        "variant": variant_name,
+        "precision": metrics["precision"],
+        "specificity": hlcntn_metrics["specificity"] if hlcntn_metrics else None,
+        "num_non_hlcntn_triplets": metrics["num_non_hlcntn_triplets"],
+        **experiment_manager.model.token_usage(),
+        "cost_usd": experiment_manager.usage.total["cost_usd"],
+        "wall_time": time.perf_counter() - start,
+    }
+
+
+def comparison_table(rows: list) -> str:
+    columns = [
+        "variant",
+        "precision",
+        "specificity",
+        "num_non_hlcntn_triplets",
+        "calls",
+        "input_tokens",
+        "output_tokens",
+        "cost_usd",
+        "wall_time",
+    ]
+
+    def cell(value):
+        if value is None:
+            return "-"
+        if isinstance(value, float):
+            return f"{value:.3f}" if value < 10 else f"{value:.1f}"
+        return str(value)
+
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "|" + "|".join("---" for _ in columns) + "|",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join(cell(row[column]) for column in columns) + " |")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    experiment_result_path = (
+        f"{config.path.experiment_result.base}{config.experiment_name}/"
+    )
+    logger = ExperimentLogger(
+        "", log_path=experiment_result_path, logger_level=config.logger_level
+    )
+    with open(config.sweep, "r") as f:
+        grid = json.load(f)
+    variants = variant_configs(config, grid)
+    logger.info(f"==> Sweep of {len(variants)} configurations over {', '.join(grid)}")
+
+    start = time.perf_counter()
+    hlcntn_data = (
+        prepare_hallucination_data(config, logger) if config.evalute_hlcntn else None
+    )
+    with ThreadPoolExecutor(
+        max_workers=config.experiment_setup.sweep.max_concurrency
+    ) as executor:
+        rows = list(
+            executor.map(
+                lambda variant: run_variant(*variant, hlcntn_data=hlcntn_data),
+                variants,
+            )
+        )
+    table = comparison_table(rows)
+    logger.info(f"==> Sweep finished in {time.perf_counter() - start:.1f}s\n{table}")
+    with open(f"{experiment_result_path}sweep_results.json", "w") as f:
+        json.dump(rows, f, indent=4)
+    with open(f"{experiment_result_path}sweep_results.md", "w") as f:
+        f.write(table + "\n")
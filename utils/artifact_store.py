@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict
+
+from utils.cache import PersistentCache
+
+# process-wide stores by cache directory, so that the systems of a sweep share the single-flight of their stages
+_artifact_stores = {}
+_artifact_stores_lock = threading.Lock()
+
+
+def content_hash(value: Any) -> str:
+    """
+    sha256 of the JSON form of a value (objects without a JSON form are hashed by their string representation).
+    """
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode(
+            "utf-8"
+        )
+    ).hexdigest()
+
+
+def encode_artifact(value: Any) -> Any:
+    """
+    JSON form of an artifact. Dicts with non string keys (e.g. the triplet index -> prediction dicts of the fact checker)
+    are stored as their items, so that they are decoded with the same keys.
+    """
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: encode_artifact(item) for key, item in value.items()}
+        return {
+            "__items__": [[key, encode_artifact(item)] for key, item in value.items()]
+        }
+    if isinstance(value, (list, tuple)):
+        return [encode_artifact(item) for item in value]
+    return value
+
+
+def decode_artifact(value: Any) -> Any:
+    if isinstance(value, dict):
+        if set(value) == {"__items__"}:
+            return {key: decode_artifact(item) for key, item in value["__items__"]}
+        return {key: decode_artifact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_artifact(item) for item in value]
+    return value
+
+
+class ArtifactStore:
+    """
+    A content addressed store of stage outputs (artifacts), on top of PersistentCache.
+
+    The key of an artifact is the hash of:
+        - the stage name,
+        - the stage's config slice (e.g. config.model.fact_checker and config.model.llm),
+        - the hash of the prompt templates of the stage,
+        - the hashes of the upstream artifacts (the stage inputs).
+    Changing the fact checker prompt only changes the keys of the fact checking artifacts, so a rerun reuses the
+    stored answers and answer triplets and only runs the fact checker.
+
+    `get_or_compute` is single-flight: concurrent callers of the same key wait for the first one instead of
+    computing the artifact again.
+
+    Methods:
+        artifact_key(stage: str, config_slice: Any, prompt_hash: str, inputs: Dict[str, Any]) -> str:
+            The key of the artifact of a stage.
+        get_or_compute(key: str, compute: Callable[[], Any], refresh: bool = False) -> Any:
+            Returns the stored artifact, or computes and stores it.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache = PersistentCache(cache_dir)
+        self.computed = 0
+        self.reused = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def artifact_key(
+        self, stage: str, config_slice: Any, prompt_hash: str, inputs: Dict[str, Any]
+    ) -> str:
+        return self.cache.make_key(
+            stage,
+            config_slice,
+            prompt_hash,
+            {name: content_hash(value) for name, value in inputs.items()},
+        )
+
+    def get_or_compute(
+        self, key: str, compute: Callable[[], Any], refresh: bool = False
+    ) -> Any:
+        """
+        Get an artifact, computing and storing it if it is missing.
+
+        Args:
+            key (str): A key from `artifact_key`.
+            compute (Callable[[], Any]): Computes the (JSON serialisable) artifact.
+            refresh (bool): Compute the artifact even if it is stored, and replace it (e.g. for a retry).
+
+        Returns:
+            Any: The artifact.
+        """
+        while True:
+            if not refresh:
+                artifact = self.cache.get(key)
+                if artifact is not None:
+                    with self._lock:
+                        self.reused += 1
+                    return decode_artifact(artifact["value"])
+            with self._lock:
+                event = self._in_flight.get(key)
+                if event is None:
+                    event = self._in_flight[key] = threading.Event()
+                    break
+            # another thread computes the artifact, wait for it and read it
+            event.wait()
+            refresh = False
+
+        try:
+            value = compute()
+            self.cache.set(key, {"value": encode_artifact(value)})
+            with self._lock:
+                self.computed += 1
+            return value
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+
+def get_artifact_store(cache_dir: str) -> ArtifactStore:
+    """
+    Get the process-wide artifact store of a cache directory.
+    """
+    with _artifact_stores_lock:
+        if cache_dir not in _artifact_stores:
+            _artifact_stores[cache_dir] = ArtifactStore(cache_dir)
+        return _artifact_stores[cache_dir]
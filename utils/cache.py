@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Optional
+
+
+class PersistentCache:
+    """
+    A persistent key -> JSON value cache, stored as one file per entry under `cache_dir`.
+
+    Keys are hashed with sha256 and files are spread over 256 sub directories (first two hex characters).
+    Every write goes to a temporary file in the same directory and is then renamed with os.replace, so a reader
+    never sees a partial entry, and several processes (or machines sharing a network file system) can use the
+    same cache directory concurrently: the last writer wins, and all writers write the same value for a key.
+    Entries read or written by this process are also kept in memory.
+
+    Methods:
+        make_key(*parts) -> str:
+            Builds a key from any JSON serialisable parts.
+        get(key: str) -> Optional[Any]:
+            Returns the cached value, or None.
+        set(key: str, value: Any) -> None:
+            Stores a value.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.memory = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        return f"{self.cache_dir}/{key[:2]}/{key}.json"
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get a cached value.
+
+        Args:
+            key (str): A key from `make_key`.
+
+        Returns:
+            Optional[Any]: The value, or None if the key is not cached (or its entry is unreadable).
+        """
+        with self._lock:
+            if key in self.memory:
+                self.hits += 1
+                return self.memory[key]
+        try:
+            with open(self.entry_path(key), "r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.memory[key] = value
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a value, atomically.
+
+        Args:
+            key (str): A key from `make_key`.
+            value (Any): A JSON serialisable value.
+        """
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.memory[key] = value
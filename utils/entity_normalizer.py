@@ -0,0 +1,340 @@
+import json
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.text_utils import STOPWORDS
+
+# "long form (SHORT)" or "long form (SHORT1/SHORT2)"
+PARENTHESIS_PATTERN = re.compile(r"\(([^()]{1,40})\)")
+# "X, also known as Y" / "X (also called Y)"
+ALSO_KNOWN_AS_PATTERN = re.compile(
+    r"([\w\- ]{2,60}?)\s*[,(]\s*(?:also|otherwise)\s+(?:known as|called|termed|named)\s+([\w\- ]{2,60}?)\s*[,;.)]",
+    re.IGNORECASE,
+)
+# unicode aware, so that greek letters stay in the token ("tr-α")
+ENTITY_TOKEN_PATTERN = re.compile(r"[^\W_]+(?:-[^\W_]+)*")
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"[.;:!?]\s")
+TRIE_END = "\0"
+
+
+def normalise_alias(text: str) -> str:
+    """
+    Lower case and collapse the whitespaces of an alias, so that spelling variants share the same key.
+    """
+    return " ".join(str(text).lower().split()).strip(" .,;:-\"'")
+
+
+def is_short_form(candidate: str) -> bool:
+    """
+    Schwartz & Hearst short form heuristics: 2 to 10 characters, at most 2 words, starts with an
+    alphanumeric character, contains a letter, and is not a common word.
+    """
+    candidate = candidate.strip()
+    return (
+        2 <= len(candidate) <= 10
+        and len(candidate.split()) <= 2
+        and candidate[0].isalnum()
+        and any(c.isalpha() for c in candidate)
+        and any(c.isupper() or c.isdigit() for c in candidate)
+        and candidate.lower() not in STOPWORDS
+    )
+
+
+def find_initials_long_form(short_form: str, long_form_candidate: str) -> Optional[str]:
+    """
+    Match the short form against the initials of the last words of the long form candidate,
+    e.g. "TTF1" -> "thyroid transcription factor 1". Digits have to match a whole word.
+
+    Returns:
+        Optional[str]: The matching words, or None.
+    """
+    long_form_candidate = long_form_candidate.strip()
+    characters = [c.lower() for c in short_form if c.isalnum()]
+    words = re.split(r"[\s\-]+", long_form_candidate)
+    if len(characters) < 2 or len(characters) > len(words):
+        return None
+    last_words = words[-len(characters) :]
+    for char, word in zip(characters, last_words):
+        if char.isdigit() and word != char:
+            return None
+        if not word.lower().startswith(char):
+            return None
+    # keep the original spacing/hyphenation of the candidate
+    start = len(long_form_candidate)
+    for _ in range(len(characters)):
+        start = max(
+            long_form_candidate.rfind(" ", 0, start),
+            long_form_candidate.rfind("-", 0, start),
+        )
+    return long_form_candidate[start + 1 :]
+
+
+def find_best_long_form(short_form: str, long_form_candidate: str) -> Optional[str]:
+    """
+    Schwartz & Hearst algorithm: match the characters of the short form from right to left in the
+    long form candidate, the first character of the short form must start a word.
+
+    Args:
+        short_form (str): The abbreviation, e.g. "TTF1".
+        long_form_candidate (str): The words preceding the parenthesis.
+
+    Returns:
+        Optional[str]: The shortest long form explaining the short form, e.g. "thyroid transcription factor 1", or None.
+    """
+    short_idx = len(short_form) - 1
+    long_idx = len(long_form_candidate) - 1
+    while short_idx >= 0:
+        char = short_form[short_idx].lower()
+        if not char.isalnum():
+            short_idx -= 1
+            continue
+        while (long_idx >= 0 and long_form_candidate[long_idx].lower() != char) or (
+            short_idx == 0
+            and long_idx > 0
+            and long_form_candidate[long_idx - 1].isalnum()
+        ):
+            long_idx -= 1
+        if long_idx < 0:
+            return None
+        long_idx -= 1
+        short_idx -= 1
+    long_idx = long_form_candidate.rfind(" ", 0, long_idx + 1) + 1
+    long_form = long_form_candidate[long_idx:].strip()
+    # "the influence of triiodothyronine (T3)" would map T3 to the whole phrase
+    if len(long_form) <= len(short_form) or long_form.split()[0].lower() in STOPWORDS:
+        return None
+    return long_form
+
+
+def extract_alias_pairs(text: str) -> List[Tuple[str, str]]:
+    """
+    Extract (alias, long form) pairs from a text:
+        - parenthetical abbreviations: "thyroid transcription factor 1 (TTF1)"
+        - co-referring synonyms in the same parenthesis: "thyroid transcription factor 1 (NKX2-1/TTF1)",
+          where NKX2-1 is linked to the long form because TTF1 is a valid abbreviation of it
+        - "also known as" / "also called" patterns
+
+    Args:
+        text (str): A passage or a triplet element.
+
+    Returns:
+        List[Tuple[str, str]]: The pairs, not normalised.
+    """
+    pairs = []
+    for match in PARENTHESIS_PATTERN.finditer(text):
+        preceding = text[: match.start()]
+        boundaries = list(SENTENCE_BOUNDARY_PATTERN.finditer(preceding))
+        if boundaries:
+            preceding = preceding[boundaries[-1].end() :]
+        # the long form never spans another parenthesis
+        preceding = preceding[max(preceding.rfind(")"), preceding.rfind("(")) + 1 :]
+        synonyms = [s.strip() for s in re.split(r"[/;,]", match.group(1))]
+        short_forms = [s for s in synonyms if is_short_form(s)]
+        if len(short_forms) == 0:
+            continue
+        words = preceding.split()
+        long_form = None
+        for short_form in short_forms:
+            window = min(len(short_form) + 5, len(short_form) * 2)
+            candidate = " ".join(words[-window:])
+            long_form = find_initials_long_form(
+                short_form, candidate
+            ) or find_best_long_form(short_form, candidate)
+            if long_form is not None:
+                break
+        if long_form is None:
+            continue
+        pairs.extend((short_form, long_form) for short_form in short_forms)
+
+    for match in ALSO_KNOWN_AS_PATTERN.finditer(text):
+        entity = match.group(1).split(",")[-1].strip()
+        synonym = match.group(2).strip()
+        if entity and synonym:
+            pairs.append((synonym, entity))
+    return pairs
+
+
+def mine_alias_table(
+    corpus_dataset: Dict[int, str],
+    corpus_triplets: Dict[int, list],
+    min_long_form_share: float = 0.5,
+) -> dict:
+    """
+    Mine an alias table offline from the corpus passages and the corpus triplets.
+
+    Every (alias, long form) pair found in a passage or in a triplet element is counted. An alias whose most frequent
+    long form has less than `min_long_form_share` of its occurrences is considered ambiguous and is dropped.
+    Aliases are then merged into groups (union-find) and each group is represented by its most frequent long form.
+
+    Args:
+        corpus_dataset (dict): passage_id -> passage text.
+        corpus_triplets (dict): passage_id -> list of triplets.
+        min_long_form_share (float): The minimum share of the best long form of an alias. Defaults to 0.5.
+
+    Returns:
+        dict: {"aliases": {alias: canonical}, "groups": {canonical: [aliases]}}, all normalised.
+    """
+    alias_long_forms = defaultdict(Counter)
+    long_form_counts = Counter()
+
+    def texts() -> Iterable[str]:
+        yield from corpus_dataset.values()
+        for triplets in corpus_triplets.values():
+            for triplet in triplets:
+                for element in triplet:
+                    if "(" in str(element) or "known as" in str(element):
+                        yield str(element)
+
+    for text in texts():
+        for alias, long_form in extract_alias_pairs(text):
+            alias, long_form = normalise_alias(alias), normalise_alias(long_form)
+            if alias and long_form and alias != long_form:
+                alias_long_forms[alias][long_form] += 1
+                long_form_counts[long_form] += 1
+
+    parents = {}
+
+    def find(node):
+        parents.setdefault(node, node)
+        while parents[node] != node:
+            parents[node] = parents[parents[node]]
+            node = parents[node]
+        return node
+
+    for alias, long_forms in alias_long_forms.items():
+        long_form, count = long_forms.most_common(1)[0]
+        if count / sum(long_forms.values()) < min_long_form_share:
+            continue
+        parents[find(alias)] = find(long_form)
+
+    members = defaultdict(list)
+    for node in list(parents):
+        members[find(node)].append(node)
+
+    aliases, groups = {}, {}
+    for group in members.values():
+        canonical = max(group, key=lambda node: (long_form_counts[node], len(node)))
+        groups[canonical] = sorted(node for node in group if node != canonical)
+        for node in groups[canonical]:
+            aliases[node] = canonical
+    return {"aliases": aliases, "groups": groups}
+
+
+class EntityCanonicaliser:
+    """
+    EntityCanonicaliser rewrites every alias of an alias table into its canonical form.
+
+    The aliases are stored in a token trie, and the text is scanned once, left to right, always taking the longest alias
+    starting at the current token, so the cost is linear in the length of the text (times the depth of the trie) and
+    independent of the number of aliases.
+
+    Methods:
+        canonicalise(text: str) -> str:
+            Returns the lower cased text with all the aliases replaced by their canonical forms.
+        canonicalise_triplet(triplet: list) -> list:
+            Canonicalises the subject and the object of a triplet.
+        canonicalise_triplets(triplets: list) -> list:
+            Canonicalises a list of triplets.
+    """
+
+    def __init__(self, aliases: Dict[str, str]):
+        self.aliases = aliases
+        self.trie = {}
+        for alias, canonical in aliases.items():
+            tokens = ENTITY_TOKEN_PATTERN.findall(alias)
+            if len(tokens) == 0:
+                continue
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[TRIE_END] = canonical
+
+    @classmethod
+    def from_file(cls, path: str) -> "EntityCanonicaliser":
+        with open(path, "r") as f:
+            return cls(json.load(f)["aliases"])
+
+    def canonicalise(self, text: str) -> str:
+        """
+        Replace the aliases of a text by their canonical forms.
+
+        Args:
+            text (str): The text to canonicalise, e.g. "TTF1 mutations".
+
+        Returns:
+            str: The lower cased, canonicalised text, e.g. "thyroid transcription factor 1 mutations".
+        """
+        text = " ".join(str(text).lower().split())
+        tokens = [
+            (match.group(), match.start(), match.end())
+            for match in ENTITY_TOKEN_PATTERN.finditer(text)
+        ]
+        pieces = []
+        last_end = 0
+        idx = 0
+        while idx < len(tokens):
+            node = self.trie
+            match = None
+            for end_idx in range(idx, len(tokens)):
+                node = node.get(tokens[end_idx][0])
+                if node is None:
+                    break
+                if TRIE_END in node:
+                    match = (end_idx, node[TRIE_END])
+            if match is None:
+                idx += 1
+                continue
+            end_idx, canonical = match
+            pieces.append(text[last_end : tokens[idx][1]])
+            pieces.append(canonical)
+            last_end = tokens[end_idx][2]
+            idx = end_idx + 1
+        pieces.append(text[last_end:])
+        return "".join(pieces)
+
+    def canonicalise_triplet(self, triplet: list) -> list:
+        if len(triplet) != 3:
+            return triplet
+        return [
+            self.canonicalise(triplet[0]),
+            triplet[1],
+            self.canonicalise(triplet[2]),
+        ]
+
+    def canonicalise_triplets(self, triplets: list) -> list:
+        return [self.canonicalise_triplet(triplet) for triplet in triplets]
+
+
+_canonicalisers = {}
+_canonicalisers_lock = threading.Lock()
+
+
+def get_alias_table_path(config) -> str:
+    return f"{config.path.data.base}{config.path.data.alias_table}_{config.experiment_setup.dataset}.json"
+
+
+def get_entity_canonicaliser(config, logger=None) -> Optional[EntityCanonicaliser]:
+    """
+    Get the process-wide canonicaliser of the configured alias table.
+
+    Returns:
+        Optional[EntityCanonicaliser]: None if config.experiment_setup.entity_normalisation is off.
+                                       A canonicaliser without aliases if the table has not been built yet.
+    """
+    if not config.experiment_setup.entity_normalisation:
+        return None
+    path = get_alias_table_path(config)
+    with _canonicalisers_lock:
+        if path not in _canonicalisers:
+            if os.path.exists(path):
+                _canonicalisers[path] = EntityCanonicaliser.from_file(path)
+            else:
+                if logger is not None:
+                    logger.warning(
+                        f"==> Alias table {path} does not exist, run build_alias_table.py first. Entities are not normalised"
+                    )
+                _canonicalisers[path] = EntityCanonicaliser({})
+        return _canonicalisers[path]
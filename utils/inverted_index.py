@@ -0,0 +1,264 @@
+import json
+import os
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# version of the on-disk layout, an index of another version is rebuilt
+INDEX_FORMAT = 2
+
+
+class ShardedInvertedIndex:
+    """
+    An on-disk inverted index (token -> postings), sharded by a stable hash of the token.
+
+    Each shard is stored as three files, so that only the shards touched by a query are ever read:
+        - shard_{k}.vocab.json : token -> [start, length] in the postings arrays of the shard
+        - shard_{k}.doc_ids.npy: int32 document ids of all the postings of the shard
+        - shard_{k}.tfs.npy    : float32 term frequencies of all the postings of the shard
+    The postings arrays are memory-mapped, and at most `max_cached_shards` shards are kept open (LRU).
+    Document lengths are stored in doc_lengths.npy (indexed by document id) and global stats in meta.json.
+
+    The postings of a token are sorted by document length, then by document id: the first n postings of a token are
+    its n shortest (most specific) documents, so a truncated postings list is a deterministic top n that does not
+    depend on the order the documents were indexed in (except between documents of the same length).
+
+    Building is done shard by shard from temporary files, so memory usage is bounded by the size of
+    the largest shard instead of the size of the whole index.
+
+    Methods:
+        exists() -> bool:
+            Whether the index has already been built at `index_path` (in the current INDEX_FORMAT).
+        build(documents: Iterable[Tuple[int, List[str]]]) -> None:
+            Builds the index from (document id, tokens) pairs. Document ids must be 0..N-1.
+        postings(token: str) -> Tuple[np.ndarray, np.ndarray]:
+            Returns the document ids and term frequencies of a token.
+        document_frequency(token: str) -> int:
+            Returns the number of documents containing the token.
+    """
+
+    def __init__(
+        self, index_path: str, num_shards: int = 64, max_cached_shards: int = 16
+    ):
+        self.index_path = index_path
+        self.num_shards = num_shards
+        self.max_cached_shards = max_cached_shards
+        self._shards = OrderedDict()
+        self._shards_lock = threading.Lock()
+        self._meta = None
+        self._doc_lengths = None
+
+    @property
+    def meta_path(self) -> str:
+        return f"{self.index_path}/meta.json"
+
+    def exists(self) -> bool:
+        if not os.path.exists(self.meta_path):
+            return False
+        return self.meta.get("format") == INDEX_FORMAT
+
+    @property
+    def meta(self) -> dict:
+        if self._meta is None:
+            with open(self.meta_path, "r") as f:
+                self._meta = json.load(f)
+            self.num_shards = self._meta["num_shards"]
+        return self._meta
+
+    @property
+    def num_documents(self) -> int:
+        return self.meta["num_documents"]
+
+    @property
+    def avg_doc_length(self) -> float:
+        return self.meta["avg_doc_length"]
+
+    @property
+    def doc_lengths(self) -> np.ndarray:
+        if self._doc_lengths is None:
+            self._doc_lengths = np.load(
+                f"{self.index_path}/doc_lengths.npy", mmap_mode="r"
+            )
+        return self._doc_lengths
+
+    def shard_id(self, token: str) -> int:
+        """
+        Stable (process independent) shard id of a token.
+        """
+        return zlib.crc32(token.encode("utf-8")) % self.num_shards
+
+    def build(self, documents: Iterable[Tuple[int, List[str]]]) -> None:
+        """
+        Build the index from (document id, tokens) pairs.
+
+        Args:
+            documents (Iterable[Tuple[int, List[str]]]): The documents to index. Ids must be contiguous from 0.
+        """
+        os.makedirs(self.index_path, exist_ok=True)
+        tmp_files = [
+            open(f"{self.index_path}/shard_{k}.tmp", "w", encoding="utf-8")
+            for k in range(self.num_shards)
+        ]
+        doc_lengths = []
+        try:
+            for doc_id, tokens in documents:
+                if doc_id != len(doc_lengths):
+                    raise ValueError(
+                        f"Document ids should be contiguous, got {doc_id} after {len(doc_lengths) - 1}"
+                    )
+                doc_lengths.append(len(tokens))
+                for token, tf in Counter(tokens).items():
+                    tmp_files[self.shard_id(token)].write(f"{token}\t{doc_id}\t{tf}\n")
+        finally:
+            for tmp_file in tmp_files:
+                tmp_file.close()
+
+        for k in range(self.num_shards):
+            self.build_shard(k, doc_lengths)
+
+        np.save(
+            f"{self.index_path}/doc_lengths.npy", np.array(doc_lengths, dtype=np.int32)
+        )
+        meta = {
+            "format": INDEX_FORMAT,
+            "num_shards": self.num_shards,
+            "num_documents": len(doc_lengths),
+            "avg_doc_length": (
+                float(sum(doc_lengths)) / len(doc_lengths) if doc_lengths else 0.0
+            ),
+        }
+        # meta.json is written last, its existence marks a complete index
+        with open(self.meta_path, "w") as f:
+            json.dump(meta, f)
+        self._meta = meta
+        self._shards.clear()
+        self._doc_lengths = None
+
+    def build_shard(self, shard_id: int, doc_lengths: List[int]) -> None:
+        """
+        Turn the temporary posting file of a shard into its vocab/postings files, the postings of every token sorted
+        by document length, then document id.
+        """
+        tmp_path = f"{self.index_path}/shard_{shard_id}.tmp"
+        postings = {}
+        with open(tmp_path, "r", encoding="utf-8") as f:
+            for line in f:
+                token, doc_id, tf = line.rstrip("\n").split("\t")
+                postings.setdefault(token, []).append((int(doc_id), float(tf)))
+
+        vocab, doc_ids, tfs = {}, [], []
+        for token, token_postings in postings.items():
+            token_postings.sort(
+                key=lambda posting: (doc_lengths[posting[0]], posting[0])
+            )
+            vocab[token] = [len(doc_ids), len(token_postings)]
+            doc_ids.extend(doc_id for doc_id, _ in token_postings)
+            tfs.extend(tf for _, tf in token_postings)
+
+        with open(f"{self.index_path}/shard_{shard_id}.vocab.json", "w") as f:
+            json.dump(vocab, f)
+        np.save(
+            f"{self.index_path}/shard_{shard_id}.doc_ids.npy",
+            np.array(doc_ids, dtype=np.int32),
+        )
+        np.save(
+            f"{self.index_path}/shard_{shard_id}.tfs.npy",
+            np.array(tfs, dtype=np.float32),
+        )
+        os.remove(tmp_path)
+
+    def get_shard(self, shard_id: int) -> tuple:
+        """
+        Load (or get from the LRU cache) the vocab and memory-mapped postings of a shard.
+        """
+        with self._shards_lock:
+            if shard_id in self._shards:
+                self._shards.move_to_end(shard_id)
+                return self._shards[shard_id]
+
+            with open(f"{self.index_path}/shard_{shard_id}.vocab.json", "r") as f:
+                vocab = json.load(f)
+            shard = (
+                vocab,
+                np.load(
+                    f"{self.index_path}/shard_{shard_id}.doc_ids.npy", mmap_mode="r"
+                ),
+                np.load(f"{self.index_path}/shard_{shard_id}.tfs.npy", mmap_mode="r"),
+            )
+            self._shards[shard_id] = shard
+            if len(self._shards) > self.max_cached_shards:
+                self._shards.popitem(last=False)
+            return shard
+
+    def postings(self, token: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the postings of a token.
+
+        Args:
+            token (str): The token to look up.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The document ids and the term frequencies. Both are empty if the token is unknown.
+        """
+        self.meta  # the number of shards of an existing index comes from its meta.json
+        vocab, doc_ids, tfs = self.get_shard(self.shard_id(token))
+        if token not in vocab:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, length = vocab[token]
+        return doc_ids[start : start + length], tfs[start : start + length]
+
+    def document_frequency(self, token: str) -> int:
+        return len(self.postings(token)[0])
+
+
+def top_k_scores(
+    doc_ids: np.ndarray,
+    weights: np.ndarray,
+    top_k: int,
+    num_documents: Optional[int] = None,
+) -> List[Tuple[int, float]]:
+    """
+    Sum the weights per document id and return the top_k documents.
+
+    Args:
+        doc_ids (np.ndarray): Document ids of the matched postings (with repetitions).
+        weights (np.ndarray): The score contribution of each posting.
+        top_k (int): The number of documents to return.
+        num_documents (int, optional): If given, the scores are accumulated in a dense array of this size
+                                       instead of sorting the matched ids, which is faster for small collections.
+
+    Returns:
+        List[Tuple[int, float]]: (document id, score) pairs sorted by descending score.
+    """
+    if len(doc_ids) == 0:
+        return []
+    if num_documents is not None:
+        scores = np.bincount(doc_ids, weights=weights, minlength=num_documents)
+        unique_ids = np.flatnonzero(scores)
+        scores = scores[unique_ids]
+    else:
+        unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+    if len(scores) > top_k:
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        best = np.arange(len(scores))
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [(int(unique_ids[idx]), float(scores[idx])) for idx in best]
+
+
+def merge_postings(
+    postings: List[Tuple[np.ndarray, np.ndarray]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate (doc_ids, weights) postings of several tokens.
+    """
+    if len(postings) == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+    return (
+        np.concatenate([doc_ids for doc_ids, _ in postings]),
+        np.concatenate([weights for _, weights in postings]),
+    )
@@ -0,0 +1,255 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+"""
+An optional embedded HTTP endpoint exposing the live metrics of a run in the Prometheus text format
+(GET /metrics, config.experiment_setup.metrics_endpoint), so that dashboards can scrape long experiments.
+
+The components update the metrics through `live_metrics()`, which is a no-op registry while the endpoint is not started.
+Values that are already counted elsewhere (cache hits, rate limiter state) are read at scrape time by collectors.
+"""
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# name -> (type, help)
+METRIC_DEFINITIONS = {
+    "fact_checking_samples_total": (
+        "counter",
+        "Samples evaluated, by experiment and kind (original or hlcntn).",
+    ),
+    "fact_checking_samples_skipped_total": (
+        "counter",
+        "Samples skipped after all their retries failed, by experiment and kind.",
+    ),
+    "fact_checking_retries_total": (
+        "counter",
+        "Sample retries, by experiment, kind and reason.",
+    ),
+    "fact_checking_precision": (
+        "gauge",
+        "Current precision, by experiment and kind.",
+    ),
+    "fact_checking_specificity": (
+        "gauge",
+        "Current specificity of the hallucination experiment, by experiment.",
+    ),
+    "llm_request_duration_seconds": (
+        "histogram",
+        "Latency of the LLM calls (replayed ones included), by component.",
+    ),
+    "llm_requests_total": (
+        "counter",
+        "LLM calls, by component and status (ok or error).",
+    ),
+    "llm_requests_in_flight": ("gauge", "LLM calls in flight, by component."),
+    "llm_tokens_total": ("counter", "LLM tokens, by component and type."),
+    "llm_cost_usd_total": ("counter", "LLM cost in USD, by component."),
+    "cache_lookups_total": (
+        "counter",
+        "Cache lookups, by cache and result (hit or miss).",
+    ),
+    "rate_limiter_concurrency": (
+        "gauge",
+        "Concurrency limit of the adaptive rate limiter.",
+    ),
+    "fact_check_service_request_duration_seconds": (
+        "histogram",
+        "Latency of the requests of the fact checking service.",
+    ),
+    "fact_check_service_requests_total": (
+        "counter",
+        "Requests of the fact checking service, by HTTP status.",
+    ),
+    "rate_limiter_rate_limited_total": (
+        "counter",
+        "Requests rate limited (429) by the API.",
+    ),
+}
+
+# process-wide registry, None while the endpoint is not started
+_registry = None
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        (
+            key,
+            value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for key, value in labels
+    ]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread safe counters, gauges and histograms (see METRIC_DEFINITIONS), with labels.
+
+    Methods:
+        inc(name: str, value: float = 1.0, **labels) -> None:
+            Increments a counter or a gauge.
+        set(name: str, value: float, **labels) -> None:
+            Sets a gauge.
+        observe(name: str, value: float, **labels) -> None:
+            Adds an observation to a histogram.
+        add_collector(key: str, collector: Callable) -> None:
+            Registers (or replaces) a function called at scrape time, returning (name, labels, value) triples.
+        render() -> str:
+            The metrics in the Prometheus text format.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.values: Dict[str, Dict[tuple, float]] = {}
+        self.histograms: Dict[str, Dict[tuple, dict]] = {}
+        self.collectors: Dict[str, Callable[[], List[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        key = label_key(labels)
+        with self._lock:
+            values = self.values.setdefault(name, {})
+            values[key] = values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self.values.setdefault(name, {})[label_key(labels)] = float(value)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = label_key(labels)
+        with self._lock:
+            histogram = self.histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = {
+                    "buckets": [0] * len(self.buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][idx] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def add_collector(self, key: str, collector: Callable[[], List[tuple]]) -> None:
+        with self._lock:
+            self.collectors[key] = collector
+
+    def render(self) -> str:
+        with self._lock:
+            values = {name: dict(samples) for name, samples in self.values.items()}
+            histograms = {
+                name: {
+                    key: {**histogram, "buckets": list(histogram["buckets"])}
+                    for key, histogram in samples.items()
+                }
+                for name, samples in self.histograms.items()
+            }
+            collectors = list(self.collectors.values())
+        for collector in collectors:
+            for name, labels, value in collector():
+                values.setdefault(name, {})[label_key(labels)] = float(value)
+
+        lines = []
+        for name, (metric_type, help_text) in METRIC_DEFINITIONS.items():
+            if name not in values and name not in histograms:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for key, value in sorted(values.get(name, {}).items()):
+                lines.append(f"{name}{format_labels(key)} {value}")
+            for key, histogram in sorted(histograms.get(name, {}).items()):
+                for bound, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(
+                        f"{name}_bucket{format_labels(key + (('le', str(bound)),))} {count}"
+                    )
+                lines.append(
+                    f"{name}_bucket{format_labels(key + (('le', '+Inf'),))} {histogram['count']}"
+                )
+                lines.append(f"{name}_sum{format_labels(key)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class NullMetrics:
+    """
+    The registry while the endpoint is not started: does nothing.
+    """
+
+    def inc(self, name: str, value: float = 1.0, **labels) -> None:
+        pass
+
+    def set(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def add_collector(self, key: str, collector: Callable[[], List[tuple]]) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path.split("?")[0].rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        data = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def live_metrics():
+    """
+    The process-wide metrics registry, or the no-op registry if the endpoint is not started.
+    """
+    return _registry or NULL_METRICS
+
+
+def start_metrics_endpoint(config) -> Optional[str]:
+    """
+    Start (once per process and address) the metrics endpoint of config.experiment_setup.metrics_endpoint in a
+    background thread.
+
+    Returns:
+        str: The url of the endpoint, or None if it is disabled.
+    """
+    global _registry
+    endpoint_config = config.experiment_setup.get("metrics_endpoint", {})
+    if not endpoint_config.get("enabled"):
+        return None
+    address = (endpoint_config.get("host", "127.0.0.1"), endpoint_config.get("port", 0))
+    with _servers_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        if address not in _servers:
+
+            class Handler(MetricsRequestHandler):
+                registry = _registry
+
+            server = ThreadingHTTPServer(address, Handler)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _servers[address] = server
+        host, port = _servers[address].server_address[:2]
+        return f"http://{host}:{port}/metrics"
@@ -0,0 +1,331 @@
+import collections
+import contextvars
+import cProfile
+import os
+import pstats
+import sys
+import threading
+from typing import Callable, Dict, List, Optional
+
+"""
+Per-sample profiling of a run (--profile, config.experiment_setup.profiling), to find the CPU overhead outside of the
+LLM calls: prompt template rendering, parsing, logging, ...
+
+The selected samples are profiled in every thread working for them: the thread running the sample and the threads of
+the tasks it submits through `utils.tracing.in_context` (dataflow nodes, batched LLM calls, pipeline stages). Two modes:
+    - "sampling": a background thread samples the stacks of these threads every interval_seconds. The stacks are
+      written as collapsed stacks ("frame;frame;frame count" lines), the input of flamegraph.pl, speedscope or
+      inferno.
+    - "deterministic": cProfile, written as pstats files (python -m pstats, snakeviz, gprof2dot, flameprof).
+
+The profiles are saved to results/{experiment_name}/profiles/{sample}.collapsed (or .prof), and aggregated over the
+samples to results/{experiment_name}/profile.collapsed (or profile.prof). When profiling is disabled, the samples are
+not wrapped and the tasks submitted to thread pools are not either.
+"""
+
+PROFILE_MODES = ("sampling", "deterministic")
+PROFILE_EXTENSIONS = {"sampling": "collapsed", "deterministic": "prof"}
+
+# innermost python frames (file name, function) of threads waiting for another thread, a lock or the network,
+# dropped from the sampled stacks unless profiling.idle is set
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("_base.py", "wait"),
+    ("_base.py", "result"),
+    ("queue.py", "get"),
+    ("queue.py", "put"),
+    ("selectors.py", "select"),
+    ("socket.py", "readinto"),
+    ("ssl.py", "read"),
+    ("ssl.py", "recv_into"),
+    ("sync.py", "read"),
+}
+
+_current_profile = contextvars.ContextVar("current_profile", default=None)
+
+# process-wide profilers by profile directory, so that all the samples of a run are aggregated together
+_profilers = {}
+_profilers_lock = threading.Lock()
+
+
+def parse_profile_samples(spec) -> Callable[[int], bool]:
+    """
+    The selection of the samples to profile, from --profile:
+        - "all": every sample.
+        - "every:N": every Nth sample (the question indices multiple of N).
+        - "i,j,k": the samples with these question indices.
+
+    Returns:
+        Callable[[int], bool]: Whether the sample of a question index is profiled.
+    """
+    spec = str(spec).strip()
+    if spec == "all":
+        return lambda idx: True
+    if spec.startswith("every:"):
+        every = int(spec[len("every:") :])
+        if every < 1:
+            raise ValueError(f"Invalid profile selection {spec!r}, N must be >= 1")
+        return lambda idx: idx % every == 0
+    try:
+        indices = {int(idx) for idx in spec.split(",") if idx.strip()}
+    except ValueError:
+        raise ValueError(
+            f"Invalid profile selection {spec!r}, expected 'all', 'every:N' or comma separated question indices"
+        )
+    return lambda idx: idx in indices
+
+
+def frame_label(code) -> str:
+    filename = code.co_filename
+    if "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    elif filename.startswith(os.getcwd() + os.sep):
+        filename = os.path.relpath(filename)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+class SampleProfile:
+    """
+    The profile of a sample: its collapsed stacks (sampling mode) or its cProfile profilers (deterministic mode).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.stacks = collections.Counter()
+        self.cprofiles: List[cProfile.Profile] = []
+
+
+class SampleProfiler:
+    """
+    Profiles the selected samples of a run (see the module docstring).
+
+    Args:
+        directory (str): The experiment directory: the per-sample profiles are written to its profiles/ directory
+                         and the aggregated profile to it.
+        samples (str): The selection of the samples (see `parse_profile_samples`).
+        mode (str): "sampling" or "deterministic".
+        interval_seconds (float): The sampling interval.
+        idle (bool): Whether the sampled stacks of waiting threads are kept.
+
+    Methods:
+        selected(idx: int) -> bool:
+            Whether the sample of a question index is profiled.
+        enter(profile: SampleProfile) -> None:
+            Starts profiling the current thread for a sample.
+        exit(profile: SampleProfile) -> None:
+            Stops profiling the current thread for a sample.
+        save() -> str:
+            Stops the sampling thread, writes the per-sample and the aggregated profiles, returns the path of the
+            aggregated profile.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        samples: str,
+        mode: str = "sampling",
+        interval_seconds: float = 0.005,
+        idle: bool = False,
+    ):
+        if mode not in PROFILE_MODES:
+            raise ValueError(
+                f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}"
+            )
+        self.directory = directory
+        self.selected = parse_profile_samples(samples)
+        self.mode = mode
+        self.interval_seconds = interval_seconds
+        self.idle = idle
+        self.profiles: Dict[str, SampleProfile] = {}
+        # thread id -> the profiles the thread is working for, innermost last
+        self.threads: Dict[int, List[SampleProfile]] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def profile(self, name: str) -> SampleProfile:
+        with self._lock:
+            if name not in self.profiles:
+                self.profiles[name] = SampleProfile(name)
+            return self.profiles[name]
+
+    def enter(self, profile: SampleProfile) -> None:
+        thread_id = threading.get_ident()
+        with self._lock:
+            self.threads.setdefault(thread_id, []).append(profile)
+            if self.mode == "sampling" and self._sampler is None:
+                self._sampler = threading.Thread(
+                    target=self.sample_stacks, name="profiler", daemon=True
+                )
+                self._sampler.start()
+        if self.mode == "deterministic":
+            # cProfile profiles the thread that enables it, once at a time: only the outermost scope of a thread
+            # profiles it, for its sample
+            depth = getattr(self._local, "depth", 0)
+            if depth == 0:
+                self._local.cprofile = cProfile.Profile()
+                self._local.cprofile.enable()
+            self._local.depth = depth + 1
+
+    def exit(self, profile: SampleProfile) -> None:
+        if self.mode == "deterministic":
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                self._local.cprofile.disable()
+                with self._lock:
+                    profile.cprofiles.append(self._local.cprofile)
+                self._local.cprofile = None
+        thread_id = threading.get_ident()
+        with self._lock:
+            profiles = self.threads[thread_id]
+            profiles.remove(profile)
+            if not profiles:
+                del self.threads[thread_id]
+
+    def sample_stacks(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = [
+                    (thread_id, profiles[-1])
+                    for thread_id, profiles in self.threads.items()
+                ]
+            for thread_id, profile in threads:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                code = frame.f_code
+                if (
+                    not self.idle
+                    and (os.path.basename(code.co_filename), code.co_name)
+                    in IDLE_FRAMES
+                ):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                with self._lock:
+                    profile.stacks[";".join(reversed(stack))] += 1
+
+    def save(self) -> str:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self._stop.clear()
+        profiles_directory = f"{self.directory}profiles/"
+        os.makedirs(profiles_directory, exist_ok=True)
+        extension = PROFILE_EXTENSIONS[self.mode]
+        aggregated_path = f"{self.directory}profile.{extension}"
+        with self._lock:
+            profiles = list(self.profiles.values())
+        if self.mode == "sampling":
+            total = collections.Counter()
+            for profile in profiles:
+                write_collapsed(
+                    f"{profiles_directory}{profile.name}.{extension}", profile.stacks
+                )
+                total.update(profile.stacks)
+            write_collapsed(aggregated_path, total)
+        else:
+            cprofiles = []
+            for profile in profiles:
+                if profile.cprofiles:
+                    pstats.Stats(*profile.cprofiles).dump_stats(
+                        f"{profiles_directory}{profile.name}.{extension}"
+                    )
+                    cprofiles.extend(profile.cprofiles)
+            if cprofiles:
+                pstats.Stats(*cprofiles).dump_stats(aggregated_path)
+        return aggregated_path
+
+
+def write_collapsed(path: str, stacks: collections.Counter) -> None:
+    with open(path, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+class ProfileScope:
+    def __init__(self, profiler: SampleProfiler, profile: SampleProfile):
+        self.profiler = profiler
+        self.profile = profile
+        self._token = None
+
+    def __enter__(self) -> SampleProfile:
+        self._token = _current_profile.set(self)
+        self.profiler.enter(self.profile)
+        return self.profile
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.profiler.exit(self.profile)
+        _current_profile.reset(self._token)
+        return False
+
+
+class NullProfileScope:
+    """
+    The scope of a sample that is not profiled: does nothing.
+    """
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+
+NULL_PROFILE_SCOPE = NullProfileScope()
+
+
+def profile_sample(profiler: Optional[SampleProfiler], idx: int, name: str):
+    """
+    Profile the current context (until the returned context manager exits) as the sample `name`, if profiling is
+    enabled and the question index `idx` is selected. The profile of a sample accumulates over its scopes, e.g. its
+    pipeline stages and retries.
+    """
+    if profiler is None or not profiler.selected(idx):
+        return NULL_PROFILE_SCOPE
+    return ProfileScope(profiler, profiler.profile(name))
+
+
+def profiled(fn: Callable, context: contextvars.Context) -> Callable:
+    """
+    `fn` profiled for the sample profiled in `context`, if any: used by `utils.tracing.in_context`, so that the tasks
+    a profiled sample submits to other threads are profiled for it too.
+    """
+    scope = context.get(_current_profile)
+    if scope is None:
+        return fn
+
+    def run(*args, **kwargs):
+        with ProfileScope(scope.profiler, scope.profile):
+            return fn(*args, **kwargs)
+
+    return run
+
+
+def get_profiler(config) -> Optional[SampleProfiler]:
+    """
+    Get the process-wide profiler of the run of a config (config.experiment_setup.profiling), writing to
+    results/{experiment_name}/, or None if profiling is disabled (no profiling.samples selection).
+    """
+    profiling_config = config.experiment_setup.get("profiling", {})
+    if profiling_config.get("samples") is None:
+        return None
+    directory = f"{config.path.experiment_result.base}{config.experiment_name}/"
+    with _profilers_lock:
+        if directory not in _profilers:
+            _profilers[directory] = SampleProfiler(
+                directory,
+                profiling_config.samples,
+                mode=profiling_config.get("mode", "sampling"),
+                interval_seconds=profiling_config.get("interval_seconds", 0.005),
+                idle=profiling_config.get("idle", False),
+            )
+        return _profilers[directory]
@@ -0,0 +1,162 @@
+from typing import Dict, List
+
+import numpy as np
+
+"""
+The metrics of the experiments, computed from the prediction records saved by ExperimentManager
+(results/{experiment_name}/predictions*.json). They are used both inline during a run and by rescore.py,
+so a metric change can be applied to saved predictions without any LLM call.
+"""
+
+
+def prediction_values(fact_check_prediction_binary: dict) -> Dict[int, bool]:
+    """
+    The fact checking predictions of a record by triplet index. Saved records have string keys (JSON),
+    records of a run have int keys.
+    """
+    return {int(idx): value for idx, value in fact_check_prediction_binary.items()}
+
+
+def record_precision(fact_check_prediction_binary: dict) -> float:
+    """
+    Share of the answer triplets of a record predicted as true (non boolean predictions count as false).
+    """
+    values = list(fact_check_prediction_binary.values())
+    return sum(value for value in values if type(value) == bool) / len(values)
+
+
+def precision_stats(prediction_result: List[dict]) -> dict:
+    """
+    Calculate precision statistics from prediction results.
+
+    Args:
+        prediction_result (list of dict): A list of dictionaries where each dictionary contains:
+            - "fact_check_prediction_binary" (dict): triplet index -> prediction.
+            - "hlcntn_triplet_index" (list, optional): Whether each answer triplet is hallucinated (hallucination experiments).
+            - "precision" (float): The precision score of each the fact check result.
+            - "reference_triplets" (list): A list of reference triplets.
+            - "generated_answer" (str): The generated answer. - this could be artificially generated hallucination anwer or just generated answer
+            - "reprompt_precision" (float, optional): The precision score after reprompting.
+
+    Returns:
+        dict: A dictionary containing:
+            - "precision" (float): precision score or the experiment. This is calculated by number_of_corect_predictions_for_non_hallucination / total_number_of_predictions_for_non_hallucination
+            - "avg_reprompt_score" (float or None): The average reprompt precision score, or None if not applicable.
+            - "std_reprompt_score" (float or None): The standard deviation of the reprompt precision scores, or None if not applicable.
+            - "avg_reprompt_improvement" (float or None): The average improvement in precision after reprompting, or None if not applicable.
+            - "std_reprompt_improvement" (float or None): The standard deviation of the improvement in precision after reprompting, or None if not applicable.
+            - "num_non_hlcntn_triplets" (int): The number of non hallucinated triplets in the experiment.
+            - "num_non_hlcntn_triplets_correctly_predicted" (int): The number of correct predictions for non-hallucination triplets.
+    """
+    model_predictions = []
+    for item in prediction_result:
+        predictions = prediction_values(item["fact_check_prediction_binary"])
+        # exclude hallucination triplets for hallucinated experiments
+        if "hlcntn_triplet_index" in item:
+            model_predictions.extend(
+                value
+                for idx, value in predictions.items()
+                if item["hlcntn_triplet_index"][idx] == False
+            )
+        else:
+            model_predictions.extend(predictions.values())
+
+    num_correct_predictions = int(sum(model_predictions))
+    precision = (
+        num_correct_predictions / len(model_predictions) if model_predictions else 0
+    )  # only for non-hallucination, 0 without records (e.g. an empty shard)
+
+    precisions = [
+        item["precision"]
+        for item in prediction_result
+        if all([len(i) == 3 for i in item["reference_triplets"]])
+        and item["generated_answer"] != ""
+    ]
+    reprompt_score = [
+        item["reprompt_precision"] if "reprompt_precision" in item else None
+        for item in prediction_result
+    ]
+    reprompt_score_without_none = [item for item in reprompt_score if item is not None]
+    if len(reprompt_score_without_none) > 1:
+        avg_reprompt_score = sum(reprompt_score_without_none) / len(
+            reprompt_score_without_none
+        )
+        std_reprompt_score = float(np.std(reprompt_score_without_none))
+        reprompt_improvement = [
+            reprompt_score[i] - precisions[i]
+            for i in range(len(precisions))
+            if reprompt_score[i] is not None
+        ]
+        avg_reprompt_improvement = sum(reprompt_improvement) / len(reprompt_improvement)
+        std_reprompt_improvement = float(np.std(reprompt_improvement))
+    else:
+        avg_reprompt_score = None
+        std_reprompt_score = None
+        avg_reprompt_improvement = None
+        std_reprompt_improvement = None
+    return {
+        "precision": precision,
+        "avg_reprompt_score": avg_reprompt_score,
+        "std_reprompt_score": std_reprompt_score,
+        "avg_reprompt_improvement": avg_reprompt_improvement,
+        "std_reprompt_improvement": std_reprompt_improvement,
+        "num_non_hlcntn_triplets": len(model_predictions),
+        "num_non_hlcntn_triplets_correctly_predicted": num_correct_predictions,
+    }
+
+
+def hlcntn_metrics(prediction_result: List[dict]) -> dict:
+    """
+    Calculate the hallucination metrics of the records of a hallucination experiment.
+
+    Args:
+        prediction_result (list): Records with:
+            - "fact_check_prediction_binary" (dict): triplet index -> prediction.
+            - "hlcntn_triplet_index" (list): Whether each answer triplet is hallucinated.
+
+    Returns:
+        dict: A dictionary containing the following metrics:
+            - "specificity" (float): The specificity score, tn/(fp+tn), a true negative being a hallucinated triplet predicted as false.
+            - "num_hlcntn_triplets" (int): The number of hallucination triplets.
+            - "num_hlcntn_triplets_correctly_predicted" (int): The number of hallucinated triplets predicted as false.
+    """
+    model_predictions = []
+    ground_truth = []
+    for item in prediction_result:
+        model_predictions.extend(
+            prediction_values(item["fact_check_prediction_binary"]).values()
+        )
+        ground_truth.extend(item["hlcntn_triplet_index"])
+
+    predicted_true = np.array(model_predictions, dtype=bool)
+    hallucinated = np.array(ground_truth, dtype=bool)
+    true_negatives = int(np.sum(hallucinated & ~predicted_true))
+    false_positives = int(np.sum(hallucinated & predicted_true))
+    return {
+        "specificity": (
+            true_negatives / (false_positives + true_negatives)
+            if (false_positives + true_negatives) > 0
+            else 0
+        ),
+        "num_hlcntn_triplets": int(hallucinated.sum()),
+        "num_hlcntn_triplets_correctly_predicted": true_negatives,
+    }
+
+
+def score_predictions(prediction_result: List[dict]) -> dict:
+    """
+    All the metrics of saved prediction records: the precision statistics, and the hallucination metrics
+    if the records come from a hallucination experiment.
+    """
+    for item in prediction_result:
+        item["precision"] = record_precision(item["fact_check_prediction_binary"])
+        if "reprompt_fact_check_prediction_binary" in item:
+            item["reprompt_precision"] = record_precision(
+                item["reprompt_fact_check_prediction_binary"]
+            )
+    metrics = precision_stats(prediction_result)
+    if prediction_result and all(
+        "hlcntn_triplet_index" in item for item in prediction_result
+    ):
+        metrics.update(hlcntn_metrics(prediction_result))
+    return metrics
@@ -0,0 +1,57 @@
+import re
+from typing import Iterable, List, Tuple
+
+"""
+Sharding of an experiment over several processes or machines (run_experiment.py --shard i/N).
+Shard i of N evaluates the question indices idx with idx % N == i, so the partition only depends on i and N,
+and every shard saves its results in results/{experiment_name}/shard_{i}_of_{N}/ (merged by merge_shards.py).
+"""
+
+SHARD_DIR_PATTERN = re.compile(r"^shard_(\d+)_of_(\d+)$")
+
+
+def parse_shard(shard: str) -> Tuple[int, int]:
+    """
+    Parse a shard specification "i/N" (0 <= i < N).
+
+    Args:
+        shard (str): The shard specification, e.g. "0/4".
+
+    Returns:
+        Tuple[int, int]: The shard index and the number of shards.
+    """
+    match = re.fullmatch(r"\s*(\d+)\s*/\s*(\d+)\s*", shard)
+    if match is None:
+        raise ValueError(f"Invalid shard {shard!r}, expected i/N, e.g. 0/4")
+    shard_index, num_shards = int(match.group(1)), int(match.group(2))
+    if not 0 <= shard_index < num_shards:
+        raise ValueError(
+            f"Invalid shard {shard!r}, the shard index must be in [0, {num_shards})"
+        )
+    return shard_index, num_shards
+
+
+def shard_dir_name(shard_index: int, num_shards: int) -> str:
+    return f"shard_{shard_index}_of_{num_shards}"
+
+
+def shard_indices(
+    indices: Iterable[int], shard_index: int, num_shards: int
+) -> List[int]:
+    """
+    The question indices of a shard.
+    """
+    return [idx for idx in indices if idx % num_shards == shard_index]
+
+
+def sample_indices(config, num_samples: int) -> List[int]:
+    """
+    The question indices evaluated by a run: the first num_samples ones, or only config.sample_idx if it is set,
+    restricted to the shard of config.shard if it is set.
+    """
+    indices = range(num_samples)
+    if hasattr(config, "sample_idx"):
+        indices = [idx for idx in indices if idx == config.sample_idx]
+    if hasattr(config, "shard"):
+        indices = shard_indices(indices, config.shard_index, config.num_shards)
+    return list(indices)
@@ -0,0 +1,66 @@
+import re
+from typing import List
+
+# a small english stopword list, biomedical terms are never removed
+STOPWORDS = set(
+    (
+        "a an and are as at be been by can could did do does for from had has "
+        "have in into is it its may might of on or that the their there these "
+        "this those to was were which while who will with would"
+    ).split()
+)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str, remove_stopwords: bool = True) -> List[str]:
+    """
+    Split a text into lower cased alphanumeric tokens.
+
+    Args:
+        text (str): The text to tokenize.
+        remove_stopwords (bool): Whether to drop the tokens in STOPWORDS. Defaults to True.
+
+    Returns:
+        List[str]: The list of tokens, in order of appearance.
+    """
+    tokens = TOKEN_PATTERN.findall(str(text).lower())
+    if remove_stopwords:
+        return [token for token in tokens if token not in STOPWORDS]
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough number of LLM tokens of a text (~4 characters per token for english), used for prompt budgets
+    where an exact tokenizer is not needed.
+    """
+    return (len(str(text)) + 3) // 4
+
+
+# a period after one of these words does not end a sentence
+ABBREVIATIONS = set("al e.g i.e vs fig figs ref refs approx ca dr no".split())
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split a text into sentences, on ".", "!" or "?" followed by a whitespace and an upper case letter or a digit.
+    Common abbreviations ("et al.", "e.g.", "Fig.") do not end a sentence.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The sentences, stripped, in order.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END_PATTERN.finditer(text):
+        last_word = text[start : match.start()].rsplit(None, 1)[-1].rstrip(".!?")
+        if last_word.lower() in ABBREVIATIONS:
+            continue
+        sentences.append(text[start : match.start()].strip())
+        start = match.end()
+    sentences.append(text[start:].strip())
+    return [sentence for sentence in sentences if sentence]
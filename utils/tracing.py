@@ -0,0 +1,356 @@
+import contextvars
+import itertools
+import json
+import os
+import secrets
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.profiling import profiled
+
+"""
+Hierarchical timing spans of a run: run -> sample -> stage -> component forward -> segment -> LLM call, with the retry
+attempts as span events, exported as a Chrome trace (chrome://tracing or https://ui.perfetto.dev, offline) or as
+OTLP JSON (config.experiment_setup.tracing).
+
+The tracer of a run is activated in a context (`activate_tracer`) and found by `span` through a context variable, so
+the components need no reference to it. Code submitting work to a thread pool wraps the work with `in_context` so
+that its spans keep their parent. When tracing is disabled, `span` returns a shared no-op span.
+"""
+
+TRACE_FORMATS = ("chrome", "otlp")
+TRACE_FILES = {"chrome": "trace.json", "otlp": "trace_otlp.json"}
+
+_current_tracer = contextvars.ContextVar("current_tracer", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# process-wide tracers by trace file path, so that all the components of a run write to the same trace
+_tracers = {}
+_tracers_lock = threading.Lock()
+
+
+class Span:
+    """
+    A timed operation. Used as a context manager: the span is the current span (the parent of the spans started in
+    its context) until it exits, then it is recorded by its tracer. An exception raising through it is recorded as
+    its error.
+
+    Methods:
+        set(**attributes) -> None:
+            Sets attributes of the span.
+        add_event(name: str, **attributes) -> None:
+            Adds a timestamped event (e.g. a retry attempt) to the span.
+    """
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        category: str,
+        attributes: Dict[str, Any],
+        parent: Optional["Span"],
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.parent_id = parent.span_id if parent is not None else None
+        self.span_id = next(tracer.span_ids)
+        self.events: List[dict] = []
+        self.error: Optional[str] = None
+        self.start_ns = self.end_ns = None
+        self.thread_id = None
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self.thread_id = threading.get_ident()
+        self.start_ns = self.tracer.now_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.end_ns = self.tracer.now_ns()
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc_value}"
+        self.tracer.record(self)
+        return False
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, **attributes) -> None:
+        self.events.append(
+            {"name": name, "time_ns": self.tracer.now_ns(), "attributes": attributes}
+        )
+
+
+class NullSpan:
+    """
+    The span of a disabled tracer: does nothing.
+    """
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        return False
+
+    def set(self, **attributes) -> None:
+        pass
+
+    def add_event(self, name: str, **attributes) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    """
+    Collects the finished spans of a run and exports them.
+
+    Args:
+        path (str): The trace file.
+        trace_format (str): "chrome" (Chrome trace event format) or "otlp" (OTLP JSON, as the OpenTelemetry
+                            collector file exporter writes it).
+        service_name (str): The service name of the OTLP resource.
+
+    Methods:
+        span(name: str, category: str, attributes: dict) -> Span:
+            A new span, child of the current span.
+        save() -> str:
+            Writes the trace file and returns its path.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        trace_format: str = "chrome",
+        service_name: str = "llm-fact-checking",
+    ):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(
+                f"Unknown trace format {trace_format!r}, expected one of {TRACE_FORMATS}"
+            )
+        self.path = path
+        self.trace_format = trace_format
+        self.service_name = service_name
+        self.trace_id = secrets.token_hex(16)
+        self.span_ids = itertools.count(1)
+        self.spans: List[Span] = []
+        self.thread_names: Dict[int, str] = {}
+        # wall clock timestamps with the resolution of the performance counter
+        self._wall_start_ns = time.time_ns()
+        self._perf_start_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def now_ns(self) -> int:
+        return self._wall_start_ns + time.perf_counter_ns() - self._perf_start_ns
+
+    def span(self, name: str, category: str, attributes: Dict[str, Any]) -> Span:
+        return Span(self, name, category, attributes, _current_span.get())
+
+    def record(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+            if span.thread_id not in self.thread_names:
+                self.thread_names[span.thread_id] = threading.current_thread().name
+
+    def save(self) -> str:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ns)
+            thread_names = dict(self.thread_names)
+        trace = (
+            self.chrome_trace(spans, thread_names)
+            if self.trace_format == "chrome"
+            else self.otlp_trace(spans)
+        )
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(trace, f, default=str)
+        return self.path
+
+    def chrome_trace(self, spans: List[Span], thread_names: Dict[int, str]) -> dict:
+        pid = os.getpid()
+        events = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": thread_id,
+                "args": {"name": thread_name},
+            }
+            for thread_id, thread_name in thread_names.items()
+        ]
+        for span in spans:
+            args = {**span.attributes, "span_id": span.span_id}
+            if span.parent_id is not None:
+                args["parent_id"] = span.parent_id
+            if span.error is not None:
+                args["error"] = span.error
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": span.start_ns / 1000,
+                    "dur": (span.end_ns - span.start_ns) / 1000,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": args,
+                }
+            )
+            for event in span.events:
+                events.append(
+                    {
+                        "name": event["name"],
+                        "cat": span.category,
+                        "ph": "i",
+                        "s": "t",
+                        "ts": event["time_ns"] / 1000,
+                        "pid": pid,
+                        "tid": span.thread_id,
+                        "args": {**event["attributes"], "span_id": span.span_id},
+                    }
+                )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def otlp_trace(self, spans: List[Span]) -> dict:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": otlp_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "utils.tracing"},
+                            "spans": [self.otlp_span(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def otlp_span(self, span: Span) -> dict:
+        otlp_span = {
+            "traceId": self.trace_id,
+            "spanId": f"{span.span_id:016x}",
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": otlp_attributes(
+                {**span.attributes, "category": span.category}
+            ),
+            "events": [
+                {
+                    "timeUnixNano": str(event["time_ns"]),
+                    "name": event["name"],
+                    "attributes": otlp_attributes(event["attributes"]),
+                }
+                for event in span.events
+            ],
+            "status": (
+                {"code": 2, "message": span.error}
+                if span.error is not None
+                else {"code": 1}
+            ),
+        }
+        if span.parent_id is not None:
+            otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+        return otlp_span
+
+
+def otlp_attributes(attributes: Dict[str, Any]) -> List[dict]:
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            value = {"boolValue": value}
+        elif isinstance(value, int):
+            value = {"intValue": str(value)}
+        elif isinstance(value, float):
+            value = {"doubleValue": value}
+        else:
+            value = {"stringValue": str(value)}
+        values.append({"key": key, "value": value})
+    return values
+
+
+def get_tracer(config) -> Optional[Tracer]:
+    """
+    Get the process-wide tracer of the run of a config (config.experiment_setup.tracing), writing to
+    results/{experiment_name}/trace.json (or trace_otlp.json), or None if tracing is disabled.
+    """
+    tracing_config = config.experiment_setup.get("tracing", {})
+    if not tracing_config.get("enabled"):
+        return None
+    trace_format = tracing_config.get("format", "chrome")
+    path = (
+        f"{config.path.experiment_result.base}{config.experiment_name}/"
+        f"{TRACE_FILES.get(trace_format, 'trace.json')}"
+    )
+    with _tracers_lock:
+        if path not in _tracers:
+            _tracers[path] = Tracer(path, trace_format)
+        return _tracers[path]
+
+
+def activate_tracer(tracer: Optional[Tracer]) -> "TracerActivation":
+    """
+    Make `tracer` the tracer of the spans started in the current context (until the returned context manager exits).
+    """
+    return TracerActivation(tracer)
+
+
+class TracerActivation:
+    def __init__(self, tracer: Optional[Tracer]):
+        self.tracer = tracer
+        self._token = None
+
+    def __enter__(self) -> Optional[Tracer]:
+        self._token = _current_tracer.set(self.tracer)
+        return self.tracer
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        _current_tracer.reset(self._token)
+        return False
+
+
+def span(name: str, category: str = "", **attributes):
+    """
+    A span child of the current span, in the active tracer, or the no-op span if no tracer is active.
+
+    Args:
+        name (str): The span name.
+        category (str): The level of the span, e.g. "sample", "stage", "component", "segment" or "llm".
+        **attributes: The span attributes.
+    """
+    tracer = _current_tracer.get()
+    if tracer is None:
+        return NULL_SPAN
+    return tracer.span(name, category, attributes)
+
+
+def current_span():
+    """
+    The current span, or the no-op span if there is none (e.g. to annotate it with `add_event`).
+    """
+    if _current_tracer.get() is None:
+        return NULL_SPAN
+    return _current_span.get() or NULL_SPAN
+
+
+def in_context(fn: Callable) -> Callable:
+    """
+    `fn` running in a copy of the current context, so that the context variables (the current span, the sample the
+    LLM usage is accounted to, the profiled sample) follow it when it runs in another thread. Copies once per call of in_context: wrap
+    every task submitted to a thread pool separately.
+    """
+    context = contextvars.copy_context()
+    fn = profiled(fn, context)
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
@@ -1,18 +1,11 @@
-from sklearn.metrics import (
-    accuracy_score,
-    precision_score,
-    recall_score,
-    f1_score,
-    roc_auc_score,
-    confusion_matrix,
-)
-
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import dotenv
 import os
 
-from git import Repo
-
 # Load environment variables from a .env file
 dotenv.load_dotenv()
 # Retrieve the local repository path from an environment variable
@@ -27,6 +20,8 @@ def get_current_commit_hash_and_message():
         str: The current commit hash
         str: The commit message
     """
+    from git import Repo
+
     # Initialize a Repo object pointing to the given repository path
     repo = Repo(repo_path)
     # Return a dictionary containing the latest commit's hash and message
@@ -44,6 +39,8 @@ def compute_false_omission_rate(y_true, y_pred):
     Returns:
     - float: False Omission Rate (FOR).
     """
+    from sklearn.metrics import confusion_matrix
+
     # Compute the confusion matrix: tn (true negatives), fp (false positives),
     # fn (false negatives), tp (true positives)
     tn, fp, fn, tp = confusion_matrix(y_true, y_pred).ravel()
@@ -62,6 +59,8 @@ def specificity_and_samples(y_true, y_pred):
     Returns:
     - float: hallucination recall that we aimed for.
     """
+    from sklearn.metrics import confusion_matrix
+
     # Compute the confusion matrix: tn (true negatives), fp (false positives),
     # fn (false negatives), tp (true positives)
     tn, fp, fn, tp = confusion_matrix(y_true, y_pred).ravel()
@@ -69,15 +68,84 @@ def specificity_and_samples(y_true, y_pred):
     return tn / (fp + tn) if (fp + tn) > 0 else 0, int(tn)
 
 
+def event_extra(event: str, progress: bool = False, **fields) -> dict:
+    """
+    The `extra` of a log record that is also a structured event, written to the events.jsonl of an ExperimentLogger.
+
+    Args:
+        event (str): The event name, e.g. "sample_done" or "retry".
+        progress (bool): Whether the record is a progress line, the only INFO records of a "progress" console.
+        **fields: The event fields, JSON serializable.
+
+    Returns:
+        dict: The `extra` argument of the logging call, ignored by the other loggers.
+    """
+    return {"event": {"event": event, **fields}, "progress": progress}
+
+
+class EventFileHandler(logging.FileHandler):
+    """
+    Writes the records that are events (see `event_extra`) as JSON lines: time, level, thread, message and the event
+    fields.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self.addFilter(lambda record: hasattr(record, "event"))
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(
+            {
+                "time": record.created,
+                "level": record.levelname,
+                "thread": record.threadName,
+                "message": record.getMessage(),
+                **record.event,
+            },
+            default=str,
+        )
+
+
 class ExperimentLogger(logging.Logger):
-    def __init__(self, name, log_path: str, logger_level="INFO"):
+    """
+    The logger of an experiment: writes to {log_path}log.txt, to the console and, for the records that are events
+    (see `event_extra`), to {log_path}events.jsonl.
+
+    The records are put on a queue (QueueHandler) and written by a background thread (QueueListener), so that the
+    callers, possibly concurrent workers, do not wait for the file and console I/O. The records below logger_level
+    are dropped before their message is formatted: log the large values with %-style arguments, or behind
+    isEnabledFor, so that they are only formatted when they are written.
+
+    Args:
+        name (str): Unused, the logger is not registered in the logging module.
+        log_path (str): The directory of the log files.
+        logger_level (str): The level of log.txt ("DEBUG", "INFO", ...).
+        console (str): "full" (the INFO records) or "progress" (the progress records and the warnings).
+        event_log (bool): Whether the events are written to events.jsonl.
+
+    Methods:
+        close() -> None:
+            Writes the queued records and stops the background thread, also called at exit.
+    """
+
+    def __init__(
+        self,
+        name,
+        log_path: str,
+        logger_level="INFO",
+        console: str = "full",
+        event_log: bool = True,
+    ):
         super().__init__("")
         self.log_path = log_path
-        self.configure_logger(logger_level=logger_level)
+        self.listener = None
+        self.configure_logger(
+            logger_level=logger_level, console=console, event_log=event_log
+        )
 
     # def set_name(self):
     #     pass
-    def configure_logger(self, logger_level="INFO"):
+    def configure_logger(self, logger_level="INFO", console="full", event_log=True):
         if logger_level == "DEBUG":
             logger_level = logging.DEBUG
         elif logger_level == "INFO":
@@ -96,9 +164,38 @@ class ExperimentLogger(logging.Logger):
         file_handler.setLevel(logger_level)
         file_handler.setFormatter(formatter)
 
-        self.addHandler(file_handler)
-
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
-        self.addHandler(console_handler)
+        if console == "progress":
+            console_handler.addFilter(
+                lambda record: record.levelno >= logging.WARNING
+                or getattr(record, "progress", False)
+            )
+        elif console != "full":
+            raise ValueError(
+                f"Unknown console mode {console!r}, expected 'full' or 'progress'"
+            )
+
+        handlers = [file_handler, console_handler]
+        if event_log:
+            event_handler = EventFileHandler(self.log_path + "events.jsonl")
+            event_handler.setLevel(logger_level)
+            handlers.append(event_handler)
+
+        # nothing below the lowest handler level is formatted nor queued
+        self.setLevel(min(logger_level, logging.INFO))
+        log_queue = queue.SimpleQueue()
+        self.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.close)
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            for handler in self.handlers:
+                self.removeHandler(handler)